@@ -1,22 +1,77 @@
-from fastapi import APIRouter
-from pydantic import BaseModel, EmailStr
+import asyncio
+import contextvars
+import json
+import logging
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import resend
+from fastapi import APIRouter, Header, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
+from starlette.datastructures import UploadFile
+from pydantic import AfterValidator, AwareDatetime, BaseModel, EmailStr, Field, TypeAdapter, ValidationError, model_validator
 
-from typing import Optional, List
+from app.libs.attachments import attachment_store
+from app.libs.email_client import BATCH_LIMIT, PartialBatchError
+from app.libs.email_queue import EmailJob, JobStatus, email_queue
+from app.libs.email_templates import render
+from app.libs.deadline import deadline
+from app.libs.email_transports import circuit_breakers, get_transport
+from app.libs.idempotency import IdempotencyKeyReused, SubmissionKey, submissions
+from app.libs.json_stream import JSONStreamReader, ValueTooLarge
+from databutton_app.mw.rate_limit_mw import check_recipient_rate
+
+from typing import Annotated, Optional, List
 
 # Create router
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# Scheduled sends may be at most this far ahead
+MAX_SCHEDULE_DAYS = float(os.environ.get("EMAIL_MAX_SCHEDULE_DAYS", "90"))
+
+def _single_line(value: str) -> str:
+    if "\r" in value or "\n" in value:
+        raise ValueError("Must not contain line breaks")
+    return value
+
+# Goes into an email header, where a line break would inject further headers
+HeaderStr = Annotated[str, AfterValidator(_single_line)]
 
 # Pydantic models for API requests
+class ScheduledSend(BaseModel):
+    """
+    Optional delivery time, either `send_at` with a UTC offset (so drips can
+    follow the recipient's time zone) or `delay` in seconds from now.
+    """
+    send_at: Optional[AwareDatetime] = None
+    delay: Optional[float] = Field(None, ge=0)
+    
+    @model_validator(mode="after")
+    def _check_schedule(self):
+        if self.send_at is not None and self.delay is not None:
+            raise ValueError("Give either send_at or delay, not both")
+        due = self.due_at()
+        if due is not None and due > time.time() + MAX_SCHEDULE_DAYS * 86400:
+            raise ValueError(f"Emails can be scheduled at most {MAX_SCHEDULE_DAYS:g} days ahead")
+        return self
+    
+    def due_at(self) -> Optional[float]:
+        """Unix time to send at, None to send right away."""
+        if self.send_at is not None:
+            return self.send_at.timestamp()
+        if self.delay:
+            return time.time() + self.delay
+        return None
+
 class ContactFormRequest(BaseModel):
     name: str
     email: EmailStr
-    subject: str
+    subject: HeaderStr
     message: str
 
-class WelcomeEmailRequest(BaseModel):
+class WelcomeEmailRequest(ScheduledSend):
     name: str
     email: EmailStr
 
@@ -24,86 +79,86 @@ class EmailResponse(BaseModel):
     success: bool
     message: str
     email_id: Optional[str] = None
+    job_id: Optional[str] = None
+    scheduled_at: Optional[datetime] = None
 
 class RecipientEmail(BaseModel):
     email: EmailStr
     name: Optional[str] = None
 
-class GenericEmailRequest(BaseModel):
-    from_email: str = "support@loufranktv.com"
-    from_name: str = "LouFrank TV Support"
+class GenericEmailRequest(ScheduledSend):
+    from_email: HeaderStr = "support@loufranktv.com"
+    from_name: HeaderStr = "LouFrank TV Support"
     to: List[RecipientEmail]
-    subject: str
+    subject: HeaderStr
     html_content: str
     text_content: Optional[str] = None
-    reply_to: Optional[str] = None
+    reply_to: Optional[HeaderStr] = None
+
+class RecipientResult(BaseModel):
+    email: str
+    success: bool
+    email_id: Optional[str] = None
+    error: Optional[str] = None
+
+class BatchEmailResponse(BaseModel):
+    success: bool
+    message: str
+    sent: int = 0
+    failed: int = 0
+    results: List[RecipientResult] = []
+
+class ProviderStatus(BaseModel):
+    provider: str
+    state: str
+    consecutive_failures: int
+    retry_after: float
 
 class TrialRequestRequest(BaseModel):
     name: str
     email: EmailStr
     phone: Optional[str] = None
 
-@router.post("/contact", response_model=EmailResponse)
-def send_contact_form(request: ContactFormRequest):
+async def _run_once(key: SubmissionKey, handler) -> EmailResponse:
+    """Run a submission once per key, 422 when the key comes with a different request."""
+    try:
+        return await submissions.run(key, handler)
+    except IdempotencyKeyReused as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+@router.post("/contact", response_model=EmailResponse, status_code=202)
+async def send_contact_form(
+    request: ContactFormRequest,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+):
     """
     Send a contact form submission email to the support team.
+    
+    Repeats of the same submission (same Idempotency-Key header, or the same
+    content when no key is sent) return the original response, reusing an
+    Idempotency-Key for different content is rejected with 422.
     """
+    key = submissions.key("contact", request, idempotency_key)
+    return await _run_once(key, lambda: _send_contact_form(request))
+
+async def _send_contact_form(request: ContactFormRequest) -> EmailResponse:
     try:
-        # Initialize Resend with API key
-        api_key = os.environ.get("RESEND_API_KEY")
-        if not api_key:
+        # Shared email transport, built at app startup
+        if not get_transport().configured:
             return EmailResponse(
                 success=False,
                 message="Email service not configured. Please contact us directly.",
                 email_id=None
             )
         
-        # Set Resend API key
-        resend.api_key = api_key
-        
         # Prepare email content with premium styling and logo
-        html_content = f"""
-        <html>
-            <head>
-                <meta name="viewport" content="width=device-width, initial-scale=1.0">
-                <style>
-                    body {{ font-family: 'Arial', sans-serif; line-height: 1.6; margin: 0; padding: 0; background-color: #f9f9f9; }}
-                    .container {{ max-width: 600px; margin: 0 auto; background-color: #ffffff; border-radius: 8px; overflow: hidden; box-shadow: 0 0 20px rgba(0, 0, 0, 0.1); }}
-                    .header {{ background: #17d1e0; padding: 20px; text-align: center; }}
-                    .logo {{ height: 70px; width: auto; }}
-                    .content {{ padding: 30px; color: #333333; font-size: 16px; }}
-                    .footer {{ background-color: #f0f0f0; padding: 20px; text-align: center; font-size: 14px; color: #555555; border-top: 1px solid #e0e0e0; }}
-                    h1, h2 {{ color: #222222; margin-top: 0; font-weight: bold; font-size: 24px; }}
-                    h1 {{ font-size: 28px; letter-spacing: 0.5px; }}
-                    p {{ margin-bottom: 16px; color: #333333; }}
-                    strong {{ color: #0891b2; font-weight: bold; }}
-                    .highlight {{ color: #0891b2; font-weight: bold; }}
-                    .divider {{ height: 2px; background: linear-gradient(to right, #ffffff, #17d1e0, #ffffff); margin: 20px 0; }}
-                    ul {{ padding-left: 20px; margin: 20px 0; }}
-                    li {{ margin-bottom: 10px; padding-left: 5px; color: #333333; }}
-                </style>
-            </head>
-            <body>
-                <div class="container">
-                    <div class="header">
-                        <img class="logo" src="https://loufranktv.com/public/901661ac-f28e-4815-8069-61ae5363a100/logo-color.png" alt="LouFrank TV Logo">
-                    </div>
-                    <div class="content">
-                        <h2>New Contact Form Submission</h2>
-                        <div class="divider"></div>
-                        <p><strong>From:</strong> {request.name} ({request.email})</p>
-                        <p><strong>Subject:</strong> {request.subject}</p>
-                        <p><strong>Message:</strong></p>
-                        <p>{request.message}</p>
-                    </div>
-                    <div class="footer">
-                        <p>© {datetime.now().year} LouFrank TV. All rights reserved.</p>
-                        <p>Premium IPTV Service | 16,000+ Channels | Global Coverage</p>
-                    </div>
-                </div>
-            </body>
-        </html>
-        """
+        html_content = render(
+            "contact",
+            name=request.name,
+            email=request.email,
+            subject=request.subject,
+            message=request.message
+        )
         
         # Send email
         params = {
@@ -114,121 +169,44 @@ def send_contact_form(request: ContactFormRequest):
             "reply_to": request.email
         }
         
-        response = resend.Emails.send(params)
+        job = await email_queue.asubmit("contact", params)
         
         return EmailResponse(
             success=True,
             message="Contact form submitted successfully",
-            email_id=response.get("id")
+            job_id=job.job_id
         )
     
     except Exception as e:
-        print(f"Error sending contact email: {str(e)}")
+        logger.exception("Error sending contact email")
         return EmailResponse(
             success=False,
             message=f"Failed to send email: {str(e)}",
             email_id=None
         )
 
-@router.post("/welcome", response_model=EmailResponse)
-def send_welcome_email(request: WelcomeEmailRequest):
+@router.post("/welcome", response_model=EmailResponse, status_code=202)
+async def send_welcome_email(request: WelcomeEmailRequest):
     """
-    Send a welcome email to a newly registered user.
+    Send a welcome email to a newly registered user, now or at `send_at` /
+    after `delay`.
     """
+    check_recipient_rate(request.email)
+    
     try:
-        # Initialize Resend with API key
-        api_key = os.environ.get("RESEND_API_KEY")
-        if not api_key:
+        # Shared email transport, built at app startup
+        if not get_transport().configured:
             return EmailResponse(
                 success=False,
                 message="Email service not configured",
                 email_id=None
             )
         
-        # Set Resend API key
-        resend.api_key = api_key
-        
         # Prepare email content with premium styling and logo
-        html_content = f"""
-        <html>
-            <head>
-                <meta name="viewport" content="width=device-width, initial-scale=1.0">
-                <style>
-                    body {{ font-family: 'Arial', sans-serif; line-height: 1.6; color: #e2e8f0; margin: 0; padding: 0; background-color: #0f0f0f; }}
-                    .container {{ max-width: 600px; margin: 0 auto; background-color: #0a0a0a; border-radius: 8px; overflow: hidden; }}
-                    .header {{ background: linear-gradient(135deg, #000000, #1a1a1a); padding: 20px; text-align: center; border-bottom: 1px solid #333; }}
-                    .logo {{ height: 60px; width: auto; }}
-                    .content {{ padding: 30px; }}
-                    .footer {{ background-color: #0a0a0a; padding: 20px; text-align: center; font-size: 12px; color: #6c7280; border-top: 1px solid #333; }}
-                    h1, h2 {{ color: #ffffff; margin-top: 0; }}
-                    .highlight {{ color: #17d1e0; }}
-                    .divider {{ height: 1px; background: linear-gradient(to right, transparent, #333, transparent); margin: 20px 0; }}
-                    .button {{ background: #17d1e0; color: #ffffff; text-decoration: none; padding: 14px 30px; border-radius: 5px; font-weight: bold; display: inline-block; margin: 25px 0; font-size: 16px; box-shadow: 0 2px 5px rgba(0, 0, 0, 0.1); }}
-                    .button:hover {{ background: #0891b2; }}
-                    a {{ color: #0891b2; text-decoration: underline; font-weight: bold; }}
-                    a:hover {{ color: #066a82; }}
-                </style>
-            </head>
-            <body>
-                <div class="container">
-                    <div class="header">
-                        <img class="logo" src="https://loufranktv.com/public/901661ac-f28e-4815-8069-61ae5363a100/logo-color.png" alt="LouFrank TV Logo">
-                    </div>
-                    <div class="content">
-                        <h1>Welcome to <span class="highlight">LouFrank TV</span>!</h1>
-                        <div class="divider"></div>
-                        
-                        <p>Hello {request.name},</p>
-                        <p>Thank you for joining LouFrank TV! We're excited to have you as part of our community of premium entertainment enthusiasts.</p>
-                        
-                        <p>With your new account, you now have access to:</p>
-                        <ul>
-                            <li>Over <strong>16,000 HD and FHD channels</strong> from more than 50 countries</li>
-                            <li>Thousands of <strong>on-demand movies and TV series</strong></li>
-                            <li><strong>Ultra-fast zapping</strong> with no freezing</li>
-                            <li><strong>Global access</strong> from any device</li>
-                        </ul>
-                        
-                        <div style="text-align: center;">
-                            <a href="https://loufranktv.com/setup-guides" class="button">Set Up Your Devices</a>
-                        </div>
-                        
-                        <p>If you have any questions or need assistance, don't hesitate to contact our support team at <a href="mailto:support@loufranktv.com" style="color: #17d1e0;">support@loufranktv.com</a>.</p>
-                        
-                        <p>Enjoy the premium experience!</p>
-                        <p>The LouFrank TV Team</p>
-                    </div>
-                    <div class="footer">
-                        <p>© {datetime.now().year} LouFrank TV. All rights reserved.</p>
-                        <p>Premium IPTV Service | 16,000+ Channels | Global Coverage</p>
-                    </div>
-                </div>
-            </body>
-        </html>
-        """
+        html_content = render("welcome", name=request.name)
         
         # Plain text version
-        text_content = f"""
-        Welcome to LouFrank TV!
-        
-        Hello {request.name},
-        
-        Thank you for joining LouFrank TV! We're excited to have you as part of our community of premium entertainment enthusiasts.
-        
-        With your new account, you now have access to:
-        - Over 16,000 HD and FHD channels from more than 50 countries
-        - Thousands of on-demand movies and TV series
-        - Ultra-fast zapping with no freezing
-        - Global access from any device
-        
-        Set up your devices: https://loufranktv.com/setup
-        
-        If you have any questions or need assistance, don't hesitate to contact our support team at support@loufranktv.com.
-        
-        Enjoy the premium experience!
-        
-        The LouFrank TV Team
-        """
+        text_content = render("welcome_text", name=request.name)
         
         # Send email
         params = {
@@ -239,94 +217,54 @@ def send_welcome_email(request: WelcomeEmailRequest):
             "text": text_content
         }
         
-        response = resend.Emails.send(params)
+        job = await email_queue.asubmit("welcome", params, send_at=request.due_at())
         
         return EmailResponse(
             success=True,
-            message="Welcome email sent successfully",
-            email_id=response.get("id")
+            message="Welcome email scheduled" if job.scheduled_at else "Welcome email queued for delivery",
+            job_id=job.job_id,
+            scheduled_at=job.scheduled_at
         )
     
     except Exception as e:
-        print(f"Error sending welcome email: {str(e)}")
+        logger.exception("Error sending welcome email")
         return EmailResponse(
             success=False,
             message=f"Failed to send welcome email: {str(e)}",
             email_id=None
         )
 
-@router.post("/trial-request", response_model=EmailResponse)
-def send_trial_request(request: TrialRequestRequest):
+@router.post("/trial-request", response_model=EmailResponse, status_code=202)
+async def send_trial_request(
+    request: TrialRequestRequest,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+):
     """
     Send a trial request email to the support team.
+    
+    Repeats of the same submission (same Idempotency-Key header, or the same
+    content when no key is sent) return the original response, reusing an
+    Idempotency-Key for different content is rejected with 422.
     """
+    key = submissions.key("trial-request", request, idempotency_key)
+    return await _run_once(key, lambda: _send_trial_request(request))
+
+async def _send_trial_request(request: TrialRequestRequest) -> EmailResponse:
     try:
-        # Initialize Resend with API key from environment variable
-        api_key = os.environ.get("RESEND_API_KEY")
-        if not api_key:
+        # Shared email transport, built at app startup
+        if not get_transport().configured:
             return EmailResponse(
                 success=False,
                 message="Email service not configured. Please contact us directly.",
                 email_id=None
             )
-        resend.api_key = api_key
         # Compose a robust HTML body for the trial request email
-        html_body = f"""
-        <!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Strict//EN" "http://www.w3.org/TR/xhtml1/DTD/xhtml1-strict.dtd">
-        <html xmlns="http://www.w3.org/1999/xhtml">
-        <head>
-            <meta http-equiv="Content-Type" content="text/html; charset=utf-8" />
-            <meta name="viewport" content="width=device-width, initial-scale=1.0"/>
-            <title>New Trial Request for Lou Frank TV</title>
-            <style type="text/css">
-                body, table, td, a {{ -webkit-text-size-adjust: 100%; -ms-text-size-adjust: 100%; }}
-                table, td {{ mso-table-lspace: 0pt; mso-table-rspace: 0pt; }}
-                img {{ -ms-interpolation-mode: bicubic; }}
-                body {{ margin: 0; padding: 0; }}
-                table {{ border-collapse: collapse !important; }}
-                .ExternalClass {{ width: 100%; }}
-                .ExternalClass, .ExternalClass p, .ExternalClass span, .ExternalClass font, .ExternalClass td, .ExternalClass div {{ line-height: 100%; }}
-                .apple-link a {{ color: inherit !important; text-decoration: none !important; }}
-                .btn-link a {{ color: #ffffff !important; text-decoration: none !important; }}
-                img {{ border: 0; height: auto; line-height: 100%; outline: none; text-decoration: none; display: block; }}
-            </style>
-        </head>
-        <body style="font-family: Arial, sans-serif; line-height: 1.6; margin: 0; padding: 0;">
-            <table width="100%" cellpadding="0" cellspacing="0" border="0" style="background-color: #f4f4f4;">
-                <tr>
-                    <td align="center" style="padding: 20px 0;">
-                        <table width="600" cellpadding="0" cellspacing="0" border="0" style="background-color: #ffffff; border-radius: 8px; overflow: hidden; box-shadow: 0 4px 8px rgba(0,0,0,0.1);">
-                            <tr>
-                                <td align="center" style="padding: 20px 0;">
-                                    <a href="https://www.loufranktv.com" target="_blank" style="text-decoration: none;">
-                                        <img src="https://www.loufranktv.com/logo-loufrank-crew.png" alt="Lou Frank TV Logo" style="display: block; width:200px; max-width:100%; height:auto; margin: 0 auto;" />
-                                    </a>
-                                </td>
-                            </tr>
-                            <tr>
-                                <td style="padding: 0 30px 20px 30px;">
-                                    <p style="font-size: 16px; color: #333333;">Hello Owner,</p>
-                                    <p style="font-size: 16px; color: #333333;">Someone requested a free trial:</p>
-                                    <ul style="font-size: 16px; color: #333333; list-style-type: none; padding: 0;">
-                                        <li style="margin-bottom: 10px;"><strong>Name:</strong> {request.name}</li>
-                                        <li style="margin-bottom: 10px;"><strong>Email:</strong> {request.email}</li>
-                                        {f'<li style="margin-bottom: 10px;"><strong>Phone:</strong> {request.phone}</li>' if request.phone else ''}
-                                    </ul>
-                                    <p style="font-size: 16px; color: #333333;">Please follow up as soon as possible.</p>
-                                </td>
-                            </tr>
-                            <tr>
-                                <td align="center" style="padding: 20px; font-size: 12px; color: #999999; background-color: #eeeeee;">
-                                    <p>&copy; {datetime.now().year} Lou Frank TV. All rights reserved.</p>
-                                </td>
-                            </tr>
-                        </table>
-                    </td>
-                </tr>
-            </table>
-        </body>
-        </html>
-        """
+        html_body = render(
+            "trial_request",
+            name=request.name,
+            email=request.email,
+            phone_row=render("trial_request_phone", phone=request.phone) if request.phone else ""
+        )
         params = {
             "from": "LouFrank TV Trial Requests <trials@loufranktv.com>",
             "to": ["loufranktv@gmail.com"],
@@ -334,107 +272,403 @@ def send_trial_request(request: TrialRequestRequest):
             "html": html_body,
             "reply_to": request.email
         }
-        response = resend.Emails.send(params)
+        job = await email_queue.asubmit("trial-request", params)
         return EmailResponse(
             success=True,
             message="Trial request submitted successfully",
-            email_id=response.get("id")
+            job_id=job.job_id
         )
     
     except Exception as e:
-        print(f"Error sending trial request email: {str(e)}")
+        logger.exception("Error sending trial request email")
         return EmailResponse(
             success=False,
             message=f"Failed to send email: {str(e)}",
             email_id=None
         )
 
-@router.post("/send", response_model=EmailResponse)
-def send_generic_email(request: GenericEmailRequest):
+def _generic_params(request: GenericEmailRequest, attachments: Optional[List[dict]] = None) -> dict:
+    """
+    Build provider params shared by every recipient of a generic email.
+    
+    Attachments are references into the attachment store, resolved to their
+    content when the email is sent.
     """
-    Send a generic email with custom content.
+    # If html_content doesn't contain our templated container, wrap it in our premium template
+    if "<div class=\"container\">" not in request.html_content:
+        html_to_send = render("generic_wrapper", html_content=request.html_content)
+    else:
+        html_to_send = request.html_content
+        
+    params = {
+        "from": f"{request.from_name} <{request.from_email}>",
+        "subject": request.subject,
+        "html": html_to_send,
+    }
+    
+    # Add optional parameters if provided
+    if request.text_content:
+        params["text"] = request.text_content
+        
+    if request.reply_to:
+        params["reply_to"] = request.reply_to
+    
+    if attachments:
+        params["attachments"] = attachments
+    
+    return params
+
+# Caps on generic emails, enforced while the body streams in
+MAX_CONTENT_CHARS = int(os.environ.get("EMAIL_MAX_CONTENT_CHARS", str(512 * 1024)))
+SEND_MAX_RECIPIENTS = int(os.environ.get("EMAIL_MAX_RECIPIENTS", "50"))
+BATCH_MAX_RECIPIENTS = int(os.environ.get("EMAIL_BATCH_MAX_RECIPIENTS", "10000"))
+
+# Caps on multipart uploads, uploads over 1 MiB are spooled to temp files while parsing
+MAX_ATTACHMENTS = int(os.environ.get("EMAIL_MAX_ATTACHMENTS", "10"))
+MAX_ATTACHMENT_BYTES = int(os.environ.get("EMAIL_MAX_ATTACHMENT_BYTES", str(10 * 1024 * 1024)))
+MAX_PAYLOAD_BYTES = int(os.environ.get("EMAIL_MAX_PAYLOAD_BYTES", str(4 * 1024 * 1024)))
+
+_recipient = TypeAdapter(RecipientEmail)
+
+def _validation_error(error: ValidationError, *loc) -> RequestValidationError:
+    return RequestValidationError(
+        [{**e, "loc": ("body", *loc, *e["loc"])} for e in error.errors(include_url=False)]
+    )
+
+def _inline_schema(node, defs: dict):
+    if isinstance(node, dict):
+        if "$ref" in node:
+            return _inline_schema(defs[node["$ref"].rsplit("/", 1)[1]], defs)
+        return {key: _inline_schema(value, defs) for key, value in node.items()}
+    if isinstance(node, list):
+        return [_inline_schema(value, defs) for value in node]
+    return node
+
+_generic_schema = GenericEmailRequest.model_json_schema()
+_generic_schema = _inline_schema(_generic_schema, _generic_schema.pop("$defs", {}))
+# Documents the body of endpoints that parse GenericEmailRequest from the stream,
+# as JSON or as a multipart form with the JSON in `payload` plus attachment files
+GENERIC_EMAIL_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {"schema": _generic_schema},
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["payload"],
+                    "properties": {
+                        "payload": {
+                            "type": "string",
+                            "contentMediaType": "application/json",
+                            "description": "The email as JSON, in the application/json body format",
+                        },
+                        "attachments": {
+                            "type": "array",
+                            "items": {"type": "string", "format": "binary"},
+                            "maxItems": MAX_ATTACHMENTS,
+                        },
+                    },
+                }
+            },
+        },
+    }
+}
+
+async def read_generic_email(
+    http_request: Request, max_recipients: int
+) -> tuple[GenericEmailRequest, List[str], List[dict]]:
     """
+    Parse a GenericEmailRequest body as it streams in.
+    
+    Recipients are validated one at a time and only their addresses are kept,
+    so the returned request has an empty `to` and the addresses come separately.
+    A recipient over `max_recipients` or content over MAX_CONTENT_CHARS is
+    rejected with 413 without reading the rest of the body.
+    
+    A multipart form body carries the JSON in its `payload` field and files in
+    `attachments`, which are stored in the attachment store and returned as
+    references.
+    """
+    if http_request.headers.get("content-type", "").startswith("multipart/form-data"):
+        return await _read_generic_form(http_request, max_recipients)
+    request, recipients = await _parse_generic_email(http_request.stream(), max_recipients)
+    return request, recipients, []
+
+async def _read_generic_form(
+    http_request: Request, max_recipients: int
+) -> tuple[GenericEmailRequest, List[str], List[dict]]:
+    async with http_request.form(max_files=MAX_ATTACHMENTS, max_part_size=MAX_PAYLOAD_BYTES) as form:
+        payload = form.get("payload")
+        if not isinstance(payload, str):
+            raise RequestValidationError([{
+                "type": "missing",
+                "loc": ("body", "payload"),
+                "msg": "Field required",
+                "input": None,
+            }])
+        
+        async def chunks():
+            yield payload.encode()
+        
+        request, recipients = await _parse_generic_email(chunks(), max_recipients)
+        attachments = []
+        for upload in form.getlist("attachments"):
+            if not isinstance(upload, UploadFile):
+                raise RequestValidationError([{
+                    "type": "value_error",
+                    "loc": ("body", "attachments", len(attachments)),
+                    "msg": "Expected a file upload",
+                    "input": upload,
+                }])
+            if upload.size is not None and upload.size > MAX_ATTACHMENT_BYTES:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"Attachment {upload.filename} larger than {MAX_ATTACHMENT_BYTES} bytes",
+                )
+            # Hashing and encoding read the spooled file, off the event loop
+            attachments.append(await run_in_threadpool(
+                attachment_store.put, upload.file, upload.filename, upload.content_type
+            ))
+    return request, recipients, attachments
+
+async def _parse_generic_email(chunks, max_recipients: int) -> tuple[GenericEmailRequest, List[str]]:
+    reader = JSONStreamReader(chunks)
+    fields = {}
+    recipients: List[str] = []
+    try:
+        async for key in reader.fields():
+            if key != "to" or await reader.peek() != "[":
+                fields[key] = await reader.read_value(max_string=MAX_CONTENT_CHARS)
+                continue
+            fields["to"] = []
+            async for item in reader.iter_array(max_string=MAX_CONTENT_CHARS):
+                if len(recipients) >= max_recipients:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"Too many recipients, at most {max_recipients} are allowed",
+                    )
+                try:
+                    recipients.append(_recipient.validate_python(item).email)
+                except ValidationError as e:
+                    raise _validation_error(e, "to", len(recipients))
+        await reader.finish()
+    except ValueTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except json.JSONDecodeError as e:
+        raise RequestValidationError([{
+            "type": "json_invalid",
+            "loc": ("body", e.pos),
+            "msg": "JSON decode error",
+            "input": {},
+            "ctx": {"error": e.msg},
+        }])
+    
+    try:
+        request = GenericEmailRequest.model_validate(fields)
+    except ValidationError as e:
+        raise _validation_error(e)
+    return request, recipients
+
+@router.post(
+    "/send",
+    response_model=EmailResponse,
+    status_code=202,
+    openapi_extra=GENERIC_EMAIL_BODY,
+)
+async def send_generic_email(http_request: Request):
+    """
+    Send a generic email with custom content, now or at `send_at` / after
+    `delay`. A scheduled email can be cancelled with DELETE /jobs/{job_id}.
+    
+    Attachments such as invoices are uploaded as a multipart form, see
+    `read_generic_email`.
+    """
+    request, to_emails, attachments = await read_generic_email(http_request, SEND_MAX_RECIPIENTS)
+    return await _send_generic_email(request, to_emails, attachments)
+
+async def _send_generic_email(
+    request: GenericEmailRequest, to_emails: List[str], attachments: List[dict]
+) -> EmailResponse:
+    check_recipient_rate(*to_emails)
+    
     try:
-        # Initialize Resend with API key
-        api_key = os.environ.get("RESEND_API_KEY")
-        if not api_key:
+        # Shared email transport, built at app startup
+        if not get_transport().configured:
             return EmailResponse(
                 success=False,
                 message="Email service not configured",
                 email_id=None
             )
         
-        # Set Resend API key
-        resend.api_key = api_key
-        
-        # Prepare recipients list
-        to_emails = [recipient.email for recipient in request.to]
-        
-        # If html_content doesn't contain our templated container, wrap it in our premium template
-        if "<div class=\"container\">" not in request.html_content:
-            wrapped_html = f"""
-            <html>
-                <head>
-                    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-                    <style>
-                        body {{ font-family: 'Arial', sans-serif; line-height: 1.6; color: #e2e8f0; margin: 0; padding: 0; background-color: #0f0f0f; }}
-                        .container {{ max-width: 600px; margin: 0 auto; background-color: #0a0a0a; border-radius: 8px; overflow: hidden; }}
-                        .header {{ background: linear-gradient(135deg, #000000, #1a1a1a); padding: 20px; text-align: center; border-bottom: 1px solid #333; }}
-                        .logo {{ height: 60px; width: auto; }}
-                        .content {{ padding: 30px; }}
-                        .footer {{ background-color: #0a0a0a; padding: 20px; text-align: center; font-size: 12px; color: #6c7280; border-top: 1px solid #333; }}
-                        h1, h2 {{ color: #ffffff; margin-top: 0; }}
-                        .highlight {{ color: #17d1e0; }}
-                        .divider {{ height: 1px; background: linear-gradient(to right, transparent, #333, transparent); margin: 20px 0; }}
-                    </style>
-                </head>
-                <body>
-                    <div class="container">
-                        <div class="header">
-                            <img class="logo" src="https://loufranktv.com/public/901661ac-f28e-4815-8069-61ae5363a100/logo-color.png" alt="LouFrank TV Logo">
-                        </div>
-                        <div class="content">
-                            {request.html_content}
-                        </div>
-                        <div class="footer">
-                            <p>© {datetime.now().year} LouFrank TV. All rights reserved.</p>
-                            <p>Premium IPTV Service | 16,000+ Channels | Global Coverage</p>
-                        </div>
-                    </div>
-                </body>
-            </html>
-            """
-            html_to_send = wrapped_html
-        else:
-            html_to_send = request.html_content
-            
         # Send email
-        params = {
-            "from": f"{request.from_name} <{request.from_email}>",
-            "to": to_emails,
-            "subject": request.subject,
-            "html": html_to_send,
-        }
-        
-        # Add optional parameters if provided
-        if request.text_content:
-            params["text"] = request.text_content
-            
-        if request.reply_to:
-            params["reply_to"] = request.reply_to
+        params = _generic_params(request, attachments)
+        params["to"] = to_emails
         
-        response = resend.Emails.send(params)
+        job = await email_queue.asubmit("send", params, send_at=request.due_at())
         
         return EmailResponse(
             success=True,
-            message="Email sent successfully",
-            email_id=response.get("id")
+            message="Email scheduled" if job.scheduled_at else "Email queued for delivery",
+            job_id=job.job_id,
+            scheduled_at=job.scheduled_at
         )
     
     except Exception as e:
-        print(f"Error sending email: {str(e)}")
+        logger.exception("Error sending email")
         return EmailResponse(
             success=False,
             message=f"Failed to send email: {str(e)}",
             email_id=None
         )
+
+# Recipients per provider batch call and number of batch calls in flight
+BATCH_SIZE = min(int(os.environ.get("EMAIL_BATCH_SIZE", str(BATCH_LIMIT))), BATCH_LIMIT)
+BATCH_CONCURRENCY = int(os.environ.get("EMAIL_BATCH_CONCURRENCY", "4"))
+# Seconds all provider calls of one batch request may take together
+BATCH_DEADLINE = float(os.environ.get("EMAIL_BATCH_DEADLINE", "30"))
+# Provider calls block, they get their own threads rather than the shared
+# threadpool so a slow provider can't starve other endpoints
+_provider_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("EMAIL_PROVIDER_THREADS", "16")),
+    thread_name_prefix="email-provider",
+)
+
+@router.post(
+    "/send-batch",
+    response_model=BatchEmailResponse,
+    openapi_extra=GENERIC_EMAIL_BODY,
+)
+async def send_batch_email(http_request: Request):
+    """
+    Send a generic email individually to every recipient through the provider's
+    batch API, so recipients don't see each other and fail independently.
+    
+    While the provider's circuit breaker is open this fails straight away, and
+    provider calls stop once EMAIL_BATCH_DEADLINE seconds have been spent, the
+    recipients not reached by then are reported as failed.
+    """
+    request, recipients, attachments = await read_generic_email(http_request, BATCH_MAX_RECIPIENTS)
+    if request.due_at() is not None:
+        raise RequestValidationError([{
+            "type": "value_error",
+            "loc": ("body", "send_at" if request.send_at is not None else "delay"),
+            "msg": "Batch sends can't be scheduled, schedule them through /send",
+            "input": None,
+        }])
+    transport = get_transport()
+    if not transport.configured:
+        return BatchEmailResponse(
+            success=False,
+            message="Email service not configured"
+        )
+    if not transport.available:
+        return BatchEmailResponse(
+            success=False,
+            message="Email service temporarily unavailable, please try again later"
+        )
+    
+    # All or nothing, like /send, a batch can't go around the per-recipient limit
+    check_recipient_rate(*recipients)
+    
+    # Attachment content is loaded once and shared by every recipient's email
+    base_params = await run_in_threadpool(
+        attachment_store.resolve, _generic_params(request, attachments)
+    )
+    chunks = [
+        recipients[i:i + BATCH_SIZE]
+        for i in range(0, len(recipients), BATCH_SIZE)
+    ]
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    
+    async def send_chunk(chunk: List[str]) -> List[RecipientResult]:
+        emails = [{**base_params, "to": [email]} for email in chunk]
+        async with semaphore:
+            try:
+                # Run in a copy of the context so the deadline applies in the thread
+                data = await asyncio.get_running_loop().run_in_executor(
+                    _provider_executor,
+                    contextvars.copy_context().run,
+                    transport.send_batch,
+                    emails,
+                )
+            except PartialBatchError as e:
+                # The emails already sent keep their results, the rest failed
+                logger.error("Batch of %d emails stopped partway: %s", len(chunk), e)
+                data = [item or {"error": str(e)} for item in e.results]
+            except Exception as e:
+                logger.error("Error sending batch of %d emails: %s", len(chunk), e)
+                return [
+                    RecipientResult(email=email, success=False, error=str(e))
+                    for email in chunk
+                ]
+        if len(data) != len(chunk):
+            logger.error("Provider returned %d results for a batch of %d emails", len(data), len(chunk))
+        # A recipient without a result can't be reported as sent
+        missing = {"error": "No result from the email provider"}
+        data = [item or missing for item in data[:len(chunk)]]
+        data += [missing] * (len(chunk) - len(data))
+        return [
+            RecipientResult(
+                email=email,
+                success="error" not in item,
+                email_id=item.get("id"),
+                error=item.get("error"),
+            )
+            for email, item in zip(chunk, data)
+        ]
+    
+    # Tasks copy the context, so every chunk shares the one budget
+    with deadline(BATCH_DEADLINE):
+        chunk_results = await asyncio.gather(*(send_chunk(chunk) for chunk in chunks))
+    results = [result for chunk in chunk_results for result in chunk]
+    sent = sum(1 for result in results if result.success)
+    failed = len(results) - sent
+    
+    return BatchEmailResponse(
+        success=failed == 0,
+        message=f"Sent {sent} of {len(results)} emails in {len(chunks)} batches",
+        sent=sent,
+        failed=failed,
+        results=results
+    )
+
+@router.get("/jobs/{job_id}", response_model=EmailJob)
+def get_email_job(job_id: str):
+    """
+    Look up the delivery status of a queued email.
+    """
+    job = email_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Email job not found")
+    return job
+
+@router.get("/provider-status", response_model=List[ProviderStatus])
+def get_provider_status():
+    """
+    Circuit breaker state of each email provider, for monitoring.
+    """
+    return [
+        ProviderStatus(
+            provider=breaker.name,
+            state=breaker.state.value,
+            consecutive_failures=breaker.failures,
+            retry_after=round(breaker.retry_after(), 3),
+        )
+        for breaker in circuit_breakers()
+    ]
+
+@router.delete("/jobs/{job_id}", response_model=EmailJob)
+def cancel_email_job(job_id: str):
+    """
+    Cancel a scheduled or queued email that hasn't been handed to the provider yet.
+    """
+    job = email_queue.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Email job not found")
+    if job.status != JobStatus.CANCELLED:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Email job is {job.status.value} and can no longer be cancelled",
+        )
+    return job
@@ -1,57 +1,237 @@
-from fastapi import APIRouter, Response
-from datetime import date
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from datetime import date, datetime, time, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Iterator, NamedTuple
+import gzip
+import hashlib
+import os
+import zlib
+
+from app.libs.page_registry import PageRegistry
 
 router = APIRouter()
 
-@router.get("/robots.txt")
-def get_robots_txt():
-    """Generate and serve robots.txt file"""
-    content = """User-agent: *
+BASE_URL = "https://loufranktv.com"
+
+# Crawlers may reuse a response for this long before revalidating
+MAX_AGE = 3600
+
+# Define all site pages with their SEO properties: (url, priority, changefreq)
+PAGES = (
+    # Main pages
+    ("/", "1.0", "weekly"),
+    ("/features", "0.8", "monthly"),
+    ("/pricing", "0.9", "monthly"),
+    ("/setup-guides", "0.7", "monthly"),
+    ("/testimonials", "0.6", "monthly"),
+    ("/faq", "0.7", "monthly"),
+    ("/contact", "0.6", "monthly"),
+    ("/about", "0.6", "monthly"),
+
+    # Legal and policy pages
+    ("/privacy-policy", "0.5", "monthly"),
+    ("/terms-of-service", "0.5", "monthly"),
+    ("/refund-policy", "0.5", "monthly"),
+    ("/dmca", "0.4", "monthly"),
+)
+
+
+class CachedDocument(NamedTuple):
+    """A fully rendered response body with its gzip variant and validators."""
+    body: bytes
+    gzip_body: bytes
+    etag: str
+    gzip_etag: str
+    last_modified: datetime
+    media_type: str
+
+
+def build_document(content: str, media_type: str, last_modified: datetime) -> CachedDocument:
+    body = content.encode()
+    digest = hashlib.sha256(body).hexdigest()[:32]
+    return CachedDocument(
+        body=body,
+        gzip_body=gzip.compress(body, mtime=0),
+        etag=f'"{digest}"',
+        gzip_etag=f'"{digest}-gzip"',
+        last_modified=last_modified.replace(microsecond=0),
+        media_type=media_type,
+    )
+
+
+def _accepts_gzip(accept_encoding: str) -> bool:
+    for coding in accept_encoding.split(","):
+        name, _, params = coding.strip().partition(";")
+        if name.strip().lower() in ("gzip", "*"):
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
+def _not_modified(request: Request, etags: tuple[str, ...], last_modified: datetime) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or not tags.isdisjoint(etags)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return last_modified <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _cache_headers(etag: str, last_modified: datetime) -> dict[str, str]:
+    return {
+        "Cache-Control": f"public, max-age={MAX_AGE}",
+        "ETag": etag,
+        "Last-Modified": format_datetime(last_modified, usegmt=True),
+        "Vary": "Accept-Encoding",
+    }
+
+
+def serve_document(request: Request, document: CachedDocument) -> Response:
+    """Serve a cached document honouring conditional and gzip request headers."""
+    use_gzip = _accepts_gzip(request.headers.get("accept-encoding", ""))
+    headers = _cache_headers(
+        document.gzip_etag if use_gzip else document.etag, document.last_modified
+    )
+    if _not_modified(request, (document.etag, document.gzip_etag), document.last_modified):
+        return Response(status_code=304, headers=headers)
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=document.gzip_body, media_type=document.media_type, headers=headers)
+    return Response(content=document.body, media_type=document.media_type, headers=headers)
+
+
+ROBOTS_TXT = build_document(
+    """User-agent: *
 Allow: /
 
 Sitemap: https://loufranktv.com/sitemap.xml
+Sitemap: https://loufranktv.com/sitemap-index.xml
 
 Disallow: /api/
-"""
-    return Response(content=content, media_type="text/plain")
+""",
+    media_type="text/plain",
+    last_modified=datetime.now(timezone.utc),
+)
 
-@router.get("/sitemap.xml")
-def get_sitemap_xml():
-    """Generate and serve sitemap.xml file"""
-    base_url = "https://loufranktv.com"
-    today = date.today().isoformat()
-    
-    # Define all site pages with their SEO properties
-    pages = [
-        # Main pages
-        {"url": "/", "lastmod": today, "priority": "1.0", "changefreq": "weekly"},
-        {"url": "/features", "lastmod": today, "priority": "0.8", "changefreq": "monthly"},
-        {"url": "/pricing", "lastmod": today, "priority": "0.9", "changefreq": "monthly"},
-        {"url": "/setup-guides", "lastmod": today, "priority": "0.7", "changefreq": "monthly"},
-        {"url": "/testimonials", "lastmod": today, "priority": "0.6", "changefreq": "monthly"},
-        {"url": "/faq", "lastmod": today, "priority": "0.7", "changefreq": "monthly"},
-        {"url": "/contact", "lastmod": today, "priority": "0.6", "changefreq": "monthly"},
-        {"url": "/about", "lastmod": today, "priority": "0.6", "changefreq": "monthly"},
-        
-        # Legal and policy pages
-        {"url": "/privacy-policy", "lastmod": today, "priority": "0.5", "changefreq": "monthly"},
-        {"url": "/terms-of-service", "lastmod": today, "priority": "0.5", "changefreq": "monthly"},
-        {"url": "/refund-policy", "lastmod": today, "priority": "0.5", "changefreq": "monthly"},
-        {"url": "/dmca", "lastmod": today, "priority": "0.4", "changefreq": "monthly"},
+@router.get("/robots.txt")
+async def get_robots_txt(request: Request):
+    """Serve the precomputed robots.txt file"""
+    return serve_document(request, ROBOTS_TXT)
+
+
+def render_sitemap_xml(pages, lastmod: str) -> str:
+    """Generate the XML sitemap for the given pages"""
+    parts = [
+        '<?xml version="1.0" encoding="UTF-8"?>\n',
+        '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n',
     ]
-    
-    # Generate XML sitemap
-    xml = '<?xml version="1.0" encoding="UTF-8"?>\n'
-    xml += '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
-    
-    for page in pages:
-        xml += '  <url>\n'
-        xml += f'    <loc>{base_url}{page["url"]}</loc>\n'
-        xml += f'    <lastmod>{page["lastmod"]}</lastmod>\n'
-        xml += f'    <changefreq>{page["changefreq"]}</changefreq>\n'
-        xml += f'    <priority>{page["priority"]}</priority>\n'
-        xml += '  </url>\n'
-    
-    xml += '</urlset>'
-    
-    return Response(content=xml, media_type="application/xml")
+    for url, priority, changefreq in pages:
+        parts.append(
+            '  <url>\n'
+            f'    <loc>{BASE_URL}{url}</loc>\n'
+            f'    <lastmod>{lastmod}</lastmod>\n'
+            f'    <changefreq>{changefreq}</changefreq>\n'
+            f'    <priority>{priority}</priority>\n'
+            '  </url>\n'
+        )
+    parts.append('</urlset>')
+    return "".join(parts)
+
+
+# ((date, pages), document) for the last generated sitemap
+_sitemap_cache: tuple[tuple[date, tuple], CachedDocument] | None = None
+
+@router.get("/sitemap.xml")
+async def get_sitemap_xml(request: Request):
+    """Serve sitemap.xml, regenerated only when the date or the page set changes"""
+    global _sitemap_cache
+    today = date.today()
+    key = (today, PAGES)
+    cached = _sitemap_cache
+    if cached is None or cached[0] != key:
+        document = build_document(
+            render_sitemap_xml(PAGES, today.isoformat()),
+            media_type="application/xml",
+            last_modified=datetime.combine(today, time.min, timezone.utc),
+        )
+        cached = _sitemap_cache = (key, document)
+    return serve_document(request, cached[1])
+
+
+# Channel and VOD title pages, fed from the catalogue files in SEO_CATALOGUE
+catalogue = PageRegistry(
+    [path for path in os.environ.get("SEO_CATALOGUE", "").split(",") if path.strip()],
+    state_path=os.environ.get("SEO_CATALOGUE_STATE", "data/sitemap_state.json"),
+    base_url=BASE_URL,
+    max_urls=int(os.environ.get("SITEMAP_MAX_URLS", "50000")),
+)
+
+# ((date, catalogue version), document) for the last generated sitemap index
+_index_cache: tuple[tuple[date, str], CachedDocument] | None = None
+
+@router.get("/sitemap-index.xml")
+def get_sitemap_index(request: Request):
+    """Serve the sitemap index listing sitemap.xml and every catalogue shard"""
+    global _index_cache
+    snapshot = catalogue.snapshot()
+    today = date.today()
+    key = (today, snapshot.version)
+    cached = _index_cache
+    if cached is None or cached[0] != key:
+        parts = [
+            '<?xml version="1.0" encoding="UTF-8"?>\n',
+            '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n',
+            f'  <sitemap>\n    <loc>{BASE_URL}/sitemap.xml</loc>\n'
+            f'    <lastmod>{today.isoformat()}</lastmod>\n  </sitemap>\n',
+        ]
+        for number, shard in enumerate(snapshot.shards, start=1):
+            parts.append(
+                f'  <sitemap>\n    <loc>{BASE_URL}/sitemaps/catalogue-{number}.xml</loc>\n'
+                f'    <lastmod>{shard.lastmod}</lastmod>\n  </sitemap>\n'
+            )
+        parts.append('</sitemapindex>')
+        document = build_document(
+            "".join(parts),
+            media_type="application/xml",
+            last_modified=datetime.combine(today, time.min, timezone.utc),
+        )
+        cached = _index_cache = (key, document)
+    return serve_document(request, cached[1])
+
+
+def _gzip_stream(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+@router.get("/sitemaps/catalogue-{shard}.xml")
+def get_catalogue_sitemap(shard: int, request: Request):
+    """Stream one catalogue sitemap shard without building it in memory"""
+    snapshot = catalogue.snapshot()
+    if not 1 <= shard <= len(snapshot.shards):
+        raise HTTPException(status_code=404, detail="Sitemap not found")
+    info = snapshot.shards[shard - 1]
+    gzip_etag = info.etag[:-1] + '-gzip"'
+    last_modified = datetime.combine(
+        date.fromisoformat(info.lastmod[:10]), time.min, timezone.utc
+    )
+
+    use_gzip = _accepts_gzip(request.headers.get("accept-encoding", ""))
+    headers = _cache_headers(gzip_etag if use_gzip else info.etag, last_modified)
+    if _not_modified(request, (info.etag, gzip_etag), last_modified):
+        return Response(status_code=304, headers=headers)
+
+    body = catalogue.iter_shard(snapshot, shard - 1)
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+        body = _gzip_stream(body)
+    return StreamingResponse(body, media_type="application/xml", headers=headers)
@@ -0,0 +1,174 @@
+"""Content-addressed store of base64-encoded email attachments.
+
+Uploads are hashed and, the first time their content is seen, base64-encoded
+into `<sha256>.b64` under the store's directory, reading and writing fixed-size
+chunks so neither the raw file nor its encoding is held in memory. Queued
+emails carry a small reference (filename, content type, digest) instead of the
+content, so the outbox stays small and an attachment sent to many recipients,
+like the setup guide, is encoded once and shared. `resolve` swaps references
+for the encoded content right before a send, through a bounded in-memory cache.
+
+Usage:
+
+    from app.libs.attachments import attachment_store
+
+    ref = attachment_store.put(upload.file, upload.filename, upload.content_type)
+    params["attachments"] = [ref]
+    ...
+    transport.send(attachment_store.resolve(params))
+    attachment_store.prune(keep=email_queue.attachment_digests())
+"""
+
+import base64
+import hashlib
+import logging
+import mimetypes
+import os
+import tempfile
+import time
+from typing import Any, BinaryIO, Collection
+
+from app.libs.email_client import EmailProviderError
+from app.libs.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Multiple of 3 so the chunk encodings concatenate into one valid base64
+# string, and of 57 so chunks end on a 76 character MIME line
+ENCODE_CHUNK = 57 * 1024
+
+
+class AttachmentMissing(EmailProviderError):
+    def __init__(self, digest: str):
+        super().__init__(f"Attachment {digest} is no longer stored", retryable=False)
+
+
+class AttachmentStore:
+    """Encoded attachments on disk keyed by content digest, recent ones also in memory.
+
+    Files unused for `max_age` seconds are removed by `prune`, except those
+    that emails still waiting in the queue refer to, however far ahead they
+    are scheduled.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        memory_bytes: int = 64 * 1024 * 1024,
+        ttl: float = 3600.0,
+        max_age: float = 7 * 24 * 3600.0,
+    ):
+        self.directory = directory
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._memory: TTLCache[str, str] = TTLCache(
+            maxsize=1024, ttl=ttl, max_bytes=memory_bytes, sizeof=len
+        )
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.directory, f"{digest}.b64")
+
+    def put(self, file: BinaryIO, filename: str | None, content_type: str | None = None) -> dict[str, Any]:
+        """Store the content of `file` unless it is already stored, returns its reference."""
+        digest = hashlib.sha256()
+        size = 0
+        file.seek(0)
+        while chunk := file.read(ENCODE_CHUNK):
+            digest.update(chunk)
+            size += len(chunk)
+        key = digest.hexdigest()
+        path = self._path(key)
+
+        try:
+            # Touch, so pruning counts from the last use
+            os.utime(path)
+            self.hits += 1
+        except FileNotFoundError:
+            self.misses += 1
+            os.makedirs(self.directory, exist_ok=True)
+            file.seek(0)
+            with tempfile.NamedTemporaryFile(dir=self.directory, suffix=".tmp", delete=False) as out:
+                try:
+                    while chunk := file.read(ENCODE_CHUNK):
+                        out.write(base64.b64encode(chunk))
+                except BaseException:
+                    os.unlink(out.name)
+                    raise
+            # Atomic, a concurrent upload of the same content writes identical bytes
+            os.replace(out.name, path)
+
+        filename = os.path.basename(filename or "") or "attachment"
+        return {
+            "filename": filename,
+            "content_type": content_type or mimetypes.guess_type(filename)[0] or "application/octet-stream",
+            "sha256": key,
+            "size": size,
+        }
+
+    def content(self, digest: str) -> str:
+        """Base64 content of a stored attachment."""
+        encoded = self._memory.get(digest)
+        if encoded is None:
+            try:
+                with open(self._path(digest), encoding="ascii") as f:
+                    encoded = f.read()
+            except FileNotFoundError:
+                raise AttachmentMissing(digest) from None
+            self._memory.set(digest, encoded)
+        return encoded
+
+    def resolve(self, params: dict[str, Any]) -> dict[str, Any]:
+        """`params` with attachment references replaced by their content, Resend style."""
+        refs = params.get("attachments")
+        if not refs or not any("sha256" in ref for ref in refs):
+            return params
+        return {
+            **params,
+            "attachments": [
+                {
+                    "filename": ref["filename"],
+                    "content": self.content(ref["sha256"]),
+                    "content_type": ref["content_type"],
+                }
+                if "sha256" in ref else ref
+                for ref in refs
+            ],
+        }
+
+    def prune(self, keep: Collection[str] = ()) -> int:
+        """Remove attachments unused for `max_age` seconds and not in `keep`, returns how many."""
+        cutoff = time.time() - self.max_age
+        removed = 0
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return 0
+        for entry in entries:
+            if entry.name.removesuffix(".b64") in keep:
+                continue
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.unlink(entry.path)
+                    self._memory.pop(entry.name.removesuffix(".b64"))
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        if removed:
+            logger.info("Pruned %d unused attachments from %s", removed, self.directory)
+        return removed
+
+
+attachment_store = AttachmentStore(
+    os.environ.get("EMAIL_ATTACHMENT_DIR", "data/attachments"),
+    memory_bytes=int(os.environ.get("EMAIL_ATTACHMENT_CACHE_BYTES", str(64 * 1024 * 1024))),
+    max_age=float(os.environ.get("EMAIL_ATTACHMENT_MAX_AGE", str(7 * 24 * 3600))),
+)
+
+
+__all__ = [
+    "AttachmentMissing",
+    "AttachmentStore",
+    "ENCODE_CHUNK",
+    "attachment_store",
+]
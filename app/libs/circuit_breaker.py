@@ -0,0 +1,141 @@
+"""Circuit breaker for calls to an external service.
+
+Closed, calls go through and consecutive failures are counted. After
+`failure_threshold` of them the breaker opens and calls are refused at once,
+without waiting on the service, for `reset_timeout` seconds. Then it is
+half-open and lets `half_open_calls` trial calls through: a success closes
+it, a failure opens it again.
+
+Usage:
+
+    from app.libs.circuit_breaker import CircuitBreaker
+
+    breaker = CircuitBreaker("resend")
+    if not breaker.allow():
+        raise Unavailable(retry_after=breaker.retry_after())
+    try:
+        result = call()
+    except ServiceError:
+        breaker.record_failure()
+        raise
+    breaker.record_success()
+"""
+
+import logging
+import threading
+import time
+from enum import Enum
+
+from app.libs.metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+circuit_state = Gauge(
+    "circuit_breaker_state",
+    "Circuit breaker state: 0 closed, 1 half-open, 2 open",
+    ["breaker"],
+)
+circuit_rejections = Counter(
+    "circuit_breaker_rejections_total",
+    "Calls refused by an open circuit breaker",
+    ["breaker"],
+)
+
+
+class CircuitState(str, Enum):
+    CLOSED = "closed"
+    HALF_OPEN = "half_open"
+    OPEN = "open"
+
+
+_STATE_VALUES = {CircuitState.CLOSED: 0, CircuitState.HALF_OPEN: 1, CircuitState.OPEN: 2}
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        half_open_calls: int = 1,
+    ):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = max(1, half_open_calls)
+        self.failures = 0
+        self.opened_at = 0.0
+        self._state = CircuitState.CLOSED
+        self._trials = 0
+        self._lock = threading.Lock()
+        circuit_state.labels(name).set(0)
+
+    @property
+    def state(self) -> CircuitState:
+        """Current state, an open breaker reads as half-open once its timeout has passed."""
+        with self._lock:
+            if self._state == CircuitState.OPEN and time.monotonic() >= self.opened_at + self.reset_timeout:
+                return CircuitState.HALF_OPEN
+            return self._state
+
+    def retry_after(self) -> float:
+        """Seconds until an open breaker lets a trial call through, 0 otherwise."""
+        with self._lock:
+            if self._state != CircuitState.OPEN:
+                return 0.0
+            return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def allow(self) -> bool:
+        """Whether a call may go ahead now, counts it as a trial call when half-open."""
+        with self._lock:
+            if self._state == CircuitState.CLOSED:
+                return True
+            if self._state == CircuitState.OPEN:
+                if time.monotonic() < self.opened_at + self.reset_timeout:
+                    circuit_rejections.labels(self.name).inc()
+                    return False
+                self._transition(CircuitState.HALF_OPEN)
+            if self._trials >= self.half_open_calls:
+                circuit_rejections.labels(self.name).inc()
+                return False
+            self._trials += 1
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            if self._state != CircuitState.CLOSED:
+                self._transition(CircuitState.CLOSED)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._state == CircuitState.HALF_OPEN or (
+                self._state == CircuitState.CLOSED and self.failures >= self.failure_threshold
+            ):
+                self.opened_at = time.monotonic()
+                self._transition(CircuitState.OPEN)
+
+    def release_trial(self) -> None:
+        """Give back a half-open trial call that ended without an outcome."""
+        with self._lock:
+            if self._state == CircuitState.HALF_OPEN and self._trials:
+                self._trials -= 1
+
+    def _transition(self, state: CircuitState) -> None:
+        if state == CircuitState.OPEN:
+            logger.warning(
+                "Circuit breaker %s opened after %d failures, refusing calls for %.0fs",
+                self.name, self.failures, self.reset_timeout,
+            )
+        else:
+            logger.info("Circuit breaker %s is now %s", self.name, state.value)
+        self._state = state
+        self._trials = 0
+        circuit_state.labels(self.name).set(_STATE_VALUES[state])
+
+
+__all__ = [
+    "CircuitBreaker",
+    "CircuitState",
+]
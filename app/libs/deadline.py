@@ -0,0 +1,64 @@
+"""Per-request deadline budget for blocking calls.
+
+A `deadline` block sets how long the work it wraps may take in total. Calls
+made inside it, including in threads started with `asyncio.to_thread` or
+`run_in_threadpool`, which copy the context, cap their own timeouts with
+`budget` so the whole chain of calls ends by the deadline rather than each
+waiting out its full timeout. Nested deadlines only ever shorten the budget.
+
+Usage:
+
+    from app.libs.deadline import budget, deadline
+
+    with deadline(10.0):
+        response = session.post(url, timeout=budget(30.0))
+"""
+
+import contextlib
+import time
+from contextvars import ContextVar
+from typing import Iterator
+
+_deadline: ContextVar[float | None] = ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+@contextlib.contextmanager
+def deadline(seconds: float | None) -> Iterator[None]:
+    """Run the block with at most `seconds` of budget, no limit when None."""
+    current = _deadline.get()
+    if seconds is not None:
+        end = time.monotonic() + seconds
+        current = end if current is None else min(current, end)
+    token = _deadline.set(current)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> float | None:
+    """Seconds left in the current deadline, None without one."""
+    end = _deadline.get()
+    return None if end is None else end - time.monotonic()
+
+
+def budget(timeout: float) -> float:
+    """`timeout` capped by the current deadline, raises once the deadline has passed."""
+    left = remaining()
+    if left is None:
+        return timeout
+    if left <= 0:
+        raise DeadlineExceeded("Deadline exceeded")
+    return min(timeout, left)
+
+
+__all__ = [
+    "DeadlineExceeded",
+    "budget",
+    "deadline",
+    "remaining",
+]
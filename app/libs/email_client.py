@@ -0,0 +1,272 @@
+"""Email transport interface and the Resend API client.
+
+`EmailTransport` is what the emailer and the email queue send through, other
+backends live in `app.libs.email_transports`. The Resend client is long-lived
+with a bounded keep-alive connection pool, so sends reuse pooled HTTPS
+connections instead of paying a TLS handshake per request, and credentials
+live on the client rather than in the module-global `resend.api_key`.
+
+Usage:
+
+    from app.libs.email_transports import get_transport
+
+    transport = get_transport()
+    if transport.configured:
+        response = transport.send(params)
+"""
+
+import os
+import threading
+import time
+from typing import Any
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.libs.deadline import budget
+from app.libs.metrics import Counter, Histogram
+
+DEFAULT_BASE_URL = "https://api.resend.com"
+
+# Maximum number of emails Resend accepts in a single batch request
+BATCH_LIMIT = 100
+
+provider_latency = Histogram(
+    "email_provider_request_duration_seconds",
+    "Latency of email provider API calls",
+    ["operation"],
+)
+provider_errors = Counter(
+    "email_provider_errors_total",
+    "Failed email provider API calls by error class",
+    ["operation", "error_class"],
+)
+
+
+def _error_class(error: requests.RequestException | None, status_code: int | None) -> str:
+    if isinstance(error, requests.Timeout):
+        return "timeout"
+    if isinstance(error, requests.ConnectionError):
+        return "connection"
+    if error is not None:
+        return "request"
+    if status_code == 429:
+        return "rate_limited"
+    return "http_5xx" if status_code >= 500 else "http_4xx"
+
+
+class EmailProviderError(Exception):
+    """Raised when the provider rejects a request or cannot be reached."""
+
+    def __init__(
+        self, message: str, status_code: int | None = None, retryable: bool | None = None
+    ):
+        super().__init__(message)
+        self.status_code = status_code
+        self._retryable = retryable
+
+    @property
+    def retryable(self) -> bool:
+        """Client errors other than rate limiting will fail again on retry."""
+        if self._retryable is not None:
+            return self._retryable
+        status_code = self.status_code
+        return status_code is None or status_code == 429 or status_code >= 500
+
+
+class ProviderUnavailable(EmailProviderError):
+    """Refused without calling the provider, because its circuit breaker is open."""
+
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(
+            f"Email provider {provider} is unavailable, retry in {retry_after:.0f}s",
+            retryable=True,
+        )
+        self.retry_after = retry_after
+
+
+class PartialBatchError(EmailProviderError):
+    """A batch stopped partway, after some of its emails were already handled.
+
+    `results` has one entry per email of the batch, the provider's result or an
+    `error` result for those handled and None for those not sent. `error` is
+    what stopped the batch, only a retryable one makes this retryable.
+    """
+
+    def __init__(self, results: list[dict[str, Any] | None], error: Exception):
+        super().__init__(
+            str(error),
+            status_code=getattr(error, "status_code", None),
+            retryable=getattr(error, "retryable", False),
+        )
+        self.results = results
+        self.error = error
+
+    @classmethod
+    def wrap(cls, results: list[dict[str, Any] | None], error: Exception) -> Exception:
+        """`error` with the results so far, or as is when no email was handled."""
+        if isinstance(error, PartialBatchError):
+            error = error.error
+        if any(result is not None for result in results):
+            partial = cls(results, error)
+            partial.__cause__ = error
+            return partial
+        return error
+
+
+def send_each(send, emails: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Call `send` for each email in turn, see `EmailTransport.send_batch`."""
+    results: list[dict[str, Any] | None] = []
+    for params in emails:
+        try:
+            results.append(send(params))
+        except Exception as e:
+            if isinstance(e, EmailProviderError) and not e.retryable:
+                results.append({"error": str(e)})
+                continue
+            if not results:
+                raise
+            unsent = [None] * (len(emails) - len(results))
+            raise PartialBatchError(results + unsent, e) from e
+    return results
+
+
+class EmailTransport:
+    """A way of delivering emails given as Resend-style params.
+
+    Params carry `from`, `to` (a list of addresses), `subject`, `html` and
+    optionally `text` and `reply_to`. `send` returns a dict with the provider's
+    message `id`. Failures raise `EmailProviderError`.
+    """
+
+    name = ""
+
+    @property
+    def configured(self) -> bool:
+        return True
+
+    @property
+    def available(self) -> bool:
+        """False while sends would be refused without trying, see `ProviderUnavailable`."""
+        return True
+
+    def send(self, params: dict[str, Any]) -> dict[str, Any]:
+        raise NotImplementedError
+
+    def send_batch(self, emails: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """Send each email, returns one result each. Backends may do this in one call.
+
+        A rejected email gets an `error` result. Any other failure stops the
+        batch, raised as `PartialBatchError` once some emails were handled, so
+        the emails already sent aren't sent again.
+        """
+        if len(emails) > BATCH_LIMIT:
+            raise ValueError(f"Batch of {len(emails)} exceeds limit of {BATCH_LIMIT}")
+        return send_each(self.send, emails)
+
+    def close(self) -> None:
+        pass
+
+
+class ResendClient(EmailTransport):
+    name = "resend"
+
+    def __init__(
+        self,
+        api_key: str | None,
+        base_url: str = DEFAULT_BASE_URL,
+        pool_size: int = 10,
+        connect_timeout: float = 3.05,
+        read_timeout: float = 10.0,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self._lock = threading.Lock()
+        self._api_key = api_key
+
+        # pool_block keeps the number of open connections at pool_size even
+        # when more threads send concurrently, they wait for a free one.
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size, pool_block=True
+        )
+        self._session = requests.Session()
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
+    @classmethod
+    def from_env(cls) -> "ResendClient":
+        return cls(
+            api_key=os.environ.get("RESEND_API_KEY"),
+            base_url=os.environ.get("RESEND_BASE_URL", DEFAULT_BASE_URL),
+            pool_size=int(os.environ.get("RESEND_POOL_SIZE", "10")),
+            connect_timeout=float(os.environ.get("RESEND_CONNECT_TIMEOUT", "3.05")),
+            read_timeout=float(os.environ.get("RESEND_READ_TIMEOUT", "10")),
+        )
+
+    @property
+    def configured(self) -> bool:
+        with self._lock:
+            return bool(self._api_key)
+
+    def set_api_key(self, api_key: str | None) -> None:
+        """Rotate credentials without rebuilding the connection pool."""
+        with self._lock:
+            self._api_key = api_key
+
+    def send(self, params: dict[str, Any]) -> dict[str, Any]:
+        return self._post("/emails", params)
+
+    def send_batch(self, emails: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """Submit up to `BATCH_LIMIT` emails in one call, returns one result each."""
+        if len(emails) > BATCH_LIMIT:
+            raise ValueError(f"Batch of {len(emails)} exceeds limit of {BATCH_LIMIT}")
+        if any(params.get("attachments") for params in emails):
+            # The batch endpoint doesn't take attachments
+            return super().send_batch(emails)
+        return self._post("/emails/batch", emails).get("data", [])
+
+    def _post(self, path: str, payload: Any) -> Any:
+        with self._lock:
+            api_key = self._api_key
+        if not api_key:
+            raise EmailProviderError("Email service not configured")
+
+        start = time.perf_counter()
+        try:
+            response = self._session.post(
+                self.base_url + path,
+                json=payload,
+                headers={"Authorization": f"Bearer {api_key}"},
+                # Capped by the caller's deadline, if it set one
+                timeout=(budget(self.timeout[0]), budget(self.timeout[1])),
+            )
+        except requests.RequestException as e:
+            provider_latency.labels(path).observe(time.perf_counter() - start)
+            provider_errors.labels(path, _error_class(e, None)).inc()
+            raise EmailProviderError(f"Email provider unreachable: {e}") from e
+        provider_latency.labels(path).observe(time.perf_counter() - start)
+
+        if response.status_code >= 400:
+            provider_errors.labels(path, _error_class(None, response.status_code)).inc()
+            try:
+                message = response.json().get("message") or response.text
+            except ValueError:
+                message = response.text
+            raise EmailProviderError(message, status_code=response.status_code)
+        return response.json()
+
+    def close(self) -> None:
+        self._session.close()
+
+
+__all__ = [
+    "BATCH_LIMIT",
+    "EmailProviderError",
+    "EmailTransport",
+    "PartialBatchError",
+    "ProviderUnavailable",
+    "ResendClient",
+    "provider_errors",
+    "provider_latency",
+    "send_each",
+]
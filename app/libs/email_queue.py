@@ -0,0 +1,500 @@
+"""In-process outbound email queue with background dispatch workers.
+
+Handlers submit provider params and return immediately with a job id, a pool
+of async workers performs the provider call in the background. When an outbox
+path is configured every job is recorded on disk before dispatch, failed sends
+are retried with jittered exponential backoff and pending jobs are replayed
+after a restart.
+
+Each attempt gets a deadline of `send_deadline` seconds, across failovers.
+While the provider's circuit breaker is open jobs are put back until it lets
+calls through again, without using up their attempts.
+
+Jobs can be scheduled for later with `send_at`. Scheduled jobs and retries wait
+in a `TimerHeap` drained by one task that sleeps until the earliest is due.
+With an outbox their params stay on disk until then, so a large backlog of
+scheduled emails costs only a heap entry each in memory. A job that hasn't
+been handed to the provider yet can be cancelled.
+
+Usage:
+
+    from app.libs.email_queue import email_queue
+
+    job = email_queue.submit("welcome", params)
+    job = await email_queue.asubmit("welcome", params)  # from async endpoints
+    later = email_queue.submit("welcome", params, send_at=time.time() + 86400)
+    status = email_queue.get(job.job_id)
+    email_queue.cancel(later.job_id)
+"""
+
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from enum import Enum
+from typing import Any, Callable, TypeVar
+
+from pydantic import BaseModel
+
+from app.libs.attachments import attachment_store
+from app.libs.deadline import deadline
+from app.libs.email_client import EmailProviderError, ProviderUnavailable
+from app.libs.email_outbox import DEAD, SENDING, EmailOutbox, OutboxEntry, backoff_delay
+from app.libs.email_transports import get_transport
+from app.libs.timer_heap import TimerHeap
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class JobStatus(str, Enum):
+    SCHEDULED = "scheduled"
+    QUEUED = "queued"
+    SENDING = "sending"
+    SENT = "sent"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class EmailJob(BaseModel):
+    job_id: str
+    kind: str
+    status: JobStatus = JobStatus.QUEUED
+    attempts: int = 0
+    email_id: str | None = None
+    error: str | None = None
+    created_at: datetime
+    scheduled_at: datetime | None = None
+    completed_at: datetime | None = None
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _datetime(timestamp: float | None) -> datetime | None:
+    return datetime.fromtimestamp(timestamp, timezone.utc) if timestamp is not None else None
+
+
+def _provider_send(params: dict[str, Any]) -> Any:
+    return get_transport().send(attachment_store.resolve(params))
+
+
+def _retryable(error: Exception) -> bool:
+    """Provider errors say so themselves, connection errors and timeouts are
+    worth retrying, anything else would fail the same way again."""
+    if isinstance(error, EmailProviderError):
+        return error.retryable
+    return isinstance(error, OSError)
+
+
+class EmailQueue:
+    """Bounded job table plus an asyncio queue drained by `workers` tasks.
+
+    `submit` is safe to call from any thread, async endpoints use `asubmit`.
+    The workers themselves run on the event loop and hand the blocking
+    provider call to a dedicated executor, and outbox writes to threads. Jobs not due yet wait in
+    a timer heap until a single timer task moves them to the asyncio queue.
+    """
+
+    def __init__(
+        self,
+        workers: int = 4,
+        max_jobs: int = 10_000,
+        send: Callable[[dict[str, Any]], Any] = _provider_send,
+        outbox_path: str | None = None,
+        max_attempts: int = 8,
+        send_deadline: float | None = None,
+    ):
+        self.workers = max(1, workers)
+        self.max_jobs = max_jobs
+        self.outbox_path = outbox_path
+        self.max_attempts = max(1, max_attempts)
+        self.send_deadline = send_deadline
+        self._send = send
+        self._outbox: EmailOutbox | None = None
+        self._lock = threading.Lock()
+        self._jobs: OrderedDict[str, EmailJob] = OrderedDict()
+        self._params: dict[str, dict[str, Any]] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._queue: asyncio.Queue[str] | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._timers = TimerHeap()
+        self._wakeup: asyncio.Event | None = None
+        self._executor: ThreadPoolExecutor | None = None
+        # One thread, the outbox serialises writes anyway
+        self._submit_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="email-outbox"
+        )
+
+    @property
+    def running(self) -> bool:
+        return self._loop is not None
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._wakeup = asyncio.Event()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="email-dispatch"
+        )
+
+        with self._lock:
+            # Jobs left in the queue by an earlier stop
+            for job_id in self._params:
+                if job_id not in self._timers:
+                    self._timers.push(job_id, 0.0)
+        if self.outbox_path and self._outbox is None:
+            self._outbox = EmailOutbox(self.outbox_path)
+            recovered = 0
+            # Only due times are loaded, jobs are read back from the outbox when due
+            due_times = await asyncio.to_thread(self._outbox.due_times)
+            with self._lock:
+                for job_id, due in due_times:
+                    if job_id not in self._timers and job_id not in self._params:
+                        self._timers.push(job_id, due)
+                        recovered += 1
+            if recovered:
+                logger.info("Recovered %d pending emails from outbox", recovered)
+
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"email-dispatch-{i}")
+            for i in range(self.workers)
+        ]
+        self._tasks.append(asyncio.create_task(self._timer(), name="email-timer"))
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Drain queued jobs for up to `timeout` seconds, then stop workers.
+
+        Jobs waiting for a retry or their scheduled time stay in the outbox
+        and are replayed on the next start.
+        """
+        if not self.running:
+            return
+        assert self._queue is not None
+        # Stop moving due jobs to the queue while it drains
+        self._tasks[-1].cancel()
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Email queue stopped with %d jobs pending", self._queue.qsize())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        if self._outbox is not None:
+            self._outbox.close()
+        self._tasks = []
+        self._queue = None
+        self._wakeup = None
+        self._executor = None
+        self._outbox = None
+        self._loop = None
+
+    def submit(
+        self, kind: str, params: dict[str, Any], send_at: float | None = None
+    ) -> EmailJob:
+        """Record a job and schedule it for dispatch, returns a snapshot.
+
+        `send_at` is a unix timestamp, the job is dispatched right away when
+        it is missing or in the past.
+        """
+        job_id = uuid.uuid4().hex
+        scheduled = send_at is not None and send_at > time.time()
+        outbox = self._outbox
+        if outbox is not None:
+            outbox.add(job_id, kind, params, send_at if scheduled else None)
+        snapshot = self._restore(
+            job_id,
+            kind,
+            # A scheduled job is read back from the outbox when it is due
+            params if outbox is None or not scheduled else None,
+            status=JobStatus.SCHEDULED if scheduled else JobStatus.QUEUED,
+            scheduled_at=send_at if scheduled else None,
+        )
+
+        loop, queue = self._loop, self._queue
+        if scheduled or loop is None or queue is None:
+            # Jobs submitted before start are dispatched by the timer task once it runs
+            self._schedule(job_id, send_at if scheduled else 0.0)
+        else:
+            loop.call_soon_threadsafe(queue.put_nowait, job_id)
+        return snapshot
+
+    async def asubmit(
+        self, kind: str, params: dict[str, Any], send_at: float | None = None
+    ) -> EmailJob:
+        """`submit` for async callers, the outbox write runs off the event loop."""
+        if self._outbox is None:
+            return self.submit(kind, params, send_at)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._submit_executor, self.submit, kind, params, send_at
+        )
+
+    def get(self, job_id: str) -> EmailJob | None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return job.model_copy()
+        # Recovered jobs are only loaded into the job table when they are due
+        outbox = self._outbox
+        if outbox is not None:
+            entry = outbox.get(job_id)
+            if entry is not None:
+                return _job_from_entry(entry)
+        return None
+
+    def cancel(self, job_id: str) -> EmailJob | None:
+        """Cancel a job that hasn't been handed to the provider yet.
+
+        Returns the job, with status `cancelled` if it was cancelled and its
+        current status otherwise, or None if the job is unknown.
+        """
+        with self._lock:
+            self._timers.cancel(job_id)
+            in_memory = self._params.pop(job_id, None) is not None
+            job = self._jobs.get(job_id)
+        outbox = self._outbox
+        if outbox is not None:
+            # Also cancels jobs scheduled by another process sharing the outbox
+            entry = outbox.cancel(job_id)
+            cancelled = entry is not None
+        else:
+            entry, cancelled = None, in_memory
+        if not cancelled:
+            return self.get(job_id)
+
+        logger.info("Cancelled email job %s", job_id)
+        if job is None and entry is not None:
+            return self._restore(
+                job_id, entry.kind, None, entry.attempts, entry.last_error, entry.created_at,
+                status=JobStatus.CANCELLED, completed_at=time.time(),
+            )
+        self._update(job_id, status=JobStatus.CANCELLED, completed_at=_now())
+        return self.get(job_id)
+
+    def attachment_digests(self) -> set[str]:
+        """Digests of the stored attachments that jobs still to be sent refer to."""
+        with self._lock:
+            digests = {
+                ref["sha256"]
+                for params in self._params.values()
+                for ref in params.get("attachments") or ()
+                if "sha256" in ref
+            }
+        outbox = self._outbox
+        if outbox is not None:
+            digests |= outbox.attachment_digests()
+        return digests
+
+    def _restore(
+        self,
+        job_id: str,
+        kind: str,
+        params: dict[str, Any],
+        attempts: int = 0,
+        error: str | None = None,
+        created_at: float | None = None,
+        status: JobStatus = JobStatus.QUEUED,
+        scheduled_at: float | None = None,
+        completed_at: float | None = None,
+    ) -> EmailJob:
+        job = EmailJob(
+            job_id=job_id,
+            kind=kind,
+            status=status,
+            attempts=attempts,
+            error=error,
+            created_at=_datetime(created_at) or _now(),
+            scheduled_at=_datetime(scheduled_at),
+            completed_at=_datetime(completed_at),
+        )
+        with self._lock:
+            self._jobs[job_id] = job
+            if params is not None:
+                self._params[job_id] = params
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+            return job.model_copy()
+
+    def _schedule(self, job_id: str, due: float) -> None:
+        """Add a timer, and wake the timer task if it is now the earliest."""
+        with self._lock:
+            self._timers.push(job_id, due)
+            earliest = self._timers.next_due() == due
+        loop, wakeup = self._loop, self._wakeup
+        if earliest and loop is not None and wakeup is not None:
+            loop.call_soon_threadsafe(wakeup.set)
+
+    async def _timer(self) -> None:
+        """Move due jobs to the queue, sleeping until the next is due or one is added."""
+        assert self._queue is not None and self._wakeup is not None
+        while True:
+            with self._lock:
+                due = list(self._timers.pop_due(time.time()))
+                next_due = self._timers.next_due()
+                # Cleared under the lock, so a timer added after this wakes the wait
+                self._wakeup.clear()
+            for job_id in due:
+                self._queue.put_nowait(job_id)
+            timeout = None if next_due is None else max(0.0, next_due - time.time())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _update(self, job_id: str, **changes: Any) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                for name, value in changes.items():
+                    setattr(job, name, value)
+
+    async def _worker(self) -> None:
+        assert self._queue is not None and self._loop is not None
+        while True:
+            job_id = await self._queue.get()
+            try:
+                claimed = await self._off_loop(self._claim, job_id)
+                if claimed is None:
+                    continue
+                params, attempts = claimed
+                try:
+                    response = await self._loop.run_in_executor(
+                        self._executor, self._send_within_deadline, params
+                    )
+                except Exception as e:
+                    await self._off_loop(self._failed, job_id, params, attempts, e)
+                    continue
+                await self._off_loop(self._sent, job_id, response)
+            finally:
+                self._queue.task_done()
+
+    async def _off_loop(self, fn: Callable[..., T], *args: Any) -> T:
+        """Run a step that writes to the outbox in a thread, so SQLite commits
+        don't stall the event loop. Inline when there is no outbox."""
+        if self._outbox is None:
+            return fn(*args)
+        return await asyncio.to_thread(fn, *args)
+
+    def _claim(self, job_id: str) -> tuple[dict[str, Any], int] | None:
+        """Params and attempt number of a due job, None if it was cancelled or taken."""
+        with self._lock:
+            params = self._params.pop(job_id, None)
+            job = self._jobs.get(job_id)
+        outbox = self._outbox
+        if outbox is not None:
+            entry = outbox.claim(job_id, with_params=params is None)
+            if entry is None:
+                return None
+            if params is None:
+                params = entry.params
+            if job is None:
+                self._restore(job_id, entry.kind, None, entry.attempts, entry.last_error,
+                              entry.created_at)
+            attempts = entry.attempts + 1
+        elif params is None:
+            return None
+        else:
+            attempts = (job.attempts if job is not None else 0) + 1
+        self._update(job_id, status=JobStatus.SENDING, attempts=attempts)
+        return params, attempts
+
+    def _sent(self, job_id: str, response: Any) -> None:
+        if self._outbox is not None:
+            self._outbox.mark_sent(job_id)
+        self._update(
+            job_id,
+            status=JobStatus.SENT,
+            email_id=(response or {}).get("id"),
+            error=None,
+            completed_at=_now(),
+        )
+
+    def _send_within_deadline(self, params: dict[str, Any]) -> Any:
+        with deadline(self.send_deadline):
+            return self._send(params)
+
+    def _failed(
+        self, job_id: str, params: dict[str, Any], attempts: int, error: Exception
+    ) -> None:
+        if isinstance(error, ProviderUnavailable):
+            # Never reached the provider, so it doesn't count as an attempt.
+            # Spread out, so the backlog doesn't hit the trial call all at once.
+            attempts -= 1
+            delay = error.retry_after + random.uniform(0, max(1.0, error.retry_after))
+            logger.debug("Email job %s deferred for %.1fs: %s", job_id, delay, error)
+        elif attempts < self.max_attempts and _retryable(error):
+            delay = backoff_delay(attempts - 1)
+            logger.warning(
+                "Email job %s failed on attempt %d, retrying in %.1fs: %s",
+                job_id, attempts, delay, error,
+            )
+        else:
+            delay = None
+        if delay is not None:
+            if self._outbox is not None:
+                self._outbox.mark_retry(job_id, attempts, time.time() + delay, str(error))
+            else:
+                with self._lock:
+                    self._params[job_id] = params
+            self._update(job_id, status=JobStatus.QUEUED, attempts=attempts, error=str(error))
+            self._schedule(job_id, time.time() + delay)
+            return
+
+        logger.error("Error dispatching email job %s: %s", job_id, error)
+        if self._outbox is not None:
+            self._outbox.mark_dead(job_id, attempts, str(error))
+        self._update(
+            job_id,
+            status=JobStatus.FAILED,
+            error=str(error),
+            completed_at=_now(),
+        )
+
+
+def _job_from_entry(entry: OutboxEntry) -> EmailJob:
+    if entry.status == DEAD:
+        status = JobStatus.FAILED
+    elif entry.status == SENDING:
+        status = JobStatus.SENDING
+    elif entry.next_attempt_at > time.time() and entry.attempts == 0:
+        status = JobStatus.SCHEDULED
+    else:
+        status = JobStatus.QUEUED
+    return EmailJob(
+        job_id=entry.job_id,
+        kind=entry.kind,
+        status=status,
+        attempts=entry.attempts,
+        error=entry.last_error,
+        created_at=_datetime(entry.created_at),
+        scheduled_at=_datetime(entry.next_attempt_at) if status == JobStatus.SCHEDULED else None,
+    )
+
+
+email_queue = EmailQueue(
+    workers=int(os.environ.get("EMAIL_QUEUE_WORKERS", "4")),
+    max_jobs=int(os.environ.get("EMAIL_QUEUE_MAX_JOBS", "10000")),
+    outbox_path=os.environ.get("EMAIL_OUTBOX_PATH", "data/email_outbox.db") or None,
+    max_attempts=int(os.environ.get("EMAIL_MAX_ATTEMPTS", "8")),
+    send_deadline=float(os.environ.get("EMAIL_SEND_DEADLINE", "20")),
+)
+
+__all__ = [
+    "EmailJob",
+    "EmailQueue",
+    "JobStatus",
+    "email_queue",
+]
@@ -0,0 +1,343 @@
+"""Precompiled email templates.
+
+Each template is parsed once at import time into the literal text between its
+`{{ field }}` placeholders, so a render only fills the escaped values in
+between the ready-made segments and joins them. The footer year is folded into
+the literals and the segments are rebuilt when the year rolls over, instead of
+calling `datetime.now()` per render.
+
+Usage:
+
+    from app.libs.email_templates import render
+
+    html = render("welcome", name=request.name)
+"""
+
+import html
+import re
+import time
+from datetime import datetime
+from typing import Any, Callable, Iterable
+
+_FIELD = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+
+# Field filled in when the segments are built rather than per render
+_YEAR = "year"
+
+
+def _next_year_start(now: datetime) -> float:
+    return datetime(now.year + 1, 1, 1).timestamp()
+
+
+def _escape(value: Any) -> str:
+    if value.__class__ is not str:
+        if value is None:
+            return ""
+        value = str(value)
+    # Most values need no escaping, skip html.escape's five replace passes.
+    # Substring checks are cheaper than a regex search per value
+    if "&" in value or "<" in value or ">" in value or '"' in value or "'" in value:
+        return html.escape(value)
+    return value
+
+
+def _raw(value: Any) -> str:
+    return "" if value is None else str(value)
+
+
+class Template:
+    """A template split into literal segments and the fields between them.
+
+    Values are HTML-escaped unless `escape` is False (plain text bodies) or
+    the field is listed in `raw` (pre-rendered markup such as user-supplied
+    HTML content). Fields not given render as empty.
+    """
+
+    def __init__(self, source: str, escape: bool = True, raw: Iterable[str] = ()):
+        self.source = source
+        self.escape = escape
+        self.raw = frozenset(raw)
+        self.fields = tuple(dict.fromkeys(
+            name for name in _FIELD.findall(source) if name != _YEAR
+        ))
+        self._names = frozenset(self.fields)
+        self._build()
+
+    def _build(self) -> None:
+        now = datetime.now()
+        parts: list[str] = []
+        slots: list[tuple[int, str, Callable[[Any], str]]] = []
+        literal: list[str] = []
+        pos = 0
+        for match in _FIELD.finditer(self.source):
+            literal.append(self.source[pos:match.start()])
+            pos = match.end()
+            name = match.group(1)
+            if name == _YEAR:
+                literal.append(str(now.year))
+                continue
+            parts.append("".join(literal))
+            literal = []
+            convert = _escape if self.escape and name not in self.raw else _raw
+            slots.append((len(parts), name, convert))
+            parts.append("")
+        literal.append(self.source[pos:])
+        parts.append("".join(literal))
+        # Swapped in as one tuple, so a concurrent render sees old or new segments
+        self._segments = (parts, tuple(slots), _next_year_start(now))
+
+    def render(self, **values: Any) -> str:
+        return self.fill(values)
+
+    def fill(self, values: dict[str, Any]) -> str:
+        """Like `render`, with the values as a dict."""
+        parts, slots, expires = self._segments
+        if time.time() >= expires:
+            self._build()
+            parts, slots, expires = self._segments
+        if not self._names.issuperset(values):
+            unknown = ", ".join(sorted(set(values) - self._names))
+            raise TypeError(f"Unknown template fields: {unknown}")
+        parts = parts.copy()
+        get = values.get
+        for index, name, convert in slots:
+            parts[index] = convert(get(name))
+        return "".join(parts)
+
+
+CONTACT_HTML = """
+        <html>
+            <head>
+                <meta name="viewport" content="width=device-width, initial-scale=1.0">
+                <style>
+                    body { font-family: 'Arial', sans-serif; line-height: 1.6; margin: 0; padding: 0; background-color: #f9f9f9; }
+                    .container { max-width: 600px; margin: 0 auto; background-color: #ffffff; border-radius: 8px; overflow: hidden; box-shadow: 0 0 20px rgba(0, 0, 0, 0.1); }
+                    .header { background: #17d1e0; padding: 20px; text-align: center; }
+                    .logo { height: 70px; width: auto; }
+                    .content { padding: 30px; color: #333333; font-size: 16px; }
+                    .footer { background-color: #f0f0f0; padding: 20px; text-align: center; font-size: 14px; color: #555555; border-top: 1px solid #e0e0e0; }
+                    h1, h2 { color: #222222; margin-top: 0; font-weight: bold; font-size: 24px; }
+                    h1 { font-size: 28px; letter-spacing: 0.5px; }
+                    p { margin-bottom: 16px; color: #333333; }
+                    strong { color: #0891b2; font-weight: bold; }
+                    .highlight { color: #0891b2; font-weight: bold; }
+                    .divider { height: 2px; background: linear-gradient(to right, #ffffff, #17d1e0, #ffffff); margin: 20px 0; }
+                    ul { padding-left: 20px; margin: 20px 0; }
+                    li { margin-bottom: 10px; padding-left: 5px; color: #333333; }
+                </style>
+            </head>
+            <body>
+                <div class="container">
+                    <div class="header">
+                        <img class="logo" src="https://loufranktv.com/public/901661ac-f28e-4815-8069-61ae5363a100/logo-color.png" alt="LouFrank TV Logo">
+                    </div>
+                    <div class="content">
+                        <h2>New Contact Form Submission</h2>
+                        <div class="divider"></div>
+                        <p><strong>From:</strong> {{ name }} ({{ email }})</p>
+                        <p><strong>Subject:</strong> {{ subject }}</p>
+                        <p><strong>Message:</strong></p>
+                        <p>{{ message }}</p>
+                    </div>
+                    <div class="footer">
+                        <p>© {{ year }} LouFrank TV. All rights reserved.</p>
+                        <p>Premium IPTV Service | 16,000+ Channels | Global Coverage</p>
+                    </div>
+                </div>
+            </body>
+        </html>
+        """
+
+WELCOME_HTML = """
+        <html>
+            <head>
+                <meta name="viewport" content="width=device-width, initial-scale=1.0">
+                <style>
+                    body { font-family: 'Arial', sans-serif; line-height: 1.6; color: #e2e8f0; margin: 0; padding: 0; background-color: #0f0f0f; }
+                    .container { max-width: 600px; margin: 0 auto; background-color: #0a0a0a; border-radius: 8px; overflow: hidden; }
+                    .header { background: linear-gradient(135deg, #000000, #1a1a1a); padding: 20px; text-align: center; border-bottom: 1px solid #333; }
+                    .logo { height: 60px; width: auto; }
+                    .content { padding: 30px; }
+                    .footer { background-color: #0a0a0a; padding: 20px; text-align: center; font-size: 12px; color: #6c7280; border-top: 1px solid #333; }
+                    h1, h2 { color: #ffffff; margin-top: 0; }
+                    .highlight { color: #17d1e0; }
+                    .divider { height: 1px; background: linear-gradient(to right, transparent, #333, transparent); margin: 20px 0; }
+                    .button { background: #17d1e0; color: #ffffff; text-decoration: none; padding: 14px 30px; border-radius: 5px; font-weight: bold; display: inline-block; margin: 25px 0; font-size: 16px; box-shadow: 0 2px 5px rgba(0, 0, 0, 0.1); }
+                    .button:hover { background: #0891b2; }
+                    a { color: #0891b2; text-decoration: underline; font-weight: bold; }
+                    a:hover { color: #066a82; }
+                </style>
+            </head>
+            <body>
+                <div class="container">
+                    <div class="header">
+                        <img class="logo" src="https://loufranktv.com/public/901661ac-f28e-4815-8069-61ae5363a100/logo-color.png" alt="LouFrank TV Logo">
+                    </div>
+                    <div class="content">
+                        <h1>Welcome to <span class="highlight">LouFrank TV</span>!</h1>
+                        <div class="divider"></div>
+                        
+                        <p>Hello {{ name }},</p>
+                        <p>Thank you for joining LouFrank TV! We're excited to have you as part of our community of premium entertainment enthusiasts.</p>
+                        
+                        <p>With your new account, you now have access to:</p>
+                        <ul>
+                            <li>Over <strong>16,000 HD and FHD channels</strong> from more than 50 countries</li>
+                            <li>Thousands of <strong>on-demand movies and TV series</strong></li>
+                            <li><strong>Ultra-fast zapping</strong> with no freezing</li>
+                            <li><strong>Global access</strong> from any device</li>
+                        </ul>
+                        
+                        <div style="text-align: center;">
+                            <a href="https://loufranktv.com/setup-guides" class="button">Set Up Your Devices</a>
+                        </div>
+                        
+                        <p>If you have any questions or need assistance, don't hesitate to contact our support team at <a href="mailto:support@loufranktv.com" style="color: #17d1e0;">support@loufranktv.com</a>.</p>
+                        
+                        <p>Enjoy the premium experience!</p>
+                        <p>The LouFrank TV Team</p>
+                    </div>
+                    <div class="footer">
+                        <p>© {{ year }} LouFrank TV. All rights reserved.</p>
+                        <p>Premium IPTV Service | 16,000+ Channels | Global Coverage</p>
+                    </div>
+                </div>
+            </body>
+        </html>
+        """
+
+WELCOME_TEXT = """
+        Welcome to LouFrank TV!
+        
+        Hello {{ name }},
+        
+        Thank you for joining LouFrank TV! We're excited to have you as part of our community of premium entertainment enthusiasts.
+        
+        With your new account, you now have access to:
+        - Over 16,000 HD and FHD channels from more than 50 countries
+        - Thousands of on-demand movies and TV series
+        - Ultra-fast zapping with no freezing
+        - Global access from any device
+        
+        Set up your devices: https://loufranktv.com/setup
+        
+        If you have any questions or need assistance, don't hesitate to contact our support team at support@loufranktv.com.
+        
+        Enjoy the premium experience!
+        
+        The LouFrank TV Team
+        """
+
+TRIAL_REQUEST_HTML = """
+        <!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Strict//EN" "http://www.w3.org/TR/xhtml1/DTD/xhtml1-strict.dtd">
+        <html xmlns="http://www.w3.org/1999/xhtml">
+        <head>
+            <meta http-equiv="Content-Type" content="text/html; charset=utf-8" />
+            <meta name="viewport" content="width=device-width, initial-scale=1.0"/>
+            <title>New Trial Request for Lou Frank TV</title>
+            <style type="text/css">
+                body, table, td, a { -webkit-text-size-adjust: 100%; -ms-text-size-adjust: 100%; }
+                table, td { mso-table-lspace: 0pt; mso-table-rspace: 0pt; }
+                img { -ms-interpolation-mode: bicubic; }
+                body { margin: 0; padding: 0; }
+                table { border-collapse: collapse !important; }
+                .ExternalClass { width: 100%; }
+                .ExternalClass, .ExternalClass p, .ExternalClass span, .ExternalClass font, .ExternalClass td, .ExternalClass div { line-height: 100%; }
+                .apple-link a { color: inherit !important; text-decoration: none !important; }
+                .btn-link a { color: #ffffff !important; text-decoration: none !important; }
+                img { border: 0; height: auto; line-height: 100%; outline: none; text-decoration: none; display: block; }
+            </style>
+        </head>
+        <body style="font-family: Arial, sans-serif; line-height: 1.6; margin: 0; padding: 0;">
+            <table width="100%" cellpadding="0" cellspacing="0" border="0" style="background-color: #f4f4f4;">
+                <tr>
+                    <td align="center" style="padding: 20px 0;">
+                        <table width="600" cellpadding="0" cellspacing="0" border="0" style="background-color: #ffffff; border-radius: 8px; overflow: hidden; box-shadow: 0 4px 8px rgba(0,0,0,0.1);">
+                            <tr>
+                                <td align="center" style="padding: 20px 0;">
+                                    <a href="https://www.loufranktv.com" target="_blank" style="text-decoration: none;">
+                                        <img src="https://www.loufranktv.com/logo-loufrank-crew.png" alt="Lou Frank TV Logo" style="display: block; width:200px; max-width:100%; height:auto; margin: 0 auto;" />
+                                    </a>
+                                </td>
+                            </tr>
+                            <tr>
+                                <td style="padding: 0 30px 20px 30px;">
+                                    <p style="font-size: 16px; color: #333333;">Hello Owner,</p>
+                                    <p style="font-size: 16px; color: #333333;">Someone requested a free trial:</p>
+                                    <ul style="font-size: 16px; color: #333333; list-style-type: none; padding: 0;">
+                                        <li style="margin-bottom: 10px;"><strong>Name:</strong> {{ name }}</li>
+                                        <li style="margin-bottom: 10px;"><strong>Email:</strong> {{ email }}</li>
+                                        {{ phone_row }}
+                                    </ul>
+                                    <p style="font-size: 16px; color: #333333;">Please follow up as soon as possible.</p>
+                                </td>
+                            </tr>
+                            <tr>
+                                <td align="center" style="padding: 20px; font-size: 12px; color: #999999; background-color: #eeeeee;">
+                                    <p>&copy; {{ year }} Lou Frank TV. All rights reserved.</p>
+                                </td>
+                            </tr>
+                        </table>
+                    </td>
+                </tr>
+            </table>
+        </body>
+        </html>
+        """
+
+GENERIC_WRAPPER_HTML = """
+        <html>
+            <head>
+                <meta name="viewport" content="width=device-width, initial-scale=1.0">
+                <style>
+                    body { font-family: 'Arial', sans-serif; line-height: 1.6; color: #e2e8f0; margin: 0; padding: 0; background-color: #0f0f0f; }
+                    .container { max-width: 600px; margin: 0 auto; background-color: #0a0a0a; border-radius: 8px; overflow: hidden; }
+                    .header { background: linear-gradient(135deg, #000000, #1a1a1a); padding: 20px; text-align: center; border-bottom: 1px solid #333; }
+                    .logo { height: 60px; width: auto; }
+                    .content { padding: 30px; }
+                    .footer { background-color: #0a0a0a; padding: 20px; text-align: center; font-size: 12px; color: #6c7280; border-top: 1px solid #333; }
+                    h1, h2 { color: #ffffff; margin-top: 0; }
+                    .highlight { color: #17d1e0; }
+                    .divider { height: 1px; background: linear-gradient(to right, transparent, #333, transparent); margin: 20px 0; }
+                </style>
+            </head>
+            <body>
+                <div class="container">
+                    <div class="header">
+                        <img class="logo" src="https://loufranktv.com/public/901661ac-f28e-4815-8069-61ae5363a100/logo-color.png" alt="LouFrank TV Logo">
+                    </div>
+                    <div class="content">
+                        {{ html_content }}
+                    </div>
+                    <div class="footer">
+                        <p>© {{ year }} LouFrank TV. All rights reserved.</p>
+                        <p>Premium IPTV Service | 16,000+ Channels | Global Coverage</p>
+                    </div>
+                </div>
+            </body>
+        </html>
+        """
+
+TRIAL_REQUEST_PHONE_HTML = """<li style="margin-bottom: 10px;"><strong>Phone:</strong> {{ phone }}</li>"""
+
+
+TEMPLATES: dict[str, Template] = {
+    "contact": Template(CONTACT_HTML),
+    "welcome": Template(WELCOME_HTML),
+    "welcome_text": Template(WELCOME_TEXT, escape=False),
+    "trial_request": Template(TRIAL_REQUEST_HTML, raw=("phone_row",)),
+    "trial_request_phone": Template(TRIAL_REQUEST_PHONE_HTML),
+    "generic_wrapper": Template(GENERIC_WRAPPER_HTML, raw=("html_content",)),
+}
+
+
+def render(template: str, /, **values: Any) -> str:
+    """Render a registered template by name."""
+    return TEMPLATES[template].fill(values)
+
+
+__all__ = [
+    "TEMPLATES",
+    "Template",
+    "render",
+]
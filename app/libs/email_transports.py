@@ -0,0 +1,568 @@
+"""Email transports besides Resend, and the shared transport built from config.
+
+`EMAIL_TRANSPORT` names the backend, or several separated by commas to fail
+over in that order when a send fails with a retryable error:
+
+    resend       Resend HTTP API (RESEND_API_KEY, RESEND_BASE_URL, ...)
+    smtp         pooled SMTP relay (SMTP_HOST, SMTP_PORT, SMTP_USERNAME, ...)
+    memory       keeps sent messages in memory, for tests and benchmarks
+    file         like memory, also appends every message to EMAIL_SINK_PATH
+
+The SMTP transport keeps up to `pool_size` authenticated connections open and
+sends many messages over each before replacing it, so a high-volume send pays
+for the TCP, TLS and AUTH round trips once per connection instead of once per
+message. Messages go out as consecutive transactions on the reused session,
+commands aren't pipelined (ESMTP PIPELINING), which `smtplib` doesn't support.
+
+Resend and SMTP each sit behind a circuit breaker (EMAIL_BREAKER_FAILURES
+consecutive failures open it for EMAIL_BREAKER_RESET_TIMEOUT seconds), so
+while a provider is down sends fail at once with `ProviderUnavailable`, or
+fail over to the next transport, instead of each waiting out the timeout.
+Both cap their timeouts by the caller's deadline, see `app.libs.deadline`.
+
+Usage:
+
+    from app.libs.email_transports import get_transport
+
+    transport = get_transport()
+    if transport.configured:
+        response = transport.send(params)
+"""
+
+import contextlib
+import json
+import logging
+import os
+import smtplib
+import ssl
+import threading
+import time
+import uuid
+from collections import deque
+from email.message import EmailMessage, MIMEPart
+from email.utils import formatdate, make_msgid, parseaddr
+from typing import Any, Iterator
+
+from app.libs.circuit_breaker import CircuitBreaker, CircuitState
+from app.libs.deadline import DeadlineExceeded, budget, remaining
+from app.libs.email_client import (
+    BATCH_LIMIT,
+    EmailProviderError,
+    EmailTransport,
+    PartialBatchError,
+    ProviderUnavailable,
+    ResendClient,
+    provider_errors,
+    provider_latency,
+    send_each,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def build_message(params: dict[str, Any]) -> tuple[EmailMessage, str, list[str]]:
+    """MIME message, envelope sender and recipients for Resend-style params.
+
+    Raises a non-retryable `EmailProviderError` for params that can't make a
+    valid message, such as a header containing a line break.
+    """
+    try:
+        return _build_message(params)
+    except ValueError as e:
+        raise EmailProviderError(f"Invalid message: {e}", retryable=False) from e
+
+
+def _build_message(params: dict[str, Any]) -> tuple[EmailMessage, str, list[str]]:
+    sender = params["from"]
+    recipients = params["to"] if isinstance(params["to"], list) else [params["to"]]
+    domain = parseaddr(sender)[1].rpartition("@")[2] or None
+
+    msg = EmailMessage()
+    msg["From"] = sender
+    msg["To"] = ", ".join(recipients)
+    msg["Subject"] = params.get("subject", "")
+    msg["Date"] = formatdate(localtime=False)
+    msg["Message-ID"] = make_msgid(domain=domain)
+    if params.get("reply_to"):
+        msg["Reply-To"] = params["reply_to"]
+    if params.get("text"):
+        msg.set_content(params["text"])
+        msg.add_alternative(params.get("html", ""), subtype="html")
+    else:
+        msg.set_content(params.get("html", ""), subtype="html")
+    attachments = params.get("attachments")
+    if attachments:
+        msg.make_mixed()
+        for attachment in attachments:
+            msg.attach(_attachment_part(attachment))
+    return msg, parseaddr(sender)[1], [parseaddr(r)[1] for r in recipients]
+
+
+def _attachment_part(attachment: dict[str, Any]) -> MIMEPart:
+    """MIME part for an attachment whose content is already base64-encoded."""
+    content = attachment["content"]
+    part = MIMEPart()
+    part.add_header(
+        "Content-Type",
+        attachment.get("content_type") or "application/octet-stream",
+        name=attachment["filename"],
+    )
+    part.add_header("Content-Disposition", "attachment", filename=attachment["filename"])
+    part["Content-Transfer-Encoding"] = "base64"
+    # Used as is rather than decoded and encoded again, wrapped to 76 character lines
+    part.set_payload("\n".join(content[i:i + 76] for i in range(0, len(content), 76)))
+    return part
+
+
+class _Connection:
+    __slots__ = ("smtp", "messages", "last_used")
+
+    def __init__(self, smtp: smtplib.SMTP):
+        self.smtp = smtp
+        self.messages = 0
+        self.last_used = time.monotonic()
+
+    def close(self) -> None:
+        try:
+            self.smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            self.smtp.close()
+
+
+class SMTPTransport(EmailTransport):
+    """SMTP relay with a pool of persistent, authenticated connections.
+
+    A connection is checked out for a whole `send_batch`, so a batch goes out
+    as consecutive transactions on one session, each command waiting for its
+    reply as `smtplib` does, without PIPELINING. Connections are retired after
+    `max_messages_per_connection` messages or `idle_timeout` seconds unused,
+    and a pooled connection the server has dropped is replaced once,
+    transparently.
+    """
+
+    name = "smtp"
+
+    def __init__(
+        self,
+        host: str | None,
+        port: int = 587,
+        username: str | None = None,
+        password: str | None = None,
+        starttls: bool = True,
+        use_ssl: bool = False,
+        pool_size: int = 4,
+        max_messages_per_connection: int = 100,
+        idle_timeout: float = 60.0,
+        timeout: float = 10.0,
+    ):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls and not use_ssl
+        self.use_ssl = use_ssl
+        self.max_messages_per_connection = max(1, max_messages_per_connection)
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.connections_opened = 0
+        self._ssl_context = ssl.create_default_context()
+        self._idle: list[_Connection] = []
+        self._lock = threading.Lock()
+        # Like the Resend pool, senders wait for a free connection rather than
+        # opening more than pool_size
+        self._slots = threading.BoundedSemaphore(max(1, pool_size))
+
+    @classmethod
+    def from_env(cls) -> "SMTPTransport":
+        return cls(
+            host=os.environ.get("SMTP_HOST"),
+            port=int(os.environ.get("SMTP_PORT", "587")),
+            username=os.environ.get("SMTP_USERNAME"),
+            password=os.environ.get("SMTP_PASSWORD"),
+            starttls=os.environ.get("SMTP_STARTTLS", "1") == "1",
+            use_ssl=os.environ.get("SMTP_SSL") == "1",
+            pool_size=int(os.environ.get("SMTP_POOL_SIZE", "4")),
+            max_messages_per_connection=int(os.environ.get("SMTP_MAX_MESSAGES_PER_CONNECTION", "100")),
+            idle_timeout=float(os.environ.get("SMTP_IDLE_TIMEOUT", "60")),
+            timeout=float(os.environ.get("SMTP_TIMEOUT", "10")),
+        )
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.host)
+
+    def send(self, params: dict[str, Any]) -> dict[str, Any]:
+        with self._connection() as holder:
+            return self._deliver(holder, params)
+
+    def send_batch(self, emails: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """Send over one connection, a rejected message gets an `error` result.
+
+        A connection failure or timeout partway raises `PartialBatchError`
+        with the results of the messages already sent.
+        """
+        if len(emails) > BATCH_LIMIT:
+            raise ValueError(f"Batch of {len(emails)} exceeds limit of {BATCH_LIMIT}")
+        with self._connection() as holder:
+            return send_each(lambda params: self._deliver(holder, params), emails)
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def _open(self, timeout: float) -> _Connection:
+        if not self.host:
+            raise EmailProviderError("Email service not configured")
+        if self.use_ssl:
+            smtp = smtplib.SMTP_SSL(self.host, self.port, timeout=timeout, context=self._ssl_context)
+        else:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=timeout)
+        try:
+            if self.starttls:
+                smtp.starttls(context=self._ssl_context)
+            if self.username:
+                smtp.login(self.username, self.password or "")
+        except BaseException:
+            smtp.close()
+            raise
+        self.connections_opened += 1
+        return _Connection(smtp)
+
+    @contextlib.contextmanager
+    def _connection(self) -> Iterator[list[_Connection | None]]:
+        """Check out a pooled connection, held in a one-item list so it can be replaced."""
+        left = remaining()
+        if not self._slots.acquire(timeout=None if left is None else max(0.0, left)):
+            raise DeadlineExceeded("Deadline exceeded waiting for an SMTP connection")
+        holder: list[_Connection | None] = [None]
+        try:
+            now = time.monotonic()
+            stale = []
+            with self._lock:
+                while self._idle and holder[0] is None:
+                    conn = self._idle.pop()
+                    if now - conn.last_used > self.idle_timeout:
+                        stale.append(conn)
+                    else:
+                        holder[0] = conn
+            for conn in stale:
+                conn.close()
+            yield holder
+        finally:
+            conn = holder[0]
+            if conn is not None:
+                if conn.messages >= self.max_messages_per_connection:
+                    conn.close()
+                else:
+                    conn.last_used = time.monotonic()
+                    with self._lock:
+                        self._idle.append(conn)
+            self._slots.release()
+
+    def _deliver(self, holder: list[_Connection | None], params: dict[str, Any]) -> dict[str, Any]:
+        msg, sender, recipients = build_message(params)
+        # A pooled connection may have been dropped by the server while idle,
+        # that is retried once on a new one. A fresh connection failing is an error.
+        for retry in (True, False):
+            conn = holder[0]
+            if conn is not None and conn.messages >= self.max_messages_per_connection:
+                conn.close()
+                conn = holder[0] = None
+            reused = conn is not None
+            # Capped by the caller's deadline, pooled connections get it reset on every use
+            timeout = budget(self.timeout)
+            start = time.perf_counter()
+            try:
+                if conn is None:
+                    conn = holder[0] = self._open(timeout)
+                else:
+                    conn.smtp.sock.settimeout(timeout)
+                conn.smtp.send_message(msg, sender, recipients)
+            except smtplib.SMTPRecipientsRefused as e:
+                provider_latency.labels("smtp").observe(time.perf_counter() - start)
+                provider_errors.labels("smtp", "rejected").inc()
+                raise EmailProviderError(f"Recipients refused: {', '.join(e.recipients)}", retryable=False) from e
+            except smtplib.SMTPResponseException as e:
+                provider_latency.labels("smtp").observe(time.perf_counter() - start)
+                transient = e.smtp_code < 500
+                provider_errors.labels("smtp", "smtp_4xx" if transient else "smtp_5xx").inc()
+                if e.smtp_code == 421 and holder[0] is not None:
+                    # Service closing the session
+                    holder[0].close()
+                    holder[0] = None
+                message = e.smtp_error.decode(errors="replace") if isinstance(e.smtp_error, bytes) else str(e.smtp_error)
+                raise EmailProviderError(f"SMTP {e.smtp_code}: {message}", retryable=transient) from e
+            except (smtplib.SMTPException, OSError) as e:
+                provider_latency.labels("smtp").observe(time.perf_counter() - start)
+                if holder[0] is not None:
+                    holder[0].smtp.close()
+                    holder[0] = None
+                if reused and retry:
+                    continue
+                provider_errors.labels("smtp", "timeout" if isinstance(e, TimeoutError) else "connection").inc()
+                raise EmailProviderError(f"SMTP server unreachable: {e}") from e
+            provider_latency.labels("smtp").observe(time.perf_counter() - start)
+            conn.messages += 1
+            return {"id": msg["Message-ID"].strip("<>")}
+        raise AssertionError("unreachable")
+
+
+class MemoryTransport(EmailTransport):
+    """Keeps the last `max_messages` sent, and appends each to `path` as a JSON line."""
+
+    def __init__(self, path: str | None = None, max_messages: int = 10_000):
+        self.name = "file" if path else "memory"
+        self.path = path
+        self.sent: deque[dict[str, Any]] = deque(maxlen=max_messages)
+        self._lock = threading.Lock()
+        self._file = None
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._file = open(path, "a", encoding="utf-8")
+
+    def send(self, params: dict[str, Any]) -> dict[str, Any]:
+        entry = {"id": str(uuid.uuid4()), "sent_at": time.time(), **params}
+        with self._lock:
+            self.sent.append(entry)
+            if self._file is not None:
+                self._file.write(json.dumps(entry, default=str) + "\n")
+                self._file.flush()
+        return {"id": entry["id"]}
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class CircuitBreakerTransport(EmailTransport):
+    """Guards a transport with a circuit breaker, so sends fail fast while it is down.
+
+    Retryable failures (timeouts, connection errors, 5xx, rate limiting) count
+    towards opening the breaker. A rejected message means the provider is up,
+    and any other exception, the caller's deadline running out included,
+    leaves the breaker as it was.
+    While the breaker is open sends raise `ProviderUnavailable` without
+    touching the provider, so callers don't wait out a timeout per send.
+    """
+
+    def __init__(self, transport: EmailTransport, breaker: CircuitBreaker):
+        self.transport = transport
+        self.breaker = breaker
+        self.name = transport.name
+
+    @property
+    def configured(self) -> bool:
+        return self.transport.configured
+
+    @property
+    def available(self) -> bool:
+        return self.breaker.state != CircuitState.OPEN
+
+    def send(self, params: dict[str, Any]) -> dict[str, Any]:
+        return self._guarded(lambda: self.transport.send(params))
+
+    def send_batch(self, emails: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        return self._guarded(lambda: self.transport.send_batch(emails))
+
+    def close(self) -> None:
+        self.transport.close()
+
+    def _guarded(self, call):
+        left = remaining()
+        if left is not None and left <= 0:
+            # Out of budget before the call, says nothing about the provider
+            raise DeadlineExceeded("Deadline exceeded")
+        if not self.breaker.allow():
+            raise ProviderUnavailable(self.name, self.breaker.retry_after())
+        try:
+            result = call()
+        except EmailProviderError as e:
+            if e.retryable:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            raise
+        except DeadlineExceeded:
+            # The caller ran out of budget, e.g. waiting for a pooled connection,
+            # says nothing about the provider
+            self.breaker.release_trial()
+            raise
+        except OSError:
+            # Connection errors and timeouts, smtplib.SMTPException included.
+            # Settles a half-open trial call as well
+            self.breaker.record_failure()
+            raise
+        except Exception:
+            # A bug or a bad message, says nothing about the provider
+            self.breaker.release_trial()
+            raise
+        self.breaker.record_success()
+        return result
+
+
+class FailoverTransport(EmailTransport):
+    """Tries each configured transport in order until one accepts the send.
+
+    Only retryable failures fail over, a message the provider rejected would be
+    rejected by the next one as well.
+    """
+
+    name = "failover"
+
+    def __init__(self, transports: list[EmailTransport]):
+        self.transports = transports
+
+    @property
+    def configured(self) -> bool:
+        return any(t.configured for t in self.transports)
+
+    @property
+    def available(self) -> bool:
+        return any(t.available for t in self.transports if t.configured)
+
+    def send(self, params: dict[str, Any]) -> dict[str, Any]:
+        return self._attempt(lambda t: t.send(params))
+
+    def send_batch(self, emails: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """Fails over only the emails the previous transport didn't send."""
+        if len(emails) > BATCH_LIMIT:
+            raise ValueError(f"Batch of {len(emails)} exceeds limit of {BATCH_LIMIT}")
+        results: list[dict[str, Any] | None] = [None] * len(emails)
+        pending = list(range(len(emails)))
+        last_error: EmailProviderError | None = None
+        for transport in self.transports:
+            if not transport.configured:
+                continue
+            try:
+                sent, error = transport.send_batch([emails[i] for i in pending]), None
+            except PartialBatchError as e:
+                sent, error = e.results, e
+            except Exception as e:
+                sent, error = [], e
+            for i, result in zip(pending, sent):
+                results[i] = result
+            if error is None:
+                return results
+            if not getattr(error, "retryable", False):
+                raise PartialBatchError.wrap(results, error)
+            pending = [i for i in pending if results[i] is None]
+            if not isinstance(error, ProviderUnavailable):
+                logger.warning(
+                    "Email transport %s failed, failing over %d emails: %s", transport.name, len(pending), error
+                )
+            last_error = error
+        raise PartialBatchError.wrap(results, last_error or EmailProviderError("Email service not configured"))
+
+    def close(self) -> None:
+        for transport in self.transports:
+            transport.close()
+
+    def _attempt(self, call):
+        last_error: EmailProviderError | None = None
+        for transport in self.transports:
+            if not transport.configured:
+                continue
+            try:
+                return call(transport)
+            except EmailProviderError as e:
+                if not e.retryable:
+                    raise
+                if not isinstance(e, ProviderUnavailable):
+                    logger.warning("Email transport %s failed, failing over: %s", transport.name, e)
+                last_error = e
+        raise last_error or EmailProviderError("Email service not configured")
+
+
+TRANSPORTS = {
+    "resend": ResendClient.from_env,
+    "smtp": SMTPTransport.from_env,
+    "memory": MemoryTransport,
+    "file": lambda: MemoryTransport(os.environ.get("EMAIL_SINK_PATH", "data/email_sink.jsonl")),
+}
+
+
+# In-process sinks never fail, the others get a circuit breaker each
+UNGUARDED_TRANSPORTS = {"memory", "file"}
+
+
+def transport_from_env() -> EmailTransport:
+    names = [n.strip() for n in os.environ.get("EMAIL_TRANSPORT", "resend").split(",") if n.strip()]
+    unknown = [n for n in names if n not in TRANSPORTS]
+    if unknown or not names:
+        raise ValueError(f"Unknown EMAIL_TRANSPORT {', '.join(unknown)}, expected one of {', '.join(TRANSPORTS)}")
+    transports = [
+        TRANSPORTS[name]() if name in UNGUARDED_TRANSPORTS else CircuitBreakerTransport(
+            TRANSPORTS[name](),
+            CircuitBreaker(
+                name,
+                failure_threshold=int(os.environ.get("EMAIL_BREAKER_FAILURES", "5")),
+                reset_timeout=float(os.environ.get("EMAIL_BREAKER_RESET_TIMEOUT", "30")),
+            ),
+        )
+        for name in names
+    ]
+    return transports[0] if len(transports) == 1 else FailoverTransport(transports)
+
+
+def circuit_breakers() -> list[CircuitBreaker]:
+    """Breakers of the shared transport, for monitoring."""
+    transport = get_transport()
+    return [
+        t.breaker
+        for t in getattr(transport, "transports", [transport])
+        if isinstance(t, CircuitBreakerTransport)
+    ]
+
+
+_transport: EmailTransport | None = None
+_transport_lock = threading.Lock()
+
+
+def init_transport() -> EmailTransport:
+    """Build the shared transport from the environment, called at app startup."""
+    global _transport
+    with _transport_lock:
+        if _transport is not None:
+            _transport.close()
+        _transport = transport_from_env()
+        logger.info("Sending email through %s", ",".join(
+            t.name for t in getattr(_transport, "transports", [_transport])
+        ))
+        return _transport
+
+
+def get_transport() -> EmailTransport:
+    """Return the shared transport, building it on first use outside the app."""
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = transport_from_env()
+    return _transport
+
+
+def close_transport() -> None:
+    global _transport
+    with _transport_lock:
+        if _transport is not None:
+            _transport.close()
+            _transport = None
+
+
+__all__ = [
+    "CircuitBreakerTransport",
+    "FailoverTransport",
+    "MemoryTransport",
+    "SMTPTransport",
+    "TRANSPORTS",
+    "build_message",
+    "circuit_breakers",
+    "close_transport",
+    "get_transport",
+    "init_transport",
+    "transport_from_env",
+]
@@ -0,0 +1,103 @@
+"""Replay protection for form submissions.
+
+Requests are keyed by the client's `Idempotency-Key` header, or by a hash of
+the request model when no key is sent. The first successful response for a
+key is kept in a bounded TTL cache and returned for repeats, concurrent
+duplicates wait for the first request instead of running in parallel.
+
+A key is bound to a hash of the request it was first used with: reusing it
+for a different request raises `IdempotencyKeyReused` rather than replaying
+the first response and dropping the new submission.
+
+Usage:
+
+    from app.libs.idempotency import submissions
+
+    key = submissions.key("contact", request, idempotency_key)
+    return await submissions.run(key, lambda: _send_contact_form(request))
+"""
+
+import asyncio
+import hashlib
+import os
+from typing import Awaitable, Callable, NamedTuple, TypeVar
+
+from pydantic import BaseModel
+
+from app.libs.ttl_cache import TTLCache
+
+R = TypeVar("R")
+
+
+class IdempotencyKeyReused(Exception):
+    pass
+
+
+class SubmissionKey(NamedTuple):
+    key: str
+    # Hash of the request, must match for a repeat
+    fingerprint: str
+
+
+class IdempotencyCache:
+    def __init__(self, maxsize: int = 10_000, ttl: float = 600.0):
+        self._responses: TTLCache[str, tuple[str, BaseModel]] = TTLCache(maxsize=maxsize, ttl=ttl)
+        # Only touched from the event loop, so no lock
+        self._inflight: dict[str, tuple[str, asyncio.Event]] = {}
+
+    @staticmethod
+    def key(scope: str, request: BaseModel, idempotency_key: str | None) -> SubmissionKey:
+        digest = hashlib.sha256(request.model_dump_json().encode()).hexdigest()
+        if idempotency_key:
+            return SubmissionKey(f"{scope}:key:{idempotency_key}", digest)
+        return SubmissionKey(f"{scope}:hash:{digest}", digest)
+
+    async def run(
+        self,
+        key: SubmissionKey,
+        handler: Callable[[], Awaitable[R]],
+        cacheable: Callable[[R], bool] = lambda response: getattr(response, "success", True),
+    ) -> R:
+        """Return the cached response for `key` or await `handler` once for it.
+
+        Raises `IdempotencyKeyReused` if the key was used for a different request.
+        """
+        while True:
+            cached = self._responses.get(key.key)
+            if cached is not None:
+                self._check(key, cached[0])
+                return cached[1].model_copy()
+            waiting = self._inflight.get(key.key)
+            if waiting is None:
+                done = asyncio.Event()
+                self._inflight[key.key] = (key.fingerprint, done)
+                break
+            self._check(key, waiting[0])
+            await waiting[1].wait()
+
+        try:
+            response = await handler()
+            if cacheable(response):
+                self._responses.set(key.key, (key.fingerprint, response))
+            return response
+        finally:
+            del self._inflight[key.key]
+            done.set()
+
+    @staticmethod
+    def _check(key: SubmissionKey, fingerprint: str) -> None:
+        if fingerprint != key.fingerprint:
+            raise IdempotencyKeyReused("Idempotency-Key was already used for a different request")
+
+
+submissions = IdempotencyCache(
+    maxsize=int(os.environ.get("IDEMPOTENCY_MAX_KEYS", "10000")),
+    ttl=float(os.environ.get("IDEMPOTENCY_TTL", "600")),
+)
+
+__all__ = [
+    "IdempotencyCache",
+    "IdempotencyKeyReused",
+    "SubmissionKey",
+    "submissions",
+]
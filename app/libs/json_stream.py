@@ -0,0 +1,197 @@
+"""Incremental JSON parsing of a request body as it streams in.
+
+`JSONStreamReader` walks a JSON document chunk by chunk. Object members and
+array elements are handed out one at a time, so a caller can validate and keep
+a compact form of each element instead of materialising the whole document,
+and can stop as soon as a limit is exceeded. Only the unparsed tail of the
+input is buffered, and a string longer than `max_string` is rejected before its
+end has arrived.
+
+Usage:
+
+    from app.libs.json_stream import JSONStreamReader
+
+    reader = JSONStreamReader(request.stream())
+    async for key in reader.fields():
+        if key == "to":
+            async for item in reader.iter_array():
+                ...
+        else:
+            value = await reader.read_value(max_string=64 * 1024)
+    await reader.finish()
+"""
+
+import codecs
+import json
+from typing import Any, AsyncIterable, AsyncIterator
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+_DELIMITERS = frozenset(",]}" + _WHITESPACE)
+MAX_DEPTH = 64
+
+
+class ValueTooLarge(ValueError):
+    pass
+
+
+class JSONStreamReader:
+    """Pull parser over an async iterable of byte chunks.
+
+    `fields` and `iter_array` yield before the member or element value has been
+    read, the caller must consume each one with `read_value`, `iter_array` or
+    `fields` before asking for the next. Malformed input raises
+    `json.JSONDecodeError` with the position relative to the current buffer.
+    """
+
+    def __init__(self, chunks: AsyncIterable[bytes]):
+        self._chunks = aiter(chunks)
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+        self._depth = 0
+
+    async def _fill(self) -> bool:
+        """Append the next chunk, False once the input is exhausted."""
+        if self._eof:
+            return False
+        try:
+            text = self._utf8.decode(await anext(self._chunks))
+        except StopAsyncIteration:
+            self._eof = True
+            text = self._utf8.decode(b"", final=True)
+        # Drop the consumed prefix, so only the unparsed tail stays buffered
+        self._buf = self._buf[self._pos:] + text
+        self._pos = 0
+        return True
+
+    def _error(self, message: str) -> json.JSONDecodeError:
+        return json.JSONDecodeError(message, self._buf, self._pos)
+
+    async def peek(self) -> str:
+        """Next non-whitespace character, '' at the end of the input."""
+        while True:
+            buf, pos = self._buf, self._pos
+            while pos < len(buf) and buf[pos] in _WHITESPACE:
+                pos += 1
+            self._pos = pos
+            if pos < len(buf):
+                return buf[pos]
+            if not await self._fill():
+                return ""
+
+    async def _expect(self, char: str) -> None:
+        if await self.peek() != char:
+            raise self._error(f"Expecting {char!r}")
+        self._pos += 1
+
+    async def _buffer_string(self, max_string: int | None) -> None:
+        """Buffer until the string starting at the current position is closed."""
+        scan = 1
+        while True:
+            buf, start = self._buf, self._pos
+            i = buf.find('"', start + scan)
+            while i != -1:
+                backslashes = 0
+                while buf[i - 1 - backslashes] == "\\":
+                    backslashes += 1
+                if backslashes % 2 == 0:
+                    return
+                i = buf.find('"', i + 1)
+            scan = len(buf) - start
+            if max_string is not None and scan > max_string + 1:
+                raise ValueTooLarge(f"String longer than {max_string} characters")
+            if not await self._fill():
+                raise self._error("Unterminated string")
+
+    async def _buffer_scalar(self) -> None:
+        """Buffer until the number or literal at the current position is delimited."""
+        scan = 0
+        while True:
+            buf, start = self._buf, self._pos
+            for i in range(start + scan, len(buf)):
+                if buf[i] in _DELIMITERS:
+                    return
+            scan = len(buf) - start
+            if not await self._fill():
+                return
+
+    async def read_value(self, max_string: int | None = None) -> Any:
+        """Parse the next value, containers are read member by member."""
+        first = await self.peek()
+        if first == "{":
+            return {key: await self.read_value(max_string) async for key in self.fields()}
+        if first == "[":
+            return [item async for item in self.iter_array(max_string)]
+        if first == "":
+            raise self._error("Expecting value")
+        if first == '"':
+            await self._buffer_string(max_string)
+        else:
+            await self._buffer_scalar()
+        value, end = _decoder.raw_decode(self._buf, self._pos)
+        self._pos = end
+        if max_string is not None and isinstance(value, str) and len(value) > max_string:
+            raise ValueTooLarge(f"String longer than {max_string} characters")
+        return value
+
+    async def fields(self) -> AsyncIterator[str]:
+        """Keys of the object at the current position, read each value before the next."""
+        await self._expect("{")
+        self._enter()
+        try:
+            if await self.peek() == "}":
+                self._pos += 1
+                return
+            while True:
+                if await self.peek() != '"':
+                    raise self._error("Expecting property name enclosed in double quotes")
+                key = await self.read_value()
+                await self._expect(":")
+                yield key
+                char = await self.peek()
+                self._pos += 1
+                if char == "}":
+                    return
+                if char != ",":
+                    self._pos -= 1
+                    raise self._error("Expecting ',' delimiter")
+        finally:
+            self._depth -= 1
+
+    async def iter_array(self, max_string: int | None = None) -> AsyncIterator[Any]:
+        """Elements of the array at the current position, one at a time."""
+        await self._expect("[")
+        self._enter()
+        try:
+            if await self.peek() == "]":
+                self._pos += 1
+                return
+            while True:
+                yield await self.read_value(max_string)
+                char = await self.peek()
+                self._pos += 1
+                if char == "]":
+                    return
+                if char != ",":
+                    self._pos -= 1
+                    raise self._error("Expecting ',' delimiter")
+        finally:
+            self._depth -= 1
+
+    async def finish(self) -> None:
+        """Check that nothing but whitespace follows the document."""
+        if await self.peek() != "":
+            raise self._error("Extra data")
+
+    def _enter(self) -> None:
+        self._depth += 1
+        if self._depth > MAX_DEPTH:
+            raise self._error("Document nested too deeply")
+
+
+__all__ = [
+    "JSONStreamReader",
+    "ValueTooLarge",
+]
@@ -0,0 +1,193 @@
+"""JWKS signing keys kept warm outside the request path.
+
+`JWKSKeyManager` fetches the key set once at startup and refreshes it on a
+background thread. Lookups never wait on the network for a known `kid`: while
+a refresh is running, requests keep using the previous key set, and a failed
+refresh keeps it too.
+
+An unknown `kid` (usually a key rotation) triggers a refresh. Concurrent misses
+share a single fetch, and refreshes for unknown keys are spaced at least
+`min_refresh_interval` apart, failed fetches included, so an outage of the
+identity provider doesn't turn every such token into another fetch. A `kid`
+that is still unknown after a refresh is remembered for `negative_ttl`, so
+tokens with garbage key ids cannot cause a fetch storm.
+
+Usage:
+
+    from app.libs.jwks import JWKSKeyManager
+
+    keys = JWKSKeyManager("https://example.com/.well-known/jwks.json")
+    keys.start()
+    signing_key = keys.get_signing_key_from_jwt(token)
+    ...
+    keys.stop()
+"""
+
+import logging
+import threading
+import time
+from typing import Any
+
+import jwt
+import requests
+from jwt import PyJWK, PyJWKSet
+
+from app.libs.metrics import Counter
+from app.libs.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+jwks_fetches = Counter("jwks_fetches_total", "JWKS key set fetches by result", ["result"])
+
+
+class JWKSError(Exception):
+    pass
+
+
+class JWKSKeyManager:
+    def __init__(
+        self,
+        url: str,
+        refresh_interval: float = 300.0,
+        min_refresh_interval: float = 10.0,
+        negative_ttl: float = 60.0,
+        timeout: float = 5.0,
+    ):
+        self.url = url
+        self.refresh_interval = refresh_interval
+        self.min_refresh_interval = min_refresh_interval
+        self.timeout = timeout
+        self.fetches = 0
+        self._keys: dict[str, PyJWK] = {}
+        self._fetched_at = 0.0
+        # Last fetch started, successful or not, spaces out refreshes for misses
+        self._attempted_at = 0.0
+        self._unknown: TTLCache[str, bool] = TTLCache(maxsize=10_000, ttl=negative_ttl)
+        self._lock = threading.Lock()
+        self._inflight: threading.Event | None = None
+        self._session = requests.Session()
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        """Prefetch the key set and start refreshing it in the background."""
+        try:
+            self.refresh()
+        except JWKSError as e:
+            logger.warning("JWKS prefetch from %s failed: %s", self.url, e)
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="jwks-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.timeout + 1)
+            self._thread = None
+        self._session.close()
+
+    def get_signing_key_from_jwt(self, token: str) -> PyJWK:
+        try:
+            kid = jwt.get_unverified_header(token).get("kid")
+        except jwt.PyJWTError as e:
+            raise JWKSError(f"Invalid token header: {e}") from e
+        if not kid:
+            raise JWKSError("Token has no kid")
+        return self.get_signing_key(kid)
+
+    def get_signing_key(self, kid: str) -> PyJWK:
+        key = self._keys.get(kid)
+        if key is not None:
+            return key
+        if self._unknown.get(kid):
+            raise JWKSError(f"Unknown signing key {kid!r}")
+
+        keys = self._refresh_for_miss()
+        key = keys.get(kid)
+        if key is None:
+            self._unknown.set(kid, True)
+            raise JWKSError(f"Unknown signing key {kid!r}")
+        return key
+
+    def refresh(self) -> dict[str, PyJWK]:
+        """Fetch the key set now, joining a fetch that is already running."""
+        with self._lock:
+            waiting = self._inflight
+            if waiting is None:
+                done = self._inflight = threading.Event()
+                self._attempted_at = time.monotonic()
+        if waiting is not None:
+            waiting.wait()
+            return self._keys
+
+        try:
+            keys = self._fetch()
+            self._set_keys(keys)
+            return keys
+        finally:
+            with self._lock:
+                self._inflight = None
+            done.set()
+
+    def _refresh_for_miss(self) -> dict[str, PyJWK]:
+        if time.monotonic() - self._attempted_at < self.min_refresh_interval and self._inflight is None:
+            return self._keys
+        try:
+            return self.refresh()
+        except JWKSError as e:
+            logger.warning("JWKS refresh from %s failed: %s", self.url, e)
+            return self._keys
+
+    def _set_keys(self, keys: dict[str, PyJWK], fetched_at: float | None = None) -> None:
+        with self._lock:
+            self._keys = keys
+            self._fetched_at = time.monotonic() if fetched_at is None else fetched_at
+        # Keys that just appeared must not stay negatively cached
+        self._unknown.clear()
+
+    def _fetch(self) -> dict[str, PyJWK]:
+        return self._parse(self._fetch_document())
+
+    def _fetch_document(self) -> dict[str, Any]:
+        self.fetches += 1
+        try:
+            response = self._session.get(self.url, timeout=self.timeout)
+            response.raise_for_status()
+            data: dict[str, Any] = response.json()
+        except (requests.RequestException, ValueError) as e:
+            jwks_fetches.labels("error").inc()
+            raise JWKSError(str(e)) from e
+        jwks_fetches.labels("ok").inc()
+        return data
+
+    @staticmethod
+    def _parse(data: dict[str, Any]) -> dict[str, PyJWK]:
+        try:
+            jwk_set = PyJWKSet.from_dict(data)
+        except (ValueError, jwt.PyJWTError) as e:
+            raise JWKSError(str(e)) from e
+        keys = {
+            jwk.key_id: jwk
+            for jwk in jwk_set.keys
+            if jwk.key_id and jwk.public_key_use in ("sig", None)
+        }
+        if not keys:
+            raise JWKSError("JWKS contains no signing keys")
+        return keys
+
+    def _run(self) -> None:
+        delay = self.refresh_interval
+        while not self._stopped.wait(delay):
+            try:
+                self.refresh()
+                delay = self.refresh_interval
+            except JWKSError as e:
+                # Keep serving the stale keys and retry sooner
+                logger.warning("JWKS refresh from %s failed: %s", self.url, e)
+                delay = min(self.refresh_interval, max(self.min_refresh_interval, delay / 2))
+
+
+__all__ = [
+    "JWKSError",
+    "JWKSKeyManager",
+]
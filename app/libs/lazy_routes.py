@@ -0,0 +1,183 @@
+"""Route table from a cached manifest, with API modules imported on first use.
+
+In fast-startup mode the app doesn't import `app/apis/*` at all. It registers
+one `LazyRoute` placeholder per route listed in the manifest, which records the
+paths and methods each API router exposed the last time it was imported. The
+first request to a placeholder imports that API module off the event loop,
+swaps the placeholders for the real routes and re-dispatches the request.
+Warm-up can load selected APIs in the background right after startup.
+
+The manifest is keyed by the size and mtime of every API module, so a stale
+manifest is never used, the caller then imports eagerly and rewrites it.
+
+Usage:
+
+    from app.libs.lazy_routes import build_manifest, lazy_routes, read_manifest
+
+    manifest = read_manifest("data/route_manifest.json", apis_path, names)
+    routes, apis = lazy_routes(manifest, "app.apis.", "/routes")
+    app.router.routes.extend(routes)
+    ...
+    await apis["emailer"].load(app)
+"""
+
+import asyncio
+import importlib
+import json
+import logging
+import os
+import pathlib
+import time
+from typing import Any
+
+from fastapi import APIRouter, FastAPI
+from starlette.routing import BaseRoute, Match, NoMatchFound, compile_path
+from starlette.types import Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+
+
+def fingerprint(apis_path: pathlib.Path, names: list[str]) -> dict[str, list[int]]:
+    fp = {}
+    for name in names:
+        stat = (apis_path / name / "__init__.py").stat()
+        fp[name] = [stat.st_mtime_ns, stat.st_size]
+    return fp
+
+
+def build_manifest(routers: dict[str, APIRouter], fp: dict[str, list[int]]) -> dict[str, Any]:
+    return {
+        "version": MANIFEST_VERSION,
+        "fingerprint": fp,
+        "routers": {
+            name: [
+                {
+                    "path": route.path,
+                    "methods": sorted(route.methods) if getattr(route, "methods", None) else None,
+                }
+                for route in router.routes
+                if hasattr(route, "path")
+            ]
+            for name, router in routers.items()
+        },
+    }
+
+
+def read_manifest(
+    path: str, apis_path: pathlib.Path, names: list[str]
+) -> dict[str, Any] | None:
+    """The manifest at `path` if it matches the current API modules, else None."""
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    if manifest.get("fingerprint") != fingerprint(apis_path, names):
+        return None
+    return manifest
+
+
+def write_manifest(path: str, manifest: dict[str, Any]) -> None:
+    target = pathlib.Path(path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_suffix(".tmp")
+    tmp.write_text(json.dumps(manifest, separators=(",", ":")))
+    os.replace(tmp, target)
+
+
+class LazyAPI:
+    """One API module, imported and mounted on the app the first time it is needed."""
+
+    def __init__(self, name: str, module: str, prefix: str):
+        self.name = name
+        self.module = module
+        self.prefix = prefix
+        self.loaded = False
+        self._loading: asyncio.Future | None = None
+
+    async def load(self, app: FastAPI) -> None:
+        if self.loaded:
+            return
+        if self._loading is None:
+            self._loading = asyncio.ensure_future(self._load(app))
+        try:
+            await asyncio.shield(self._loading)
+        except Exception:
+            # Let the next request try again
+            self._loading = None
+            raise
+
+    async def _load(self, app: FastAPI) -> None:
+        start = time.perf_counter()
+        module = await asyncio.to_thread(importlib.import_module, self.module)
+        router = getattr(module, "router", None)
+        if not isinstance(router, APIRouter):
+            raise RuntimeError(f"API '{self.name}' does not have a valid APIRouter object.")
+        app.router.routes[:] = [
+            route for route in app.router.routes
+            if not (isinstance(route, LazyRoute) and route.api is self)
+        ]
+        app.include_router(router, prefix=self.prefix)
+        self.loaded = True
+        logger.info("Loaded API %s in %.1fms", self.name, (time.perf_counter() - start) * 1000)
+
+
+class LazyRoute(BaseRoute):
+    """Placeholder matching a manifest path, loads its API and re-dispatches."""
+
+    def __init__(self, path: str, methods: list[str] | None, api: LazyAPI):
+        self.path = path
+        self.methods = set(methods) if methods else None
+        self.api = api
+        self.path_regex, self.path_format, self.param_convertors = compile_path(path)
+
+    def matches(self, scope: Scope) -> tuple[Match, Scope]:
+        if scope["type"] in ("http", "websocket") and self.path_regex.match(scope["path"]):
+            # Method checks are left to the real route once loaded
+            return Match.FULL, {}
+        return Match.NONE, {}
+
+    def url_path_for(self, name: str, /, **path_params: Any):
+        raise NoMatchFound(name, path_params)
+
+    async def handle(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await self.api.load(scope["app"])
+        await scope["router"](scope, receive, send)
+
+
+def lazy_routes(
+    manifest: dict[str, Any], module_prefix: str, prefix: str
+) -> tuple[list[LazyRoute], dict[str, LazyAPI]]:
+    routes: list[LazyRoute] = []
+    apis: dict[str, LazyAPI] = {}
+    for name, entries in manifest["routers"].items():
+        api = apis[name] = LazyAPI(name, module_prefix + name, prefix)
+        routes.extend(
+            LazyRoute(prefix + entry["path"], entry["methods"], api) for entry in entries
+        )
+    return routes, apis
+
+
+async def warm_up(app: FastAPI, apis: list[LazyAPI]) -> None:
+    """Load `apis` one after another, so the first requests don't pay for the imports."""
+    for api in apis:
+        try:
+            await api.load(app)
+        except Exception:
+            logger.exception("Warm-up of API %s failed", api.name)
+
+
+__all__ = [
+    "LazyAPI",
+    "LazyRoute",
+    "build_manifest",
+    "fingerprint",
+    "lazy_routes",
+    "read_manifest",
+    "warm_up",
+    "write_manifest",
+]
@@ -0,0 +1,276 @@
+"""Page registry for the SEO sitemaps, fed from local JSON or CSV catalogues.
+
+Each catalogue holds one record per page (channels, VOD titles, ...) with a
+`url` (absolute or site-relative) and optional `lastmod`, `changefreq` and
+`priority`, any other fields count as page content. Records are split into
+shards that respect the sitemap protocol limits of 50,000 URLs and 50 MB per
+file, and shards are rendered on demand by a generator.
+
+Invalid `lastmod`, `changefreq` and `priority` values are dropped at load time
+with a warning, so one bad record can't break a whole shard.
+
+Without an explicit `lastmod` a page's last modification date is the day its
+content hash was first seen, tracked in a small state file, so unchanged pages
+and shards keep their dates and validators across restarts.
+
+Usage:
+
+    from app.libs.page_registry import PageRegistry
+
+    registry = PageRegistry(["catalogue/channels.csv"], "data/sitemap_state.json")
+    snapshot = registry.snapshot()
+    for chunk in registry.iter_shard(snapshot, 0):
+        ...
+"""
+
+import csv
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import date, datetime
+from typing import Any, Iterator, NamedTuple
+from xml.sax.saxutils import escape
+
+# Sitemap protocol limits for a single sitemap file
+MAX_URLS_PER_SITEMAP = 50_000
+MAX_BYTES_PER_SITEMAP = 50 * 1024 * 1024
+
+URLSET_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+)
+URLSET_FOOTER = "</urlset>"
+
+CHANGEFREQS = {"always", "hourly", "daily", "weekly", "monthly", "yearly", "never"}
+
+logger = logging.getLogger(__name__)
+
+
+class PageEntry(NamedTuple):
+    loc: str
+    lastmod: str
+    changefreq: str | None
+    priority: str | None
+
+
+class Shard(NamedTuple):
+    start: int
+    end: int
+    lastmod: str
+    etag: str
+
+
+class CatalogueSnapshot(NamedTuple):
+    entries: list[PageEntry]
+    shards: list[Shard]
+    version: str
+
+
+def render_entry(entry: PageEntry) -> str:
+    parts = [f"  <url>\n    <loc>{entry.loc}</loc>\n    <lastmod>{entry.lastmod}</lastmod>\n"]
+    if entry.changefreq:
+        parts.append(f"    <changefreq>{entry.changefreq}</changefreq>\n")
+    if entry.priority:
+        parts.append(f"    <priority>{entry.priority}</priority>\n")
+    parts.append("  </url>\n")
+    return "".join(parts)
+
+
+def _lastmod(value: Any) -> str | None:
+    """W3C datetime for a date or ISO 8601 timestamp, None if it isn't one."""
+    try:
+        parsed = datetime.fromisoformat(str(value).strip())
+    except ValueError:
+        return None
+    # A time is only meaningful with its offset
+    if parsed.tzinfo is None:
+        return parsed.date().isoformat()
+    return parsed.isoformat(timespec="seconds")
+
+
+def _changefreq(value: Any) -> str | None:
+    value = str(value).strip().lower()
+    return value if value in CHANGEFREQS else None
+
+
+def _priority(value: Any) -> str | None:
+    try:
+        priority = float(value)
+    except (TypeError, ValueError):
+        return None
+    return f"{priority:g}" if 0.0 <= priority <= 1.0 else None
+
+
+def _read_records(path: pathlib.Path) -> list[dict[str, Any]]:
+    if path.suffix.lower() == ".csv":
+        with path.open(newline="", encoding="utf-8") as f:
+            return list(csv.DictReader(f))
+    with path.open(encoding="utf-8") as f:
+        return json.load(f)
+
+
+class PageRegistry:
+    def __init__(
+        self,
+        paths: list[str],
+        state_path: str | None,
+        base_url: str = "https://loufranktv.com",
+        max_urls: int = MAX_URLS_PER_SITEMAP,
+        max_bytes: int = MAX_BYTES_PER_SITEMAP,
+        check_interval: float = 30.0,
+    ):
+        self.paths = [pathlib.Path(p) for p in paths]
+        self.state_path = pathlib.Path(state_path) if state_path else None
+        self.base_url = base_url.rstrip("/")
+        self.max_urls = min(max_urls, MAX_URLS_PER_SITEMAP)
+        self.max_bytes = min(max_bytes, MAX_BYTES_PER_SITEMAP)
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._snapshot = CatalogueSnapshot([], [], "")
+        self._mtimes: tuple[float, ...] | None = None
+        self._checked_at = 0.0
+
+    def snapshot(self) -> CatalogueSnapshot:
+        """Current snapshot, reloaded when a catalogue file has changed."""
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return self._snapshot
+        with self._lock:
+            if now - self._checked_at >= self.check_interval:
+                mtimes = tuple(
+                    p.stat().st_mtime if p.exists() else 0.0 for p in self.paths
+                )
+                if mtimes != self._mtimes:
+                    self._snapshot = self._load()
+                    self._mtimes = mtimes
+                self._checked_at = now
+        return self._snapshot
+
+    def iter_shard(
+        self, snapshot: CatalogueSnapshot, index: int, chunk_size: int = 500
+    ) -> Iterator[bytes]:
+        shard = snapshot.shards[index]
+        yield URLSET_HEADER.encode()
+        for start in range(shard.start, shard.end, chunk_size):
+            end = min(start + chunk_size, shard.end)
+            yield "".join(
+                render_entry(entry) for entry in snapshot.entries[start:end]
+            ).encode()
+        yield URLSET_FOOTER.encode()
+
+    def _load(self) -> CatalogueSnapshot:
+        state = self._read_state()
+        today = date.today().isoformat()
+        seen: dict[str, list[str]] = {}
+        entries: list[PageEntry] = []
+        invalid: Counter[tuple[pathlib.Path, str]] = Counter()
+
+        for path in self.paths:
+            if not path.exists():
+                continue
+            for record in _read_records(path):
+                url = str(record.get("url") or "").strip()
+                if not url or url in seen:
+                    continue
+                content_hash = hashlib.sha256(
+                    json.dumps(record, sort_keys=True, default=str).encode()
+                ).hexdigest()[:16]
+                previous = state.get(url)
+                if previous and previous[0] == content_hash:
+                    first_seen = previous[1]
+                else:
+                    first_seen = today
+                seen[url] = [content_hash, first_seen]
+
+                fields = {}
+                for name, validate in (
+                    ("lastmod", _lastmod), ("changefreq", _changefreq), ("priority", _priority)
+                ):
+                    value = record.get(name)
+                    if value in (None, ""):
+                        fields[name] = None
+                        continue
+                    fields[name] = validate(value)
+                    if fields[name] is None:
+                        invalid[path, name] += 1
+
+                loc = url if "://" in url else self.base_url + "/" + url.lstrip("/")
+                entries.append(
+                    PageEntry(
+                        loc=escape(loc),
+                        lastmod=escape(fields["lastmod"] or first_seen),
+                        changefreq=escape(fields["changefreq"]) if fields["changefreq"] else None,
+                        priority=escape(fields["priority"]) if fields["priority"] else None,
+                    )
+                )
+
+        for (path, name), count in invalid.items():
+            logger.warning("Ignored %d invalid %s values in %s", count, name, path)
+        if seen != state:
+            self._write_state(seen)
+
+        shards = self._shard(entries)
+        version = hashlib.sha256(
+            "".join(shard.etag for shard in shards).encode()
+        ).hexdigest()[:16]
+        return CatalogueSnapshot(entries, shards, version)
+
+    def _shard(self, entries: list[PageEntry]) -> list[Shard]:
+        shards: list[Shard] = []
+        overhead = len(URLSET_HEADER) + len(URLSET_FOOTER)
+        start, size, lastmod = 0, overhead, ""
+        digest = hashlib.sha256()
+
+        for i, entry in enumerate(entries):
+            fragment = render_entry(entry).encode()
+            if i > start and (
+                i - start >= self.max_urls or size + len(fragment) > self.max_bytes
+            ):
+                shards.append(Shard(start, i, lastmod, f'"{digest.hexdigest()[:32]}"'))
+                start, size, lastmod = i, overhead, ""
+                digest = hashlib.sha256()
+            size += len(fragment)
+            lastmod = max(lastmod, entry.lastmod)
+            digest.update(fragment)
+
+        if start < len(entries):
+            shards.append(Shard(start, len(entries), lastmod, f'"{digest.hexdigest()[:32]}"'))
+        return shards
+
+    def _read_state(self) -> dict[str, list[str]]:
+        if self.state_path is None or not self.state_path.exists():
+            return {}
+        try:
+            return json.loads(self.state_path.read_text())
+        except ValueError:
+            return {}
+
+    def _write_state(self, state: dict[str, list[str]]) -> None:
+        if self.state_path is None:
+            return
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        # A unique temp file each, workers may write the state concurrently
+        with tempfile.NamedTemporaryFile(
+            "w", dir=self.state_path.parent, suffix=".tmp", delete=False
+        ) as out:
+            try:
+                out.write(json.dumps(state, separators=(",", ":")))
+            except BaseException:
+                os.unlink(out.name)
+                raise
+        os.replace(out.name, self.state_path)
+
+
+__all__ = [
+    "CatalogueSnapshot",
+    "PageEntry",
+    "PageRegistry",
+    "Shard",
+    "render_entry",
+]
@@ -0,0 +1,249 @@
+"""JWKS key set shared by all worker processes through a memory-mapped file.
+
+With several workers, one of them (the leader, whichever holds an exclusive
+`flock` on the cache's lock file) fetches the key set from the identity
+provider and publishes the signing keys to the mapped file. The others read it
+and never fetch. If the leader exits, the kernel drops its lock and the next
+worker to poll takes over.
+
+The file is a fixed-size header plus the JWKS JSON. Writes are guarded by a
+seqlock: the writer makes the sequence number odd, writes, then makes it even,
+and readers retry a copy that overlapped a write, so reads take no lock.
+Readers only parse the keys when the generation counter changes. A worker that
+sees a `kid` the shared set doesn't know sets the refresh-request field and
+waits for the leader to publish a new generation.
+
+Usage:
+
+    from app.libs.shared_jwks import SharedJWKSCache, SharedJWKSKeyManager
+
+    cache = SharedJWKSCache.for_url("/dev/shm/loufranktv", jwks_url)
+    keys = SharedJWKSKeyManager(jwks_url, cache)
+    keys.start()
+    signing_key = keys.get_signing_key_from_jwt(token)
+"""
+
+import fcntl
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+from typing import Any, NamedTuple
+
+from jwt import PyJWK
+
+from app.libs.jwks import JWKSError, JWKSKeyManager
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"JWKS"
+FORMAT_VERSION = 1
+
+# magic, format version, sequence, generation, fetched at (unix time),
+# refresh requested at (unix ns), payload length
+_HEADER = struct.Struct("<4sIQQdQI")
+_U64 = struct.Struct("<Q")
+_SEQ_OFFSET = 8
+_GENERATION_OFFSET = 16
+_REQUESTED_OFFSET = 32
+_PAYLOAD_OFFSET = 64
+
+
+class Snapshot(NamedTuple):
+    generation: int
+    fetched_at: float
+    payload: bytes
+
+
+class SharedJWKSCache:
+    """One JWKS document in a shared mapped file, written only by the lock holder."""
+
+    def __init__(self, path: str, size: int = 64 * 1024):
+        self.path = path
+        self.size = size
+        self.leader = False
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size < size:
+            # Every process truncates to the same size, racing is harmless
+            os.ftruncate(self._fd, size)
+        self._mm = mmap.mmap(self._fd, size)
+        self._lock_fd = os.open(path + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+
+    @classmethod
+    def for_url(cls, directory: str, url: str, size: int = 64 * 1024) -> "SharedJWKSCache":
+        name = hashlib.sha256(url.encode()).hexdigest()[:16]
+        return cls(os.path.join(directory, f"jwks-{name}.bin"), size)
+
+    def try_lead(self) -> bool:
+        """Become the writer if no other process is, True while this one is."""
+        if not self.leader:
+            try:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            self.leader = True
+            logger.info("Process %d is now the JWKS refresh leader for %s", os.getpid(), self.path)
+        return True
+
+    def read(self, retries: int = 100) -> Snapshot | None:
+        """The published document, None if there is none or it is mid-write."""
+        mm = self._mm
+        for _ in range(retries):
+            before = _U64.unpack_from(mm, _SEQ_OFFSET)[0]
+            if before & 1:
+                time.sleep(0)
+                continue
+            magic, version, _, generation, fetched_at, _, length = _HEADER.unpack_from(mm, 0)
+            payload = mm[_PAYLOAD_OFFSET:_PAYLOAD_OFFSET + min(length, self.size - _PAYLOAD_OFFSET)]
+            if _U64.unpack_from(mm, _SEQ_OFFSET)[0] == before:
+                break
+        else:
+            return None
+        if magic != MAGIC or version != FORMAT_VERSION or generation == 0:
+            return None
+        return Snapshot(generation, fetched_at, payload)
+
+    def publish(self, document: dict[str, Any], fetched_at: float | None = None) -> int:
+        """Write a new generation, only while leader. Returns the generation."""
+        if not self.leader:
+            raise JWKSError("Only the leader publishes to the shared JWKS cache")
+        payload = json.dumps(document, separators=(",", ":")).encode()
+        if len(payload) > self.size - _PAYLOAD_OFFSET:
+            raise JWKSError(f"JWKS of {len(payload)} bytes does not fit the shared cache")
+        mm = self._mm
+        seq = _U64.unpack_from(mm, _SEQ_OFFSET)[0]
+        # Odd while writing, also repairs a sequence left odd by a leader that died mid-write
+        seq |= 1
+        generation = _U64.unpack_from(mm, _GENERATION_OFFSET)[0] + 1
+        requested = _U64.unpack_from(mm, _REQUESTED_OFFSET)[0]
+        _U64.pack_into(mm, _SEQ_OFFSET, seq)
+        mm[_PAYLOAD_OFFSET:_PAYLOAD_OFFSET + len(payload)] = payload
+        _HEADER.pack_into(
+            mm, 0, MAGIC, FORMAT_VERSION, seq, generation,
+            time.time() if fetched_at is None else fetched_at, requested, len(payload),
+        )
+        _U64.pack_into(mm, _SEQ_OFFSET, seq + 1)
+        return generation
+
+    def request_refresh(self) -> None:
+        _U64.pack_into(self._mm, _REQUESTED_OFFSET, time.time_ns())
+
+    def refresh_requested(self) -> int:
+        return _U64.unpack_from(self._mm, _REQUESTED_OFFSET)[0]
+
+    def close(self) -> None:
+        self._mm.close()
+        os.close(self._fd)
+        # Closing the lock file releases leadership
+        os.close(self._lock_fd)
+        self.leader = False
+
+
+def _signing_keys(document: dict[str, Any]) -> dict[str, Any]:
+    """The document reduced to the keys `JWKSKeyManager` uses."""
+    return {
+        "keys": [
+            key for key in document.get("keys", [])
+            if key.get("kid") and key.get("use") in ("sig", None)
+        ]
+    }
+
+
+class SharedJWKSKeyManager(JWKSKeyManager):
+    """`JWKSKeyManager` that fetches only in the leader and otherwise reads `cache`.
+
+    Every `poll_interval` seconds the background thread of a follower checks
+    the generation and tries to take over leadership, the leader serves refresh
+    requests (no more often than `min_refresh_interval`) and the periodic
+    refresh.
+    """
+
+    def __init__(self, url: str, cache: SharedJWKSCache, poll_interval: float = 1.0, **kwargs):
+        super().__init__(url, **kwargs)
+        self.cache = cache
+        self.poll_interval = poll_interval
+        self._generation = 0
+        self._seen_request = 0
+
+    def stop(self) -> None:
+        super().stop()
+        self.cache.close()
+
+    def _fetch(self) -> dict[str, PyJWK]:
+        if self.cache.try_lead():
+            return self._fetch_and_publish()
+        shared = self._load_shared()
+        if shared is not None:
+            return shared[0]
+
+        self.cache.request_refresh()
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            shared = self._load_shared()
+            if shared is not None:
+                return shared[0]
+            if self.cache.try_lead():
+                return self._fetch_and_publish()
+        raise JWKSError("Timed out waiting for the JWKS leader to publish keys")
+
+    def _fetch_and_publish(self) -> dict[str, PyJWK]:
+        document = _signing_keys(self._fetch_document())
+        keys = self._parse(document)
+        try:
+            self._generation = self.cache.publish(document)
+        except JWKSError as e:
+            logger.warning("Failed to share JWKS: %s", e)
+        return keys
+
+    def _load_shared(self) -> tuple[dict[str, PyJWK], float] | None:
+        """Keys and their fetch time from the shared cache, if it holds a new generation."""
+        snapshot = self.cache.read()
+        if snapshot is None or snapshot.generation == self._generation:
+            return None
+        try:
+            keys = self._parse(json.loads(snapshot.payload))
+        except ValueError as e:
+            raise JWKSError(f"Corrupt shared JWKS: {e}") from e
+        self._generation = snapshot.generation
+        return keys, snapshot.fetched_at
+
+    def _run(self) -> None:
+        delay = self.refresh_interval
+        retry_at = 0.0
+        while not self._stopped.wait(self.poll_interval):
+            try:
+                if not self.cache.try_lead():
+                    shared = self._load_shared()
+                    if shared is not None:
+                        # Aged by when the leader fetched them, so a follower
+                        # that takes over refreshes on schedule
+                        keys, fetched_at = shared
+                        age = max(0.0, time.time() - fetched_at)
+                        self._set_keys(keys, time.monotonic() - age)
+                    continue
+
+                now = time.monotonic()
+                requested = self.cache.refresh_requested()
+                if requested != self._seen_request and now - self._attempted_at >= self.min_refresh_interval:
+                    self._seen_request = requested
+                    self.refresh()
+                elif now >= max(self._fetched_at + delay, retry_at):
+                    self.refresh()
+                    delay = self.refresh_interval
+            except JWKSError as e:
+                # Keep serving the stale keys and retry sooner
+                logger.warning("JWKS refresh from %s failed: %s", self.url, e)
+                delay = min(self.refresh_interval, max(self.min_refresh_interval, delay / 2))
+                retry_at = time.monotonic() + delay
+
+
+__all__ = [
+    "SharedJWKSCache",
+    "SharedJWKSKeyManager",
+    "Snapshot",
+]
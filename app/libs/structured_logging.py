@@ -0,0 +1,273 @@
+"""JSON-lines logging that never blocks the calling thread.
+
+`configure_logging` installs a handler on the root logger that only samples,
+stamps and enqueues records, with their message and traceback already rendered
+to text so later changes to the arguments don't show up in the log. A
+dedicated writer thread formats them as JSON objects, one per line, and writes
+them in batches. When the queue is full
+records are dropped and counted instead of stalling the request.
+
+Every line carries the correlation id of the request that produced it, set by
+`CorrelationIdMiddleware` through the `correlation_id` context variable.
+
+High-volume lines go through a `SampledLogger`, which drops a fraction of its
+records below WARNING before they are even built. Rates are set per logger name
+(or prefix) by LOG_SAMPLE_RATES, a JSON object of name to fraction kept.
+
+Usage:
+
+    import logging
+
+    from app.libs.structured_logging import SampledLogger
+
+    logger = logging.getLogger(__name__)
+    logger.info("Email job queued", extra={"job_id": job_id})
+
+    access_logger = SampledLogger(logging.getLogger(__name__ + ".access"))
+    access_logger.info("User %s authenticated", user.sub)
+"""
+
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import traceback
+from typing import IO
+
+correlation_id: contextvars.ContextVar[str | None] = contextvars.ContextVar(
+    "correlation_id", default=None
+)
+
+# Attributes every LogRecord has, anything else was passed through `extra`
+_RECORD_ATTRS = frozenset(
+    vars(logging.LogRecord("", 0, "", 0, "", None, None)).keys()
+) | {"message", "asctime", "correlation_id"}
+
+DEFAULT_SAMPLE_RATES = {
+    # One line per authenticated request
+    "databutton_app.mw.auth_mw.access": 0.01,
+}
+
+
+class JsonFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__()
+        self._encoder = json.JSONEncoder(default=str)
+        self._second = -1
+        self._prefix = ""
+
+    def timestamp(self, created: float) -> str:
+        # Records arrive in time order, so the date part rarely needs rebuilding
+        second = int(created)
+        if second != self._second:
+            self._second = second
+            self._prefix = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(second))
+        return f"{self._prefix}.{int((created - second) * 1000):03d}Z"
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.timestamp(record.created),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        request_id = getattr(record, "correlation_id", None)
+        if request_id is not None:
+            entry["correlation_id"] = request_id
+        for key in record.__dict__.keys() - _RECORD_ATTRS:
+            entry[key] = record.__dict__[key]
+        if record.exc_info:
+            entry["exc"] = "".join(traceback.format_exception(*record.exc_info))
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return self._encoder.encode(entry)
+
+
+def _load_sample_rates() -> dict[str, float]:
+    return {**DEFAULT_SAMPLE_RATES, **json.loads(os.environ.get("LOG_SAMPLE_RATES", "{}"))}
+
+
+# (name, rate) longest name first, so the most specific prefix wins
+_sample_rates: list[tuple[str, float]] = []
+_rate_cache: dict[str, float] = {}
+
+
+def set_sample_rates(rates: dict[str, float]) -> None:
+    global _sample_rates, _rate_cache
+    _sample_rates = sorted(rates.items(), key=lambda item: len(item[0]), reverse=True)
+    _rate_cache = {}
+
+
+def sample_rate(name: str) -> float:
+    rate = _rate_cache.get(name)
+    if rate is None:
+        rate = next(
+            (r for prefix, r in _sample_rates if name == prefix or name.startswith(prefix + ".")),
+            1.0,
+        )
+        _rate_cache[name] = rate
+    return rate
+
+
+set_sample_rates(_load_sample_rates())
+
+
+class SampledLogger(logging.LoggerAdapter):
+    """Keep a sampled fraction of records below WARNING, decided before the record is built."""
+
+    def __init__(self, logger: logging.Logger):
+        super().__init__(logger, None)
+
+    def isEnabledFor(self, level: int) -> bool:
+        if level < logging.WARNING:
+            rate = sample_rate(self.logger.name)
+            if rate < 1.0 and random.random() >= rate:
+                return False
+        return self.logger.isEnabledFor(level)
+
+
+class QueueLogHandler(logging.Handler):
+    """Enqueue records for a writer thread that formats and writes them in batches."""
+
+    def __init__(
+        self,
+        stream: IO[str],
+        max_queue: int = 10_000,
+        batch_size: int = 256,
+        formatter: logging.Formatter | None = None,
+    ):
+        super().__init__()
+        self.stream = stream
+        self.batch_size = batch_size
+        self.dropped = 0
+        self.setFormatter(formatter or JsonFormatter())
+        self.max_queue = max_queue
+        self._queue: queue.SimpleQueue[logging.LogRecord | None] = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        # Context variables, traceback frames and the arguments are only valid
+        # in this thread and at this moment, like QueueHandler.prepare. A copy,
+        # other handlers still get the record as it was
+        try:
+            message = record.getMessage()
+        except Exception:
+            self.handleError(record)
+            return
+        record = copy.copy(record)
+        record.correlation_id = correlation_id.get()
+        record.message = message
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = "".join(traceback.format_exception(*record.exc_info))
+            record.exc_info = None
+        # The bound is approximate under concurrency, which is fine for shedding a backlog
+        if self._queue.qsize() >= self.max_queue:
+            self.dropped += 1
+            return
+        self._queue.put(record)
+
+    # Records are handed over without taking the handler lock, the queue is thread-safe
+    def handle(self, record: logging.LogRecord) -> bool:
+        rv = self.filter(record)
+        if rv:
+            self.emit(record)
+        return rv
+
+    def _run(self) -> None:
+        while True:
+            record = self._queue.get()
+            batch = [record]
+            while record is not None and len(batch) < self.batch_size:
+                try:
+                    record = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(record)
+            self._write([r for r in batch if r is not None])
+            if batch[-1] is None:
+                return
+
+    def _write(self, records: list[logging.LogRecord]) -> None:
+        lines = []
+        for record in records:
+            try:
+                lines.append(self.format(record))
+            except Exception:
+                self.handleError(record)
+        dropped, self.dropped = self.dropped, 0
+        if dropped:
+            lines.append(self.format(logging.LogRecord(
+                __name__, logging.WARNING, __file__, 0, "Dropped %d log records", (dropped,), None
+            )))
+        if lines:
+            try:
+                self.stream.write("\n".join(lines) + "\n")
+                self.stream.flush()
+            except Exception:
+                pass
+
+    def close(self) -> None:
+        """Write out everything queued so far and stop the writer thread."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+        super().close()
+
+
+_handler: QueueLogHandler | None = None
+
+
+def configure_logging(
+    level: str | None = None,
+    stream: IO[str] | None = None,
+    sample_rates: dict[str, float] | None = None,
+) -> QueueLogHandler:
+    """Route all logging through a JSON queue handler, once per process."""
+    global _handler
+    if _handler is not None:
+        return _handler
+
+    if sample_rates is not None:
+        set_sample_rates(sample_rates)
+    handler = QueueLogHandler(
+        stream or sys.stdout,
+        max_queue=int(os.environ.get("LOG_QUEUE_SIZE", "10000")),
+    )
+
+    root = logging.getLogger()
+    root.setLevel((level or os.environ.get("LOG_LEVEL", "INFO")).upper())
+    root.addHandler(handler)
+    _handler = handler
+    atexit.register(shutdown_logging)
+    return handler
+
+
+def shutdown_logging() -> None:
+    global _handler
+    if _handler is not None:
+        logging.getLogger().removeHandler(_handler)
+        _handler.close()
+        _handler = None
+
+
+__all__ = [
+    "JsonFormatter",
+    "QueueLogHandler",
+    "SampledLogger",
+    "configure_logging",
+    "correlation_id",
+    "sample_rate",
+    "set_sample_rates",
+    "shutdown_logging",
+]
@@ -0,0 +1,76 @@
+"""Min-heap of timers keyed by id, with O(log n) insert and lazy cancellation.
+
+Entries are `(due, seq, key)` tuples in a `heapq`, and a dict maps each live
+key to the sequence number of its current entry. Cancelling or rescheduling a
+key only updates the dict, the stale entry is dropped when it reaches the top
+of the heap, or by a compaction once stale entries outnumber live ones. That
+keeps hundreds of thousands of pending timers at one small tuple each, with no
+per-timer callback or handle, and the next due time is always `heap[0]`.
+
+Not thread-safe, callers hold their own lock.
+
+Usage:
+
+    from app.libs.timer_heap import TimerHeap
+
+    timers = TimerHeap()
+    timers.push(job_id, time.time() + 3600)
+    timers.cancel(job_id)
+    for job_id in timers.pop_due(time.time()):
+        ...
+"""
+
+import heapq
+import itertools
+from typing import Hashable, Iterator
+
+
+class TimerHeap:
+    def __init__(self):
+        self._heap: list[tuple[float, int, Hashable]] = []
+        self._live: dict[Hashable, int] = {}
+        self._seq = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._live)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._live
+
+    def push(self, key: Hashable, due: float) -> None:
+        """Schedule `key` at `due`, replacing an earlier schedule of the same key."""
+        seq = next(self._seq)
+        self._live[key] = seq
+        heapq.heappush(self._heap, (due, seq, key))
+        if len(self._heap) > 1024 and len(self._heap) > 2 * len(self._live):
+            self._compact()
+
+    def cancel(self, key: Hashable) -> bool:
+        """Drop the timer of `key`, False if it had none."""
+        return self._live.pop(key, None) is not None
+
+    def next_due(self) -> float | None:
+        """Due time of the earliest live timer, None if there are none."""
+        heap = self._heap
+        while heap and self._live.get(heap[0][2]) != heap[0][1]:
+            heapq.heappop(heap)
+        return heap[0][0] if heap else None
+
+    def pop_due(self, now: float) -> Iterator[Hashable]:
+        """Remove and yield the keys due at or before `now`, earliest first."""
+        heap, live = self._heap, self._live
+        while heap and heap[0][0] <= now:
+            _, seq, key = heapq.heappop(heap)
+            if live.get(key) == seq:
+                del live[key]
+                yield key
+
+    def _compact(self) -> None:
+        live = self._live
+        self._heap = [entry for entry in self._heap if live.get(entry[2]) == entry[1]]
+        heapq.heapify(self._heap)
+
+
+__all__ = [
+    "TimerHeap",
+]
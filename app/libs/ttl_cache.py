@@ -0,0 +1,93 @@
+"""Thread-safe bounded LRU cache with per-entry TTL.
+
+Entries expire after `ttl` seconds (or a per-entry ttl passed to `set`) and
+the least recently used entries are evicted once `maxsize` entries or, when a
+`sizeof` function is given, `max_bytes` total are exceeded.
+
+Usage:
+
+    from app.libs.ttl_cache import TTLCache
+
+    cache = TTLCache(maxsize=10_000, ttl=600)
+    cache.set(key, value)
+    value = cache.get(key)
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Generic, Hashable, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+_MISSING = object()
+
+
+class TTLCache(Generic[K, V]):
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        max_bytes: int | None = None,
+        sizeof: Callable[[V], int] | None = None,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.bytes = 0
+        self._lock = threading.Lock()
+        # key -> (expires_at, size, value), oldest first
+        self._data: OrderedDict[K, tuple[float, int, V]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: K, default: V | None = None) -> V | None:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            expires_at, size, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.bytes -= size
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: K, value: V, ttl: float | None = None) -> None:
+        size = self.sizeof(value) if self.sizeof is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self._data[key] = (expires_at, size, value)
+            self.bytes += size
+            while len(self._data) > self.maxsize or (
+                self.max_bytes is not None and self.bytes > self.max_bytes
+            ):
+                _, (_, evicted_size, _) = self._data.popitem(last=False)
+                self.bytes -= evicted_size
+
+    def pop(self, key: K, default: V | None = None) -> V | None:
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None:
+                return default
+            self.bytes -= entry[1]
+            return entry[2]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+
+__all__ = [
+    "TTLCache",
+]
@@ -0,0 +1,206 @@
+"""Admission control and load shedding for the emailer endpoints.
+
+Each route belongs to a class with its own `AdmissionController`: at most
+`max_in_flight` of its requests run at once, up to `max_queue` more wait in
+FIFO order, and a request that has waited `max_wait` seconds without a slot,
+or finds the queue full, is answered 503 with a Retry-After estimate. Under
+overload latency stays bounded by the queue-time budget and the excess is
+turned away early and cheaply, instead of piling up in the threadpool or the
+event loop with no limit.
+
+The queue is ordered on the event loop, so the controller takes no locks. The
+middleware runs before the body is read.
+"""
+
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+from http import HTTPStatus
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.libs.metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+admission_in_flight = Gauge(
+    "admission_in_flight",
+    "Requests holding an admission slot",
+    ["route_class"],
+)
+admission_queued = Gauge(
+    "admission_queued",
+    "Requests waiting for an admission slot",
+    ["route_class"],
+)
+admission_shed = Counter(
+    "admission_shed_total",
+    "Requests answered 503 by admission control",
+    ["route_class", "reason"],
+)
+
+
+@dataclass(frozen=True)
+class AdmissionLimit:
+    max_in_flight: int
+    max_queue: int
+    # Queue-time budget in seconds
+    max_wait: float
+
+
+DEFAULT_CLASS_LIMITS = {
+    # Validate and enqueue, the provider call happens later in the email queue
+    "submit": {"max_in_flight": 64, "max_queue": 256, "max_wait": 2.0},
+    # Provider batch calls made while the client waits
+    "batch": {"max_in_flight": 4, "max_queue": 16, "max_wait": 10.0},
+}
+
+DEFAULT_ROUTE_CLASSES = {
+    "/routes/contact": "submit",
+    "/routes/welcome": "submit",
+    "/routes/trial-request": "submit",
+    "/routes/send": "submit",
+    "/routes/send-batch": "batch",
+}
+
+
+class Overloaded(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Bounded concurrency with a bounded FIFO queue and a queue-time budget."""
+
+    def __init__(self, name: str, limit: AdmissionLimit):
+        self.name = name
+        self.limit = limit
+        self.in_flight = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        # Moving average of the time a request holds its slot
+        self._service_time = 0.05
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> float:
+        """Seconds until the current queue would have drained."""
+        slots = max(1, self.limit.max_in_flight)
+        return (self.queued + 1) / slots * self._service_time
+
+    async def acquire(self) -> None:
+        """Take a slot, waiting up to `max_wait`, raises `Overloaded` otherwise."""
+        if self.in_flight < self.limit.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            admission_in_flight.labels(self.name).set(self.in_flight)
+            return
+        if len(self._waiters) >= self.limit.max_queue:
+            raise Overloaded("queue_full", self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        admission_queued.labels(self.name).set(len(self._waiters))
+        try:
+            await asyncio.wait_for(waiter, self.limit.max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as the wait ended, pass it on
+                self.release()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            raise Overloaded("queue_timeout", self.retry_after()) from None
+        finally:
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                pass
+            admission_queued.labels(self.name).set(len(self._waiters))
+
+    def release(self, held_for: float | None = None) -> None:
+        """Give the slot to the longest waiting request, or free it."""
+        if held_for is not None:
+            self._service_time += 0.1 * (held_for - self._service_time)
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # The slot passes on, in_flight stays the same
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+        admission_in_flight.labels(self.name).set(self.in_flight)
+
+
+def load_admission_controllers() -> dict[str, AdmissionController]:
+    """Controllers per route path, class limits overridden by ADMISSION_LIMITS.
+
+    ADMISSION_LIMITS is a JSON object of class name to limits, e.g.
+    {"batch": {"max_in_flight": 2}}, and ADMISSION_ROUTES maps paths to classes.
+    """
+    limits = {name: dict(limit) for name, limit in DEFAULT_CLASS_LIMITS.items()}
+    for name, overrides in json.loads(os.environ.get("ADMISSION_LIMITS", "{}")).items():
+        limits.setdefault(name, {}).update(overrides)
+    routes = dict(DEFAULT_ROUTE_CLASSES)
+    routes.update(json.loads(os.environ.get("ADMISSION_ROUTES", "{}")))
+    controllers = {
+        name: AdmissionController(
+            name,
+            AdmissionLimit(
+                max_in_flight=int(limit["max_in_flight"]),
+                max_queue=int(limit["max_queue"]),
+                max_wait=float(limit["max_wait"]),
+            ),
+        )
+        for name, limit in limits.items()
+    }
+    return {path: controllers[name] for path, name in routes.items() if name}
+
+
+class AdmissionMiddleware:
+    def __init__(self, app: ASGIApp, controllers: dict[str, AdmissionController]):
+        self.app = app
+        self.controllers = controllers
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        controller = None
+        if scope["type"] == "http" and scope["method"] != "OPTIONS":
+            controller = self.controllers.get(scope["path"])
+        if controller is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await controller.acquire()
+        except Overloaded as e:
+            admission_shed.labels(controller.name, e.reason).inc()
+            logger.warning("Shedding %s request to %s: %s", controller.name, scope["path"], e.reason)
+            await self._reject(send, e.retry_after)
+            return
+        start = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            controller.release(time.monotonic() - start)
+
+    @staticmethod
+    async def _reject(send: Send, retry_after: float) -> None:
+        body = b'{"detail":"Server busy, please retry later"}'
+        await send(
+            {
+                "type": "http.response.start",
+                "status": HTTPStatus.SERVICE_UNAVAILABLE.value,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
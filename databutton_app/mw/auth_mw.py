@@ -1,12 +1,27 @@
+import asyncio
 import functools
+import hashlib
+import logging
+import os
+import time
 from http import HTTPStatus
 from typing import Annotated, Callable
 import jwt
 from fastapi import Depends, HTTPException, WebSocket, WebSocketException, status
 from fastapi.requests import HTTPConnection
-from jwt import PyJWKClient
 from pydantic import BaseModel
 from starlette.requests import Request
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.libs.jwks import JWKSKeyManager
+from app.libs.metrics import Counter, Histogram
+from app.libs.shared_jwks import SharedJWKSCache, SharedJWKSKeyManager
+from app.libs.structured_logging import SampledLogger
+from app.libs.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+# Successful authentications, one per request and sampled by default
+access_logger = SampledLogger(logging.getLogger(__name__ + ".access"))
 
 
 class AuthConfig(BaseModel):
@@ -26,6 +41,33 @@ class User(BaseModel):
     email: str | None = None
 
 
+jwt_verify_seconds = Histogram(
+    "jwt_verify_duration_seconds",
+    "Time to verify a token signature and claims",
+    ["result"],
+    buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05),
+)
+token_cache_lookups = Counter(
+    "auth_token_cache_lookups_total", "Verified token cache lookups", ["result"]
+)
+_token_cache_hit = token_cache_lookups.labels("hit")
+_token_cache_miss = token_cache_lookups.labels("miss")
+
+
+def _user_size(user: User) -> int:
+    # Rough per-entry footprint: key, entry tuple and model overhead plus field data
+    return 512 + sum(len(value) for value in user.__dict__.values() if isinstance(value, str))
+
+
+# Validated users by (audience, jwks url, token digest), each kept until its token's exp
+_verified_tokens: TTLCache[tuple[str, str, bytes], User] = TTLCache(
+    maxsize=int(os.environ.get("AUTH_TOKEN_CACHE_SIZE", "10000")),
+    ttl=0.0,
+    max_bytes=int(os.environ.get("AUTH_TOKEN_CACHE_MAX_BYTES", str(16 * 1024 * 1024))),
+    sizeof=_user_size,
+)
+
+
 def get_auth_config(request: HTTPConnection) -> AuthConfig:
     auth_config: AuthConfig | None = request.app.state.auth_config
 
@@ -49,6 +91,11 @@ AuditLogDep = Annotated[Callable[[str], None] | None, Depends(get_audit_log)]
 def get_authorized_user(
     request: HTTPConnection,
 ) -> User:
+    # Already verified by AuthMiddleware
+    user = request.scope.get("state", {}).get("user")
+    if user is not None:
+        return user
+
     auth_config = get_auth_config(request)
 
     try:
@@ -61,9 +108,9 @@ def get_authorized_user(
 
         if user is not None:
             return user
-        print("Request authentication returned no user")
+        logger.info("Request authentication returned no user")
     except Exception as e:
-        print(f"Request authentication failed: {e}")
+        logger.info("Request authentication failed: %s", e)
 
     if isinstance(request, WebSocket):
         raise WebSocketException(
@@ -75,10 +122,35 @@ def get_authorized_user(
         )
 
 
+def auth_config_from_env() -> AuthConfig | None:
+    """Auth config from AUTH_JWKS_URL and AUTH_AUDIENCE, None when auth is not set up."""
+    jwks_url = os.environ.get("AUTH_JWKS_URL")
+    audience = os.environ.get("AUTH_AUDIENCE")
+    if not jwks_url or not audience:
+        return None
+    return AuthConfig(
+        jwks_url=jwks_url,
+        audience=audience,
+        header=os.environ.get("AUTH_HEADER", "authorization"),
+    )
+
+
 @functools.cache
-def get_jwks_client(url: str):
-    """Reuse client cached by its url, client caches keys by default."""
-    return PyJWKClient(url, cache_keys=True)
+def get_jwks_client(url: str) -> JWKSKeyManager:
+    """Reuse key manager cached by its url, started by the app lifespan.
+
+    With AUTH_JWKS_SHARED_DIR set, worker processes share one key set through a
+    mapped file in that directory and only one of them fetches it.
+    """
+    options = dict(
+        refresh_interval=float(os.environ.get("AUTH_JWKS_REFRESH_INTERVAL", "300")),
+        min_refresh_interval=float(os.environ.get("AUTH_JWKS_MIN_REFRESH_INTERVAL", "10")),
+        negative_ttl=float(os.environ.get("AUTH_JWKS_NEGATIVE_TTL", "60")),
+    )
+    shared_dir = os.environ.get("AUTH_JWKS_SHARED_DIR")
+    if shared_dir:
+        return SharedJWKSKeyManager(url, SharedJWKSCache.for_url(shared_dir, url), **options)
+    return JWKSKeyManager(url, **options)
 
 
 def get_signing_key(url: str, token: str) -> tuple[str, str]:
@@ -111,7 +183,7 @@ def authorize_websocket(
             break
 
     if not token:
-        print(f"Missing bearer {prefix}.<token> in protocols")
+        logger.debug("Missing bearer %s<token> in protocols", prefix)
         return None
 
     return authorize_token(token, auth_config)
@@ -123,21 +195,48 @@ def authorize_request(
 ) -> User | None:
     auth_header = request.headers.get(auth_config.header)
     if not auth_header:
-        print(f"Missing header '{auth_config.header}'")
+        logger.debug("Missing header %r", auth_config.header)
         return None
 
     token = auth_header.startswith("Bearer ") and auth_header[7:]
     if not token:
-        print(f"Missing bearer token in '{auth_config.header}'")
+        logger.debug("Missing bearer token in %r", auth_config.header)
         return None
 
     return authorize_token(token, auth_config)
 
 
+def _token_cache_key(token: str, auth_config: AuthConfig) -> tuple[str, str, bytes]:
+    return (
+        auth_config.audience,
+        auth_config.jwks_url,
+        hashlib.sha256(token.encode()).digest(),
+    )
+
+
+def cached_user(token: str, auth_config: AuthConfig) -> User | None:
+    """User for a token verified earlier and not expired yet, without any crypto."""
+    cached = _verified_tokens.get(_token_cache_key(token, auth_config))
+    if cached is None:
+        _token_cache_miss.inc()
+        return None
+    _token_cache_hit.inc()
+    return cached.model_copy()
+
+
 def authorize_token(
     token: str,
     auth_config: AuthConfig,
 ) -> User | None:
+    # Tokens already verified for this audience skip signature checks until they expire
+    return cached_user(token, auth_config) or verify_token(token, auth_config)
+
+
+def verify_token(
+    token: str,
+    auth_config: AuthConfig,
+) -> User | None:
+    """Check the token's signature and claims, and cache the user until it expires."""
     # Audience and jwks url to get signing key from based on the users config
     jwks_urls = [(auth_config.audience, auth_config.jwks_url)]
 
@@ -146,9 +245,10 @@ def authorize_token(
         try:
             key, alg = get_signing_key(jwks_url, token)
         except Exception as e:
-            print(f"Failed to get signing key {e}")
+            logger.info("Failed to get signing key %s", e)
             continue
 
+        start = time.perf_counter()
         try:
             payload = jwt.decode(
                 token,
@@ -157,13 +257,117 @@ def authorize_token(
                 audience=audience,
             )
         except jwt.PyJWTError as e:
-            print(f"Failed to decode and validate token {e}")
+            jwt_verify_seconds.labels("invalid").observe(time.perf_counter() - start)
+            logger.info("Failed to decode and validate token %s", e)
             continue
+        jwt_verify_seconds.labels("valid").observe(time.perf_counter() - start)
 
     try:
         user = User.model_validate(payload)
-        print(f"User {user.sub} authenticated")
-        return user
+        access_logger.info("User %s authenticated", user.sub)
     except Exception as e:
-        print(f"Failed to parse token payload {e}")
+        logger.info("Failed to parse token payload %s", e)
+        return None
+
+    # Only tokens with an expiry are cached, and never past it
+    exp = payload.get("exp")
+    if isinstance(exp, (int, float)) and exp > time.time():
+        _verified_tokens.set(
+            _token_cache_key(token, auth_config), user.model_copy(), ttl=exp - time.time()
+        )
+    return user
+
+
+class AuthMiddleware:
+    """Reject unauthenticated HTTP and WebSocket connections before routing.
+
+    Policies are precomputed into exact paths and, for paths with parameters,
+    the literal prefix before the first parameter, longest first. Paths that
+    match no route pass through, so unknown URLs still 404 and CORS preflight
+    requests are never blocked. The verified `User` is stored in the scope
+    state, where `get_authorized_user` picks it up.
+    """
+
+    def __init__(self, app: ASGIApp, auth_config: AuthConfig, policies: dict[str, bool]):
+        self.app = app
+        self.auth_config = auth_config
+        self.header = auth_config.header.lower().encode("latin-1")
+        self._exact = {path: required for path, required in policies.items() if "{" not in path}
+        self._prefixes = sorted(
+            (
+                (path.split("{", 1)[0], required)
+                for path, required in policies.items()
+                if "{" in path
+            ),
+            key=lambda item: len(item[0]),
+            reverse=True,
+        )
+
+    def requires_auth(self, path: str) -> bool:
+        required = self._exact.get(path)
+        if required is not None:
+            return required
+        for prefix, required in self._prefixes:
+            if path.startswith(prefix):
+                return required
+        return False
+
+    def _token(self, scope: Scope) -> str | None:
+        if scope["type"] == "websocket":
+            prefix = "Authorization.Bearer."
+            for name, value in scope["headers"]:
+                if name == b"sec-websocket-protocol":
+                    for protocol in value.decode("latin-1").split(","):
+                        protocol = protocol.strip()
+                        if protocol.startswith(prefix):
+                            return protocol.removeprefix(prefix) or None
+            return None
+        for name, value in scope["headers"]:
+            if name == self.header:
+                header = value.decode("latin-1")
+                if header.startswith("Bearer "):
+                    return header[7:] or None
         return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] not in ("http", "websocket")
+            or scope.get("method") == "OPTIONS"
+            or not self.requires_auth(scope["path"])
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        user = None
+        token = self._token(scope)
+        if token:
+            user = cached_user(token, self.auth_config)
+            if user is None:
+                # Key fetches and RSA verification stay off the event loop
+                user = await asyncio.to_thread(verify_token, token, self.auth_config)
+        if user is None:
+            await self._reject(scope, send)
+            return
+
+        scope.setdefault("state", {})["user"] = user
+        await self.app(scope, receive, send)
+
+    @staticmethod
+    async def _reject(scope: Scope, send: Send) -> None:
+        if scope["type"] == "websocket":
+            # Closing before accept makes the server answer the handshake with 403
+            await send({"type": "websocket.close", "code": status.WS_1008_POLICY_VIOLATION})
+            return
+        body = b'{"detail":"Not authenticated"}'
+        await send(
+            {
+                "type": "http.response.start",
+                "status": HTTPStatus.UNAUTHORIZED.value,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"www-authenticate", b"Bearer"),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
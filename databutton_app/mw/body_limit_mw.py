@@ -0,0 +1,82 @@
+"""Request body size caps, enforced before and while the body is read.
+
+`BodyLimitMiddleware` answers 413 straight away when Content-Length is over the
+route's cap, and otherwise counts body bytes as the app receives them, so a
+chunked or lying request fails with 413 as soon as it crosses the cap instead
+of after it has been buffered in full.
+"""
+
+import json
+import os
+from http import HTTPStatus
+
+from fastapi import HTTPException
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+DEFAULT_BODY_LIMIT = 1024 * 1024
+
+DEFAULT_ROUTE_BODY_LIMITS = {
+    # Room for multipart attachment uploads
+    "/routes/send": 16 * 1024 * 1024,
+    "/routes/send-batch": 16 * 1024 * 1024,
+}
+
+
+def load_body_limits() -> tuple[int, dict[str, int]]:
+    """Default cap from MAX_REQUEST_BODY_BYTES, per-route caps overridden by BODY_LIMITS."""
+    default = int(os.environ.get("MAX_REQUEST_BODY_BYTES", str(DEFAULT_BODY_LIMIT)))
+    limits = dict(DEFAULT_ROUTE_BODY_LIMITS)
+    limits.update(json.loads(os.environ.get("BODY_LIMITS", "{}")))
+    return default, {path: int(limit) for path, limit in limits.items()}
+
+
+class BodyLimitMiddleware:
+    def __init__(self, app: ASGIApp, default_limit: int, limits: dict[str, int]):
+        self.app = app
+        self.default_limit = default_limit
+        self.limits = limits
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        limit = self.limits.get(scope["path"], self.default_limit)
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                if value.isdigit() and int(value) > limit:
+                    await self._reject(send, limit)
+                    return
+                break
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Raised inside the app, where FastAPI turns it into the response
+                    raise HTTPException(
+                        status_code=HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"Request body larger than {limit} bytes",
+                    )
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    @staticmethod
+    async def _reject(send: Send, limit: int) -> None:
+        body = json.dumps({"detail": f"Request body larger than {limit} bytes"}).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": HTTPStatus.REQUEST_ENTITY_TOO_LARGE.value,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"connection", b"close"),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
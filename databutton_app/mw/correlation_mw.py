@@ -0,0 +1,47 @@
+"""Per-request correlation ids for log lines.
+
+Takes the id from the incoming X-Request-ID header, or generates one, exposes
+it to logging through the `correlation_id` context variable for the duration
+of the request, and echoes it back in the response headers.
+"""
+
+import re
+import uuid
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.libs.structured_logging import correlation_id
+
+HEADER = b"x-request-id"
+
+# Client-supplied ids are only trusted when short and free of odd characters
+_VALID_ID = re.compile(rb"^[A-Za-z0-9._:-]{1,128}$")
+
+
+class CorrelationIdMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == HEADER and _VALID_ID.match(value):
+                request_id = value
+                break
+        if request_id is None:
+            request_id = uuid.uuid4().hex.encode()
+
+        async def send_with_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (HEADER, request_id)]
+            await send(message)
+
+        token = correlation_id.set(request_id.decode("latin-1"))
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            correlation_id.reset(token)
@@ -0,0 +1,96 @@
+"""Request metrics and the Prometheus scrape endpoint.
+
+`MetricsMiddleware` times every HTTP request and records it by method, route
+template (never the raw path, to keep label cardinality bounded) and status,
+and tracks requests in flight. Threadpool gauges read the anyio limiter that
+runs sync endpoints at scrape time.
+
+The scrape endpoint answers only requests carrying its token as a bearer
+token, the metrics reveal per-route traffic and queue internals.
+"""
+
+import hmac
+import time
+from http import HTTPStatus
+from typing import Awaitable, Callable
+
+from anyio import to_thread
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.libs.metrics import REGISTRY, Gauge, Histogram
+
+request_latency = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template and status",
+    ["method", "route", "status"],
+)
+in_flight = Gauge("http_requests_in_flight", "HTTP requests being served")
+threadpool_busy = Gauge(
+    "threadpool_threads_busy",
+    "Worker threads running sync endpoints",
+    callback=lambda: to_thread.current_default_thread_limiter().borrowed_tokens,
+)
+threadpool_limit = Gauge(
+    "threadpool_threads_limit",
+    "Maximum worker threads for sync endpoints",
+    callback=lambda: to_thread.current_default_thread_limiter().total_tokens,
+)
+threadpool_waiting = Gauge(
+    "threadpool_tasks_waiting",
+    "Sync endpoint calls waiting for a free worker thread",
+    callback=lambda: to_thread.current_default_thread_limiter().statistics().tasks_waiting,
+)
+
+_in_flight = in_flight.labels()
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._children: dict[tuple[str, str, int], object] = {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        _in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            _in_flight.dec()
+            # FastAPI records the matched route in the scope while routing
+            route = scope.get("route")
+            key = (scope["method"], route.path if route is not None else "unmatched", status)
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = request_latency.labels(key[0], key[1], str(status))
+            child.observe(elapsed)
+
+
+def metrics_endpoint(token: str) -> Callable[[Request], Awaitable[Response]]:
+    """Scrape endpoint requiring `Authorization: Bearer <token>`."""
+    expected = f"Bearer {token}".encode()
+
+    async def endpoint(request: Request) -> Response:
+        provided = request.headers.get("authorization", "").encode()
+        if not hmac.compare_digest(provided, expected):
+            return Response(
+                status_code=HTTPStatus.UNAUTHORIZED,
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        return Response(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+    return endpoint
@@ -0,0 +1,226 @@
+"""Token-bucket rate limiting for the emailer endpoints.
+
+`RateLimitMiddleware` is a raw ASGI middleware that throttles requests per
+client IP and route before FastAPI routes the request or reads its body.
+`check_recipient_rate` applies per-recipient-address limits from inside a
+handler, once the recipients are known.
+
+Bucket state lives in a lock-sharded table so concurrent requests rarely
+contend on the same lock. Each shard is an LRU bounded in size, and buckets
+that have refilled completely are evicted first since a full bucket behaves
+exactly like a missing one.
+"""
+
+import json
+import os
+import time
+from collections import Counter, OrderedDict
+from http import HTTPStatus
+from threading import Lock
+from typing import Hashable, Iterable, NamedTuple
+
+from fastapi import HTTPException
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+
+class RouteLimit(NamedTuple):
+    # Tokens added per second and bucket capacity
+    rate: float
+    burst: float
+
+
+_PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+def parse_limit(spec: str) -> RouteLimit:
+    """Parse "10/minute" (burst of 10, refilled over a minute)."""
+    count, _, period = spec.partition("/")
+    seconds = _PERIODS[period.strip().removesuffix("s") or "second"]
+    burst = float(count)
+    if not burst > 0:
+        raise ValueError(f"Invalid rate limit {spec!r}, the count must be positive")
+    return RouteLimit(rate=burst / seconds, burst=burst)
+
+
+DEFAULT_ROUTE_LIMITS = {
+    "/routes/contact": "5/minute",
+    "/routes/trial-request": "5/minute",
+    "/routes/welcome": "10/minute",
+    "/routes/send": "30/minute",
+    "/routes/send-batch": "5/minute",
+}
+
+DEFAULT_RECIPIENT_LIMIT = "5/hour"
+
+
+def load_route_limits() -> dict[str, RouteLimit]:
+    """Default limits, overridden by a JSON object in RATE_LIMITS."""
+    specs = dict(DEFAULT_ROUTE_LIMITS)
+    specs.update(json.loads(os.environ.get("RATE_LIMITS", "{}")))
+    return {path: parse_limit(spec) for path, spec in specs.items() if spec}
+
+
+class TokenBucketTable:
+    def __init__(self, shards: int = 64, max_keys: int = 100_000):
+        # Power of two so the shard index is a mask of the key hash
+        self._mask = (1 << max(0, shards - 1).bit_length()) - 1
+        self._shard_max = max(1, max_keys // (self._mask + 1))
+        self._shards = [
+            (Lock(), OrderedDict[Hashable, list[float]]())
+            for _ in range(self._mask + 1)
+        ]
+
+    def __len__(self) -> int:
+        return sum(len(buckets) for _, buckets in self._shards)
+
+    def acquire(self, key: Hashable, limit: RouteLimit, cost: float = 1.0) -> float:
+        """Take `cost` tokens, returns 0 if allowed or seconds until it would be."""
+        lock, buckets = self._shards[hash(key) & self._mask]
+        now = time.monotonic()
+        with lock:
+            tokens = self._tokens(buckets, key, limit, now)
+            wait = 0.0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                wait = (cost - tokens) / limit.rate
+            self._store(buckets, key, limit, tokens, now)
+            return wait
+
+    def acquire_all(
+        self, keys: Iterable[Hashable], limit: RouteLimit, cost: float = 1.0
+    ) -> dict[Hashable, float]:
+        """Take `cost` tokens per key from every bucket or from none.
+
+        Returns the keys that are out of tokens with the seconds until they
+        would have enough, empty if the tokens were taken.
+        """
+        costs = Counter(keys)
+        by_shard: dict[int, list[Hashable]] = {}
+        for key in costs:
+            by_shard.setdefault(hash(key) & self._mask, []).append(key)
+        # Locks taken in shard order, so concurrent callers can't deadlock
+        shards = sorted(by_shard)
+        for index in shards:
+            self._shards[index][0].acquire()
+        try:
+            now = time.monotonic()
+            remaining: dict[Hashable, float] = {}
+            denied: dict[Hashable, float] = {}
+            for index in shards:
+                buckets = self._shards[index][1]
+                for key in by_shard[index]:
+                    tokens = remaining[key] = self._tokens(buckets, key, limit, now)
+                    needed = costs[key] * cost
+                    if tokens < needed:
+                        denied[key] = (needed - tokens) / limit.rate
+            if not denied:
+                for index in shards:
+                    buckets = self._shards[index][1]
+                    for key in by_shard[index]:
+                        self._store(buckets, key, limit, remaining[key] - costs[key] * cost, now)
+            return denied
+        finally:
+            for index in shards:
+                self._shards[index][0].release()
+
+    def _tokens(
+        self, buckets: OrderedDict[Hashable, list[float]], key: Hashable, limit: RouteLimit, now: float
+    ) -> float:
+        """Tokens in the bucket of `key` now, the shard's lock is held."""
+        # bucket = [tokens, updated_at, full_at]
+        bucket = buckets.get(key)
+        if bucket is None:
+            while buckets:
+                # Drop refilled buckets, and the least recently used one
+                # once the shard is at capacity.
+                oldest = next(iter(buckets.values()))
+                if oldest[2] > now and len(buckets) < self._shard_max:
+                    break
+                buckets.popitem(last=False)
+            return limit.burst
+        buckets.move_to_end(key)
+        return min(limit.burst, bucket[0] + (now - bucket[1]) * limit.rate)
+
+    @staticmethod
+    def _store(
+        buckets: OrderedDict[Hashable, list[float]], key: Hashable, limit: RouteLimit, tokens: float, now: float
+    ) -> None:
+        buckets[key] = [tokens, now, now + (limit.burst - tokens) / limit.rate]
+
+
+buckets = TokenBucketTable(
+    shards=int(os.environ.get("RATE_LIMIT_SHARDS", "64")),
+    max_keys=int(os.environ.get("RATE_LIMIT_MAX_KEYS", "100000")),
+)
+
+_recipient_limit = parse_limit(
+    os.environ.get("RATE_LIMIT_RECIPIENT", DEFAULT_RECIPIENT_LIMIT)
+)
+
+
+def check_recipient_rate(*emails: str) -> None:
+    """Raise 429 if too many emails were recently sent to any of `emails`.
+
+    Counts the send against every recipient only if all of them are allowed,
+    so a rejected request doesn't use up anyone's quota.
+    """
+    denied = buckets.acquire_all(
+        (("recipient", email.lower()) for email in emails), _recipient_limit
+    )
+    if denied:
+        (_, email), wait = max(denied.items(), key=lambda item: item[1])
+        raise HTTPException(
+            status_code=HTTPStatus.TOO_MANY_REQUESTS,
+            detail=f"Too many emails sent to {email}",
+            headers={"Retry-After": str(int(wait) + 1)},
+        )
+
+
+class RateLimitMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        limits: dict[str, RouteLimit],
+        trust_forwarded: bool = False,
+        table: TokenBucketTable = buckets,
+    ):
+        self.app = app
+        self.limits = limits
+        self.trust_forwarded = trust_forwarded
+        self.table = table
+
+    def client_ip(self, scope: Scope) -> str:
+        if self.trust_forwarded:
+            for name, value in scope["headers"]:
+                if name == b"x-forwarded-for":
+                    return value.split(b",", 1)[0].strip().decode("latin-1")
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and scope["method"] != "OPTIONS":
+            path = scope["path"]
+            limit = self.limits.get(path)
+            if limit is not None:
+                wait = self.table.acquire((path, self.client_ip(scope)), limit)
+                if wait:
+                    await self._reject(send, wait)
+                    return
+        await self.app(scope, receive, send)
+
+    @staticmethod
+    async def _reject(send: Send, wait: float) -> None:
+        body = b'{"detail":"Too Many Requests"}'
+        await send(
+            {
+                "type": "http.response.start",
+                "status": HTTPStatus.TOO_MANY_REQUESTS.value,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(int(wait) + 1).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
@@ -1,66 +1,204 @@
+import asyncio
+import json
+import logging
+import os
 import pathlib
+import time
+from contextlib import asynccontextmanager
 import dotenv
 from fastapi import FastAPI, APIRouter
 from fastapi.middleware.cors import CORSMiddleware  # Add this import
 
 dotenv.load_dotenv()
 
+from app.libs.structured_logging import configure_logging
+
+configure_logging()
+logger = logging.getLogger(__name__)
+
+from app.libs.lazy_routes import (
+    LazyAPI,
+    LazyRoute,
+    build_manifest,
+    fingerprint,
+    lazy_routes,
+    read_manifest,
+    warm_up,
+    write_manifest,
+)
+from databutton_app.mw.admission_mw import AdmissionMiddleware, load_admission_controllers
+from databutton_app.mw.auth_mw import AuthMiddleware, auth_config_from_env, get_jwks_client
+from databutton_app.mw.body_limit_mw import BodyLimitMiddleware, load_body_limits
+from databutton_app.mw.correlation_mw import CorrelationIdMiddleware
+from databutton_app.mw.metrics_mw import MetricsMiddleware, metrics_endpoint
+from databutton_app.mw.rate_limit_mw import RateLimitMiddleware, load_route_limits
+
+
+def get_router_config() -> dict:
+    path = pathlib.Path(__file__).parent / "routers.json"
+    try:
+        cfg = json.loads(path.read_text())
+    except (OSError, ValueError) as e:
+        logger.warning("Failed to read %s: %s", path, e)
+        return {"routers": {}}
+    return cfg
+
+
+def is_auth_disabled(router_config: dict, name: str) -> bool:
+    # Routers missing from the config require auth
+    return router_config["routers"].get(name, {}).get("disableAuth", False)
+
+
+APIS_PATH = pathlib.Path(__file__).parent / "app" / "apis"
+API_MODULE_PREFIX = "app.apis."
+
+# Fast startup mounts routes from the manifest and imports API modules on first use
+FAST_STARTUP = os.environ.get("STARTUP_MODE") == "fast"
+ROUTE_MANIFEST = os.environ.get("ROUTE_MANIFEST", "data/route_manifest.json")
+
+
+def get_api_names() -> list[str]:
+    # API routers live in "src/app/apis/*/__init__.py"
+    return sorted(
+        p.relative_to(APIS_PATH).parent.as_posix()
+        for p in APIS_PATH.glob("*/__init__.py")
+    )
 
 
+def import_api_routers(router_config: dict) -> tuple[APIRouter, dict[str, bool]]:
+    """Create top level router including all user defined endpoints.
 
-# def get_router_config() -> dict:
-#     try:
-#         # Note: This file is not available to the agent
-#         cfg = json.loads(open("routers.json").read())
-#     except:
-#         return False
-#     return cfg
-
-
-# def is_auth_disabled(router_config: dict, name: str) -> bool:
-#     return router_config["routers"][name]["disableAuth"]
-
-
-def import_api_routers() -> APIRouter:
-    """Create top level router including all user defined endpoints."""
+    Also returns whether each mounted route path requires auth, per routers.json,
+    and refreshes the route manifest used by fast startup.
+    """
     routes = APIRouter(prefix="/routes")
+    auth_policies: dict[str, bool] = {}
+    imported: dict[str, APIRouter] = {}
 
-    src_path = pathlib.Path(__file__).parent
-
-    # Import API routers from "src/app/apis/*/__init__.py"
-    apis_path = src_path / "app" / "apis"
-
-    api_names = [
-        p.relative_to(apis_path).parent.as_posix()
-        for p in apis_path.glob("*/__init__.py")
-    ]
-
-    api_module_prefix = "app.apis."
+    api_names = get_api_names()
 
     for name in api_names:
-        print(f"Importing API: {name}")
+        logger.debug("Importing API: %s", name)
+        start = time.perf_counter()
         try:
-            api_module = __import__(api_module_prefix + name, fromlist=[name])
+            api_module = __import__(API_MODULE_PREFIX + name, fromlist=[name])
             api_router = getattr(api_module, "router", None)
             if isinstance(api_router, APIRouter):
                 routes.include_router(
                     api_router,
-                    # Authentication dependencies removed as requested
+                    # Authentication is enforced by AuthMiddleware
                 )
+                imported[name] = api_router
+                requires_auth = not is_auth_disabled(router_config, name)
+                for route in api_router.routes:
+                    auth_policies[routes.prefix + route.path] = requires_auth
             else:
-                print(f"API '{name}' does not have a valid APIRouter object.")
+                logger.warning("API '%s' does not have a valid APIRouter object.", name)
         except Exception as e:
-            print(f"Error importing API {name}: {e}")
+            logger.exception("Error importing API %s", name)
             continue
+        logger.info("Imported API %s in %.1fms", name, (time.perf_counter() - start) * 1000)
 
-    print(routes.routes)
+    logger.debug("Imported routes: %s", routes.routes)
 
-    return routes
+    if ROUTE_MANIFEST and read_manifest(ROUTE_MANIFEST, APIS_PATH, api_names) is None:
+        try:
+            write_manifest(ROUTE_MANIFEST, build_manifest(imported, fingerprint(APIS_PATH, api_names)))
+        except OSError as e:
+            logger.warning("Failed to write route manifest %s: %s", ROUTE_MANIFEST, e)
+
+    return routes, auth_policies
+
+
+def lazy_api_routers(
+    router_config: dict,
+) -> tuple[list[LazyRoute], dict[str, bool], dict[str, LazyAPI]] | None:
+    """Placeholder routes from the route manifest, None when it is missing or stale."""
+    manifest = read_manifest(ROUTE_MANIFEST, APIS_PATH, get_api_names()) if ROUTE_MANIFEST else None
+    if manifest is None:
+        logger.info("Route manifest %s missing or stale, importing APIs eagerly", ROUTE_MANIFEST)
+        return None
+    routes, apis = lazy_routes(manifest, API_MODULE_PREFIX, "/routes")
+    auth_policies = {
+        route.path: not is_auth_disabled(router_config, route.api.name) for route in routes
+    }
+    return routes, auth_policies, apis
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Build shared clients, start background email dispatch workers and drain them on shutdown."""
+    # Imported here rather than at the top, they pull in requests, smtplib and
+    # ssl, which fast startup keeps out of the import of main
+    from app.libs.attachments import attachment_store
+    from app.libs.email_queue import email_queue
+    from app.libs.email_transports import close_transport, init_transport
+
+    init_transport()
+    await email_queue.start()
+    # Attachments of emails still queued are kept however old they are
+    keep = await asyncio.to_thread(email_queue.attachment_digests)
+    await asyncio.to_thread(attachment_store.prune, keep)
+    jwks = None
+    if app.state.auth_config is not None:
+        # Prefetch signing keys so the first authenticated request doesn't fetch them
+        jwks = get_jwks_client(app.state.auth_config.jwks_url)
+        await asyncio.to_thread(jwks.start)
+    warmup = None
+    lazy_apis: dict[str, LazyAPI] = app.state.lazy_apis
+    if lazy_apis:
+        # Import the selected APIs in the background once the server is accepting requests
+        names = os.environ.get("STARTUP_WARMUP", ",".join(lazy_apis)).split(",")
+        warmup = asyncio.create_task(
+            warm_up(app, [lazy_apis[name] for name in names if name in lazy_apis])
+        )
+    try:
+        yield
+    finally:
+        if warmup is not None:
+            warmup.cancel()
+        if jwks is not None:
+            await asyncio.to_thread(jwks.stop)
+        await email_queue.stop()
+        close_transport()
 
 
 def create_app() -> FastAPI:
     """Create the app. This is called by uvicorn with the factory option to construct the app object."""
-    app = FastAPI()
+    app = FastAPI(lifespan=lifespan)
+    router_config = get_router_config()
+    lazy = lazy_api_routers(router_config) if FAST_STARTUP else None
+    if lazy is not None:
+        api_router = None
+        lazy_route_list, auth_policies, app.state.lazy_apis = lazy
+    else:
+        api_router, auth_policies = import_api_routers(router_config)
+        app.state.lazy_apis = {}
+
+    # Removed DataButton Firebase integration, auth is configured from the environment
+    app.state.auth_config = auth_config_from_env()
+
+    # Cap request body sizes while they are read, 413 early on a large Content-Length
+    default_body_limit, body_limits = load_body_limits()
+    app.add_middleware(BodyLimitMiddleware, default_limit=default_body_limit, limits=body_limits)
+
+    # Cap concurrent emailer sends per route class, 503 + Retry-After once queued too long
+    app.add_middleware(AdmissionMiddleware, controllers=load_admission_controllers())
+
+    # Reject unauthenticated requests to routers without disableAuth before routing
+    if app.state.auth_config is not None:
+        app.add_middleware(
+            AuthMiddleware,
+            auth_config=app.state.auth_config,
+            policies=auth_policies,
+        )
+
+    # Throttle per client IP before routing, inside CORS so 429s carry CORS headers
+    app.add_middleware(
+        RateLimitMiddleware,
+        limits=load_route_limits(),
+        trust_forwarded=os.environ.get("RATE_LIMIT_TRUST_PROXY") == "1",
+    )
 
     # --- ADD THIS CORS CONFIGURATION BLOCK ---
     origins = [
@@ -81,17 +219,36 @@ def create_app() -> FastAPI:
     )
     # --- END CORS CONFIGURATION BLOCK ---
 
-    app.include_router(import_api_routers())
-
-    for route in app.routes:
-        if hasattr(route, "methods"):
-            for method in route.methods:
-                print(f"{method} {route.path}")
-
-    # Removed DataButton Firebase integration and related auth config logic
-    app.state.auth_config = None
+    # Outermost, so every response and log line carries the request id
+    app.add_middleware(CorrelationIdMiddleware)
+
+    # Time requests through the whole middleware stack, scraped at /metrics
+    app.add_middleware(MetricsMiddleware)
+    # Only served with METRICS_TOKEN set, scrapers send it as a bearer token
+    metrics_token = os.environ.get("METRICS_TOKEN")
+    if metrics_token:
+        app.add_route("/metrics", metrics_endpoint(metrics_token), include_in_schema=False)
+    else:
+        logger.info("METRICS_TOKEN is not set, /metrics is disabled")
+
+    if api_router is not None:
+        app.include_router(api_router)
+    else:
+        app.router.routes.extend(lazy_route_list)
+
+    if logger.isEnabledFor(logging.DEBUG):
+        for route in app.routes:
+            if hasattr(route, "methods"):
+                for method in route.methods:
+                    logger.debug("%s %s", method, route.path)
 
     return app
 
 
-app = create_app()
+def __getattr__(name: str):
+    # `uvicorn main:app` still works, the app is only built when first asked for,
+    # so importing this module (e.g. in a serve.py worker) doesn't build it twice
+    if name == "app":
+        app = globals()["app"] = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
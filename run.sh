@@ -2,4 +2,4 @@
 
 source .venv/bin/activate
 
-uvicorn main:app --reload 
+python serve.py
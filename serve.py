@@ -0,0 +1,125 @@
+"""Production entry point: uvicorn workers sized to the available cores.
+
+Each worker process builds its own app with `main:create_app`. Workers use
+uvloop and httptools when they are installed, and keep idle connections open
+longer than typical load balancer idle timeouts, so the balancer rather than
+the app closes them and never sends into a half-closed socket. SIGTERM stops
+accepting connections, lets in-flight requests and the email queue drain for
+up to SERVER_GRACEFUL_TIMEOUT seconds, then exits.
+
+With SERVER_MAX_REQUESTS set, a worker exits after serving that many requests
+(plus a per-worker random jitter, so workers don't all recycle together) and
+the supervisor starts a replacement. The listening socket is owned by the
+supervisor, so the other workers keep serving and new connections wait in the
+backlog rather than being refused while a worker restarts.
+
+In development (see `app.env.mode`) it runs a single reloading process instead.
+
+Usage:
+
+    python serve.py [--host 0.0.0.0] [--port 8000] [--workers 4]
+
+Environment: HOST, PORT, WEB_CONCURRENCY, SERVER_KEEPALIVE, SERVER_BACKLOG,
+SERVER_GRACEFUL_TIMEOUT, SERVER_MAX_REQUESTS, SERVER_MAX_REQUESTS_JITTER, and
+AUTH_JWKS_SHARED_DIR (defaults to a temp directory with more than one worker).
+"""
+
+import argparse
+import importlib.util
+import logging
+import math
+import os
+import random
+import tempfile
+
+import dotenv
+import uvicorn
+from uvicorn.supervisors import Multiprocess
+
+dotenv.load_dotenv()
+
+from app.env import Mode, mode
+from app.libs.structured_logging import configure_logging
+
+logger = logging.getLogger(__name__)
+
+
+def available_cpus() -> int:
+    """CPUs this process may run on, capped by a cgroup v2 CPU quota if there is one."""
+    cpus = os.process_cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+class RecyclingServer(uvicorn.Server):
+    """Adds a random jitter to the request limit in each worker process."""
+
+    def __init__(self, config: uvicorn.Config, max_requests_jitter: int = 0):
+        super().__init__(config)
+        self.max_requests_jitter = max_requests_jitter
+
+    def run(self, sockets=None) -> None:
+        # Runs in the worker, on its own copy of the config
+        if self.config.limit_max_requests and self.max_requests_jitter:
+            self.config.limit_max_requests += random.randint(0, self.max_requests_jitter)
+        super().run(sockets=sockets)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the API server")
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_CONCURRENCY", "0")),
+                        help="worker processes, defaults to the number of available CPUs")
+    args = parser.parse_args()
+    configure_logging()
+
+    if mode == Mode.DEV:
+        logger.info("Development mode, running a single reloading worker")
+        uvicorn.run("main:app", host=args.host, port=args.port, reload=True)
+        return
+
+    loop = "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+    http = "httptools" if importlib.util.find_spec("httptools") else "h11"
+    max_requests = int(os.environ.get("SERVER_MAX_REQUESTS", "0")) or None
+    config = uvicorn.Config(
+        "main:create_app",
+        factory=True,
+        host=args.host,
+        port=args.port,
+        workers=args.workers or available_cpus(),
+        loop=loop,
+        http=http,
+        backlog=int(os.environ.get("SERVER_BACKLOG", "4096")),
+        timeout_keep_alive=int(os.environ.get("SERVER_KEEPALIVE", "75")),
+        timeout_graceful_shutdown=int(os.environ.get("SERVER_GRACEFUL_TIMEOUT", "30")),
+        limit_max_requests=max_requests,
+    )
+    server = RecyclingServer(
+        config,
+        max_requests_jitter=int(os.environ.get(
+            "SERVER_MAX_REQUESTS_JITTER", str(max_requests // 10 if max_requests else 0)
+        )),
+    )
+    if config.workers > 1:
+        # Workers share one JWKS key set, fetched by one of them, see app.libs.shared_jwks
+        os.environ.setdefault(
+            "AUTH_JWKS_SHARED_DIR", os.path.join(tempfile.gettempdir(), f"loufranktv-{args.port}")
+        )
+    logger.info(
+        "Starting %d workers on %s:%d with %s and %s, recycling after %s requests",
+        config.workers, args.host, args.port, loop, http, max_requests or "unlimited",
+    )
+    # Always supervised, even with one worker, so recycled workers are restarted
+    sock = config.bind_socket()
+    Multiprocess(config, target=server.run, sockets=[sock]).run()
+
+
+if __name__ == "__main__":
+    main()
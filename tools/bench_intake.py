@@ -0,0 +1,138 @@
+"""Benchmark: peak memory of taking in a generic email body as it grows.
+
+Compares the streamed intake used by /send and /send-batch
+(`read_generic_email`) with a FastAPI route that takes `GenericEmailRequest` as
+a body parameter, which buffers the body, `json.loads` it and validates the
+whole document at once. Every measurement runs in a fresh interpreter and
+reports how far peak RSS rose while one request was taken in. The body is
+generated chunk by chunk as the app reads it, so the client holds no copy.
+
+Streamed intake runs once with the caps lifted, to show the cost of accepted
+payloads, and once with the default caps, where oversized bodies are rejected
+part way through.
+
+Usage:
+
+    python -m tools.bench_intake [--recipients 1000,10000,50000,100000] [--html-kib 64]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+from typing import Iterator
+
+CHUNK_SIZE = 64 * 1024
+
+
+def body_chunks(recipients: int, html_kib: int) -> Iterator[bytes]:
+    head = {"subject": "Our spring lineup", "html_content": "<p>" + "x" * (html_kib * 1024) + "</p>"}
+    pending = [json.dumps(head).encode()[:-1] + b', "to": [']
+    size = len(pending[0])
+    for i in range(recipients):
+        item = b'{"email": "viewer%d@example.com", "name": "Viewer %d"}' % (i, i)
+        pending.append(item if i == 0 else b", " + item)
+        size += len(pending[-1])
+        if size >= CHUNK_SIZE:
+            yield b"".join(pending)
+            pending, size = [], 0
+    pending.append(b"]}")
+    yield b"".join(pending)
+
+
+async def post(app, path: str, chunks: Iterator[bytes]) -> int:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "POST", "scheme": "http", "path": path, "raw_path": path.encode(),
+        "query_string": b"", "root_path": "", "client": ("127.0.0.1", 50000),
+        "server": ("bench", 80), "headers": [(b"content-type", b"application/json")],
+    }
+    status = 0
+
+    async def receive():
+        chunk = next(chunks, None)
+        if chunk is None:
+            return {"type": "http.request", "body": b"", "more_body": False}
+        return {"type": "http.request", "body": chunk, "more_body": True}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+def child(mode: str, recipients: int, html_kib: int) -> None:
+    if mode == "streamed, no caps":
+        os.environ["EMAIL_BATCH_MAX_RECIPIENTS"] = str(10**9)
+        os.environ["EMAIL_MAX_CONTENT_CHARS"] = str(10**9)
+
+    from fastapi import FastAPI, Request
+
+    from app.apis.emailer import GenericEmailRequest, read_generic_email, BATCH_MAX_RECIPIENTS
+
+    app = FastAPI()
+
+    @app.post("/buffered")
+    async def buffered(request: GenericEmailRequest) -> int:
+        return len(request.to)
+
+    @app.post("/streamed")
+    async def streamed(request: Request) -> int:
+        _, addresses, _ = await read_generic_email(request, BATCH_MAX_RECIPIENTS)
+        return len(addresses)
+
+    path = "/buffered" if mode == "buffered" else "/streamed"
+
+    async def run() -> tuple[int, int, int]:
+        # Warm up imports, routing and validators before taking the baseline
+        await post(app, path, body_chunks(10, 1))
+        before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        status = await post(app, path, body_chunks(recipients, html_kib))
+        after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return status, before, after
+
+    status, before, after = asyncio.run(run())
+    print(json.dumps({"status": status, "peak_kib": after - before}))
+
+
+def measure(mode: str, recipients: int, html_kib: int) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-m", "tools.bench_intake", "--child", mode, str(recipients), str(html_kib)],
+        env={**os.environ, "LOG_LEVEL": "WARNING", "EMAIL_OUTBOX_PATH": ""},
+        capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare peak RSS of buffered and streamed intake")
+    parser.add_argument("--recipients", default="1000,10000,50000,100000")
+    parser.add_argument("--html-kib", type=int, default=64)
+    parser.add_argument("--child", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        mode, recipients, html_kib = args.child
+        child(mode, int(recipients), int(html_kib))
+        return
+
+    sizes = [int(n) for n in args.recipients.split(",")]
+    modes = ["buffered", "streamed, no caps", "streamed"]
+    print(f"{'recipients':>10}{'body KiB':>10}" + "".join(f"{m + ' peak KiB':>28}" for m in modes))
+    for n in sizes:
+        body_kib = sum(len(c) for c in body_chunks(n, args.html_kib)) // 1024
+        cells = []
+        for mode in modes:
+            r = measure(mode, n, args.html_kib)
+            cells.append(f"{r['peak_kib']:,} ({r['status']})")
+        print(f"{n:>10,}{body_kib:>10,}" + "".join(f"{c:>28}" for c in cells))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,383 @@
+"""Load benchmark for the full app against local Resend and JWKS stubs.
+
+Builds the real app with `main.create_app()` and drives each endpoint at a
+fixed concurrency, either straight over ASGI in-process or over HTTP against
+uvicorn running in a background thread. Email goes to `tools.resend_stub` or
+`tools.smtp_stub` (configurable latency and error rate), or to the in-memory
+transport, and bearer tokens are signed by `tools.jwks_stub`, so no network access or credentials are needed.
+Rate limits are lifted and every request body is unique, so neither the
+limiter nor submission deduplication short-circuits the work being measured.
+
+Reports requests/s, p50/p95/p99 latency and, in-process, the average peak and
+retained traced memory per request. Results are written as JSON, and a previous
+result file can be passed as a baseline to print the change per endpoint.
+
+Usage:
+
+    python -m tools.bench_load [--mode asgi|uvicorn] [--requests 2000] [--concurrency 32]
+        [--endpoints contact,robots.txt] [--transport resend|smtp|memory]
+        [--provider-latency 0.05] [--provider-error-rate 0.01]
+        [--output bench.json] [--baseline previous.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable
+
+from tools.jwks_stub import JWKSStub
+from tools.resend_stub import ResendStub
+from tools.smtp_stub import SMTPStub
+
+# name -> (method, path, body for request i or None)
+ENDPOINTS: dict[str, tuple[str, str, Callable[[int], dict[str, Any]] | None]] = {
+    "contact": ("POST", "/routes/contact", lambda i: {
+        "name": "Jane Doe", "email": "jane@example.com",
+        "subject": "Question about my subscription", "message": f"Hello, request #{i}",
+    }),
+    "welcome": ("POST", "/routes/welcome", lambda i: {
+        "name": "Jane Doe", "email": f"jane+{i}@example.com",
+    }),
+    "trial-request": ("POST", "/routes/trial-request", lambda i: {
+        "name": "Jane Doe", "email": f"jane+{i}@example.com", "phone": "+1 555 0100",
+    }),
+    "send": ("POST", "/routes/send", lambda i: {
+        "to": [{"email": f"jane+{i}@example.com", "name": "Jane"}],
+        "subject": "Our spring lineup", "html_content": "<p>Our spring lineup is live!</p>",
+    }),
+    "sitemap.xml": ("GET", "/routes/sitemap.xml", None),
+    "robots.txt": ("GET", "/routes/robots.txt", None),
+}
+
+# Statuses the handlers return for a successful request
+OK_STATUSES = {200, 202}
+
+
+def configure_env(
+    transport: str, resend: ResendStub, smtp: SMTPStub, jwks: JWKSStub | None, data_dir: str
+) -> None:
+    """Point the app at the stubs, must run before `main` is imported."""
+    os.environ.update({
+        "EMAIL_TRANSPORT": transport,
+        "RESEND_BASE_URL": resend.url,
+        "RESEND_API_KEY": "re_bench",
+        "SMTP_HOST": smtp.host,
+        "SMTP_PORT": str(smtp.port),
+        "SMTP_STARTTLS": "0",
+        "EMAIL_OUTBOX_PATH": os.path.join(data_dir, "email_outbox.db"),
+        "ROUTE_MANIFEST": os.path.join(data_dir, "route_manifest.json"),
+        "RATE_LIMITS": json.dumps({path: "" for _, path, _ in ENDPOINTS.values()}),
+        "RATE_LIMIT_RECIPIENT": "1000000000/second",
+        "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+    })
+    if jwks is not None:
+        os.environ["AUTH_JWKS_URL"] = jwks.url
+        os.environ["AUTH_AUDIENCE"] = jwks.audience
+    else:
+        os.environ.pop("AUTH_JWKS_URL", None)
+        os.environ.pop("AUTH_AUDIENCE", None)
+
+
+class AsgiDriver:
+    """Calls the ASGI app directly, without sockets or HTTP parsing."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def request(self, method: str, path: str, headers: list[tuple[bytes, bytes]], body: bytes) -> int:
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+            "method": method, "scheme": "http", "path": path, "raw_path": path.encode(),
+            "query_string": b"", "root_path": "", "headers": headers,
+            "client": ("127.0.0.1", 50000), "server": ("bench", 80), "state": {},
+        }
+        sent = False
+        status = 0
+
+        async def receive():
+            nonlocal sent
+            if sent:
+                await asyncio.Event().wait()
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        async def send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+
+        await self.app(scope, receive, send)
+        return status
+
+
+class HttpDriver:
+    """Minimal HTTP/1.1 keep-alive client, one connection per concurrent worker."""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._idle: list[tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+
+    async def request(self, method: str, path: str, headers: list[tuple[bytes, bytes]], body: bytes) -> int:
+        if self._idle:
+            reader, writer = self._idle.pop()
+        else:
+            reader, writer = await asyncio.open_connection(self.host, self.port)
+        head = [f"{method} {path} HTTP/1.1".encode(), f"host: {self.host}".encode(),
+                f"content-length: {len(body)}".encode()]
+        head += [name + b": " + value for name, value in headers if name != b"host"]
+        writer.write(b"\r\n".join(head) + b"\r\n\r\n" + body)
+
+        status = int((await reader.readline()).split()[1])
+        length, chunked, keep_alive = 0, False, True
+        while (line := await reader.readline()) not in (b"\r\n", b""):
+            name, _, value = line.decode("latin-1").partition(":")
+            name, value = name.strip().lower(), value.strip().lower()
+            if name == "content-length":
+                length = int(value)
+            elif name == "transfer-encoding":
+                chunked = "chunked" in value
+            elif name == "connection":
+                keep_alive = value != "close"
+        if chunked:
+            while size := int((await reader.readline()).strip(), 16):
+                await reader.readexactly(size + 2)
+            await reader.readline()
+        elif length:
+            await reader.readexactly(length)
+
+        if keep_alive:
+            self._idle.append((reader, writer))
+        else:
+            writer.close()
+        return status
+
+    async def close(self) -> None:
+        for _, writer in self._idle:
+            writer.close()
+        self._idle.clear()
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+async def run_endpoint(
+    driver, name: str, requests: int, concurrency: int, token: str | None, counter: list[int]
+) -> dict[str, Any]:
+    method, path, make_body = ENDPOINTS[name]
+    latencies: list[float] = []
+    errors = 0
+    remaining = requests
+
+    def next_request() -> tuple[list[tuple[bytes, bytes]], bytes]:
+        counter[0] += 1
+        headers = [(b"host", b"bench")]
+        if token:
+            headers.append((b"authorization", f"Bearer {token}".encode()))
+        if make_body is None:
+            return headers, b""
+        headers.append((b"content-type", b"application/json"))
+        return headers, json.dumps(make_body(counter[0])).encode()
+
+    async def worker() -> None:
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            headers, body = next_request()
+            start = time.perf_counter()
+            status = await driver.request(method, path, headers, body)
+            latencies.append(time.perf_counter() - start)
+            if status not in OK_STATUSES:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "rps": requests / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+async def measure_allocations(driver, name: str, samples: int, token: str | None, counter: list[int]) -> dict[str, float]:
+    """Average peak and retained traced memory of one request at a time."""
+    method, path, make_body = ENDPOINTS[name]
+    peaks, retained = [], []
+    tracemalloc.start()
+    try:
+        for _ in range(samples):
+            counter[0] += 1
+            headers = [(b"host", b"bench")]
+            if token:
+                headers.append((b"authorization", f"Bearer {token}".encode()))
+            body = b""
+            if make_body is not None:
+                headers.append((b"content-type", b"application/json"))
+                body = json.dumps(make_body(counter[0])).encode()
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            await driver.request(method, path, headers, body)
+            current, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+            retained.append(current - before)
+    finally:
+        tracemalloc.stop()
+    return {
+        "alloc_peak_kib": statistics.fmean(peaks) / 1024,
+        "alloc_retained_bytes": statistics.fmean(retained),
+    }
+
+
+def start_uvicorn(app) -> tuple[Any, threading.Thread, int]:
+    import uvicorn
+
+    config = uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning", lifespan="on")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, name="uvicorn", daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    return server, thread, port
+
+
+async def run_suite(args, app, token: str | None) -> dict[str, Any]:
+    counter = [0]
+    results: dict[str, Any] = {}
+    names = args.endpoints.split(",")
+
+    if args.mode == "asgi":
+        driver = AsgiDriver(app)
+        async with app.router.lifespan_context(app):
+            for name in names:
+                await run_endpoint(driver, name, args.warmup, args.concurrency, token, counter)
+                results[name] = await run_endpoint(
+                    driver, name, args.requests, args.concurrency, token, counter
+                )
+                if args.alloc_samples:
+                    results[name].update(
+                        await measure_allocations(driver, name, args.alloc_samples, token, counter)
+                    )
+                # Let the email dispatch workers catch up before the next endpoint
+                await asyncio.sleep(0)
+        return results
+
+    server, thread, port = await asyncio.to_thread(start_uvicorn, app)
+    driver = HttpDriver("127.0.0.1", port)
+    try:
+        for name in names:
+            await run_endpoint(driver, name, args.warmup, args.concurrency, token, counter)
+            results[name] = await run_endpoint(
+                driver, name, args.requests, args.concurrency, token, counter
+            )
+    finally:
+        await driver.close()
+        server.should_exit = True
+        await asyncio.to_thread(thread.join, 10)
+    return results
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(results: dict[str, Any], baseline: dict[str, Any] | None) -> None:
+    print(f"{'endpoint':<16}{'req/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'errors':>8}{'peak KiB':>10}{'vs base':>9}")
+    for name, r in results.items():
+        change = ""
+        if baseline and name in baseline:
+            change = f"{(r['rps'] / baseline[name]['rps'] - 1) * 100:+.1f}%"
+        peak = f"{r['alloc_peak_kib']:.1f}" if "alloc_peak_kib" in r else "-"
+        print(f"{name:<16}{r['rps']:>10,.0f}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}"
+              f"{r['p99_ms']:>9.2f}{r['errors']:>8}{peak:>10}{change:>9}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark app endpoints against local stubs")
+    parser.add_argument("--mode", choices=("asgi", "uvicorn"), default="asgi")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS))
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--alloc-samples", type=int, default=200,
+                        help="requests traced for allocations in asgi mode, 0 to skip")
+    parser.add_argument("--transport", choices=("resend", "smtp", "memory"), default="resend")
+    parser.add_argument("--provider-latency", type=float, default=0.0)
+    parser.add_argument("--provider-error-rate", type=float, default=0.0)
+    parser.add_argument("--no-auth", action="store_true", help="run without the auth middleware")
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results of a previous run to compare against")
+    args = parser.parse_args()
+
+    unknown = set(args.endpoints.split(",")) - ENDPOINTS.keys()
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+    if args.mode != "asgi":
+        args.alloc_samples = 0
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+    with tempfile.TemporaryDirectory() as data_dir, \
+            ResendStub(latency=args.provider_latency, error_rate=args.provider_error_rate) as resend, \
+            SMTPStub(latency=args.provider_latency, error_rate=args.provider_error_rate) as smtp, \
+            JWKSStub() as jwks:
+        configure_env(args.transport, resend, smtp, None if args.no_auth else jwks, data_dir)
+        import main as app_main
+
+        app = app_main.create_app()
+        token = None if args.no_auth else jwks.token(sub="bench-user", ttl=3600)
+        results = asyncio.run(run_suite(args, app, token))
+        delivered = len(resend.sent) + len(smtp.messages)
+        connections = smtp.connections
+
+    print_report(results, baseline)
+    if args.transport != "memory":
+        print(f"emails delivered to the {args.transport} stub: {delivered}")
+    if args.transport == "smtp":
+        print(f"SMTP connections opened: {connections}")
+
+    if args.output:
+        report = {
+            "meta": {
+                "commit": git_commit(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "python": sys.version.split()[0],
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "args": vars(args),
+            },
+            "results": results,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""Local JWKS endpoint with a token minting helper.
+
+Serves a JSON Web Key Set for freshly generated RSA keys and signs RS256
+tokens with them, so the auth path can be exercised without an identity
+provider. Every fetch is counted and keys can be rotated at runtime.
+
+Usage:
+
+    # In-process, e.g. from a script or benchmark
+    from tools.jwks_stub import JWKSStub
+
+    with JWKSStub(latency=0.05) as stub:
+        os.environ["AUTH_JWKS_URL"] = stub.url
+        os.environ["AUTH_AUDIENCE"] = stub.audience
+        token = stub.token(sub="user-1")
+        ...
+        stub.rotate()
+        print(stub.fetches)
+
+    # Standalone, prints a token valid for an hour
+    python -m tools.jwks_stub --port 8026 --latency 0.05
+"""
+
+import argparse
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jwt.algorithms import RSAAlgorithm
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "_StubServer"
+
+    def do_GET(self):
+        stub = self.server.stub
+        if stub.latency:
+            time.sleep(stub.latency)
+        if self.path != JWKSStub.PATH:
+            return self._reply(404, {"error": "Not found"})
+        return self._reply(200, stub.jwks())
+
+    def _reply(self, status: int, payload: Any) -> None:
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    stub: "JWKSStub"
+
+
+class JWKSStub:
+    PATH = "/.well-known/jwks.json"
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        audience: str = "loufranktv",
+    ):
+        self.latency = latency
+        self.audience = audience
+        self.fetches = 0
+        self._lock = threading.Lock()
+        self._keys: list[tuple[str, rsa.RSAPrivateKey]] = []
+        self.rotate()
+        self._server = _StubServer((host, port), _Handler)
+        self._server.stub = self
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}{self.PATH}"
+
+    def rotate(self, keep: int = 1) -> str:
+        """Add a new signing key, keeping the `keep` most recent old ones, and return its kid."""
+        kid = uuid.uuid4().hex
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        with self._lock:
+            self._keys = [*self._keys[-keep:], (kid, key)] if keep else [(kid, key)]
+        return kid
+
+    def jwks(self) -> dict[str, Any]:
+        with self._lock:
+            self.fetches += 1
+            keys = list(self._keys)
+        return {
+            "keys": [
+                {**RSAAlgorithm.to_jwk(key.public_key(), as_dict=True), "kid": kid, "use": "sig", "alg": "RS256"}
+                for kid, key in keys
+            ]
+        }
+
+    def token(self, sub: str = "user", ttl: float = 3600, kid: str | None = None, **claims: Any) -> str:
+        """Sign a token with the newest key, or a token for `kid` even if it is unknown."""
+        with self._lock:
+            current_kid, key = self._keys[-1]
+        now = int(time.time())
+        payload = {"sub": sub, "aud": self.audience, "iat": now, "exp": now + int(ttl), **claims}
+        return jwt.encode(payload, key, algorithm="RS256", headers={"kid": kid or current_kid})
+
+    def start(self) -> "JWKSStub":
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="jwks-stub", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "JWKSStub":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8026)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--audience", default="loufranktv")
+    args = parser.parse_args()
+
+    stub = JWKSStub(args.host, args.port, args.latency, args.audience)
+    print(f"JWKS stub listening on {stub.url}")
+    print(f"Token: {stub.token()}")
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
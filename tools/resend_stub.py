@@ -0,0 +1,133 @@
+"""Local stand-in for the Resend HTTP API.
+
+Accepts the same requests as https://api.resend.com for the endpoints the
+emailer uses and records everything it receives, so the app can be exercised
+without network access or a real API key.
+
+Usage:
+
+    # In-process, e.g. from a script or benchmark
+    from tools.resend_stub import ResendStub
+
+    with ResendStub(latency=0.05) as stub:
+        os.environ["RESEND_BASE_URL"] = stub.url
+        ...
+        print(len(stub.sent))
+
+    # Standalone
+    python -m tools.resend_stub --port 8025 --latency 0.05 --error-rate 0.01
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "_StubServer"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"null")
+        stub = self.server.stub
+
+        if stub.latency:
+            time.sleep(stub.latency)
+
+        if not self.headers.get("Authorization", "").startswith("Bearer "):
+            return self._reply(401, {"statusCode": 401, "message": "Missing API key"})
+        if stub.error_rate and random.random() < stub.error_rate:
+            return self._reply(500, {"statusCode": 500, "message": "Injected error"})
+
+        if self.path == "/emails":
+            stub.record([body])
+            return self._reply(200, {"id": str(uuid.uuid4())})
+        if self.path == "/emails/batch":
+            stub.record(body)
+            return self._reply(200, {"data": [{"id": str(uuid.uuid4())} for _ in body]})
+        return self._reply(404, {"statusCode": 404, "message": "Not found"})
+
+    def _reply(self, status: int, payload: Any) -> None:
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    stub: "ResendStub"
+
+
+class ResendStub:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+    ):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.sent: list[dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._server = _StubServer((host, port), _Handler)
+        self._server.stub = self
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def record(self, emails: list[dict[str, Any]]) -> None:
+        with self._lock:
+            self.sent.extend(emails)
+
+    def start(self) -> "ResendStub":
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="resend-stub", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "ResendStub":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8025)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    stub = ResendStub(args.host, args.port, args.latency, args.error_rate)
+    print(f"Resend stub listening on {stub.url}")
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""Local stand-in SMTP server for the SMTP email transport.
+
+Speaks enough ESMTP for `smtplib` (EHLO, AUTH PLAIN/LOGIN, MAIL, RCPT, DATA,
+RSET, NOOP, QUIT), without STARTTLS, and records every message it accepts, the
+number of connections and logins, so connection reuse can be checked. Latency
+is added per DATA command and a fraction of messages can be rejected with a
+transient 451, like a relay under load.
+
+Usage:
+
+    # In-process, e.g. from a script or benchmark
+    from tools.smtp_stub import SMTPStub
+
+    with SMTPStub(latency=0.01) as stub:
+        os.environ.update(SMTP_HOST=stub.host, SMTP_PORT=str(stub.port), SMTP_STARTTLS="0")
+        ...
+        print(len(stub.messages), stub.connections)
+
+    # Standalone
+    python -m tools.smtp_stub --port 8026 --latency 0.01 --error-rate 0.01
+"""
+
+import argparse
+import base64
+import random
+import socketserver
+import threading
+import time
+from typing import Any
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    server: "_StubServer"
+
+    def reply(self, line: str) -> None:
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def read_line(self) -> str:
+        return self.rfile.readline().decode("utf-8", errors="replace").rstrip("\r\n")
+
+    def handle(self) -> None:
+        stub = self.server.stub
+        stub.count("connections")
+        authenticated = stub.username is None
+        mail_from: str | None = None
+        rcpt_to: list[str] = []
+        self.reply("220 smtp-stub ESMTP ready")
+
+        while line := self.rfile.readline():
+            command, _, arg = line.decode("utf-8", errors="replace").rstrip("\r\n").partition(" ")
+            command = command.upper()
+            if command == "EHLO":
+                self.reply("250-smtp-stub\r\n250-AUTH PLAIN LOGIN\r\n250-8BITMIME\r\n250 SIZE 52428800")
+            elif command == "HELO":
+                self.reply("250 smtp-stub")
+            elif command == "AUTH":
+                authenticated = self.authenticate(arg)
+                self.reply("235 2.7.0 Authentication successful" if authenticated
+                           else "535 5.7.8 Authentication credentials invalid")
+            elif command in ("NOOP", "RSET"):
+                if command == "RSET":
+                    mail_from, rcpt_to = None, []
+                self.reply("250 OK")
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            elif not authenticated:
+                self.reply("530 5.7.0 Authentication required")
+            elif command == "MAIL":
+                mail_from, rcpt_to = arg.partition(":")[2].split(" ")[0].strip("<>"), []
+                self.reply("250 OK")
+            elif command == "RCPT":
+                rcpt_to.append(arg.partition(":")[2].split(" ")[0].strip("<>"))
+                self.reply("250 OK")
+            elif command == "DATA":
+                if mail_from is None or not rcpt_to:
+                    self.reply("503 5.5.1 Bad sequence of commands")
+                    continue
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = self.read_data()
+                if stub.latency:
+                    time.sleep(stub.latency)
+                if stub.error_rate and random.random() < stub.error_rate:
+                    self.reply("451 4.3.0 Injected error")
+                else:
+                    stub.record({"mail_from": mail_from, "rcpt_to": rcpt_to, "data": data})
+                    self.reply("250 OK queued")
+                mail_from, rcpt_to = None, []
+            else:
+                self.reply("502 5.5.2 Command not recognized")
+
+    def authenticate(self, arg: str) -> bool:
+        stub = self.server.stub
+        mechanism, _, initial = arg.partition(" ")
+        if mechanism.upper() == "PLAIN":
+            if not initial:
+                self.reply("334 ")
+                initial = self.read_line()
+            _, username, password = base64.b64decode(initial).decode().split("\0")
+        elif mechanism.upper() == "LOGIN":
+            if initial:
+                username = base64.b64decode(initial).decode()
+            else:
+                self.reply("334 " + base64.b64encode(b"Username:").decode())
+                username = base64.b64decode(self.read_line()).decode()
+            self.reply("334 " + base64.b64encode(b"Password:").decode())
+            password = base64.b64decode(self.read_line()).decode()
+        else:
+            return False
+        stub.count("logins")
+        return stub.username is None or (username, password) == (stub.username, stub.password)
+
+    def read_data(self) -> bytes:
+        lines = []
+        while (line := self.rfile.readline()) not in (b".\r\n", b".\n", b""):
+            lines.append(line[1:] if line.startswith(b".") else line)
+        return b"".join(lines)
+
+
+class _StubServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    stub: "SMTPStub"
+
+
+class SMTPStub:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        username: str | None = None,
+        password: str | None = None,
+    ):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.username = username
+        self.password = password
+        self.messages: list[dict[str, Any]] = []
+        self.connections = 0
+        self.logins = 0
+        self._lock = threading.Lock()
+        self._server = _StubServer((host, port), _Handler)
+        self._server.stub = self
+        self._thread: threading.Thread | None = None
+
+    @property
+    def host(self) -> str:
+        return self._server.server_address[0]
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def record(self, message: dict[str, Any]) -> None:
+        with self._lock:
+            self.messages.append(message)
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def start(self) -> "SMTPStub":
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="smtp-stub", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "SMTPStub":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8026)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--username")
+    parser.add_argument("--password")
+    args = parser.parse_args()
+
+    stub = SMTPStub(args.host, args.port, args.latency, args.error_rate, args.username, args.password)
+    print(f"SMTP stub listening on {stub.host}:{stub.port}")
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Cold-start report: time to import `main` in eager and fast-startup mode.
+
+Each run imports `main` and builds the app in a fresh interpreter with
+`-X importtime` and reports the median wall time per mode, plus the modules
+with the largest cumulative import time from the last eager run, so it is clear
+which imports dominate a cold start. The fast mode needs the route manifest, which the
+first eager run writes.
+
+Usage:
+
+    python -m tools.startup_report [--runs 5] [--top 15]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+def import_main(mode: str) -> tuple[float, str]:
+    env = {**os.environ, "STARTUP_MODE": mode, "LOG_LEVEL": "WARNING", "PYTHONPATH": "."}
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main; main.app"],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    return time.perf_counter() - start, result.stderr
+
+
+def parse_importtime(output: str) -> list[tuple[str, int, int]]:
+    """(module, self us, cumulative us) from `-X importtime` output."""
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line.removeprefix("import time:").split("|")
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    return modules
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Report cold start import times")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    timings: dict[str, list[float]] = {"eager": [], "fast": []}
+    report = ""
+    for _ in range(args.runs):
+        for mode in timings:
+            elapsed, output = import_main(mode)
+            timings[mode].append(elapsed)
+            if mode == "eager":
+                report = output
+
+    print(f"{'mode':<8}{'median s':>10}{'min s':>10}")
+    for mode, values in timings.items():
+        print(f"{mode:<8}{statistics.median(values):>10.3f}{min(values):>10.3f}")
+
+    modules = parse_importtime(report)
+    print("\nslowest imports, eager mode (cumulative, last run)")
+    print(f"{'module':<48}{'self ms':>10}{'total ms':>10}")
+    top_level = [m for m in modules if "." not in m[0] or m[0].startswith(("app.", "databutton_app."))]
+    for name, self_us, cumulative_us in sorted(top_level, key=lambda m: -m[2])[: args.top]:
+        print(f"{name:<48}{self_us / 1000:>10.1f}{cumulative_us / 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()